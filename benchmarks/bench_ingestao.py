@@ -0,0 +1,354 @@
+"""
+Benchmark HTTP da ingestão (/uwb/data e /uwb/data-rssi) com tráfego sintético dos ESP32
+
+Para cada banco e modo, percorre os cenários endpoint x tamanho de lote (1 = objeto único) e mede
+requisições/s, leituras/s e latência (p50/p90/p99) de cada requisição. Cada cenário começa um
+relatório novo (kx/ky do tráfego) para que as leituras passem pela trilateração e pela gravação.
+
+Modos:
+  cliente   app.test_client() no próprio processo (sem rede; isola o custo da aplicação)
+  gunicorn  gunicorn.conf.py (2 workers gthread) em 127.0.0.1, com --concorrencia conexões simultâneas
+
+Bancos:
+  sqlite    arquivo temporário novo a cada execução
+  postgres  BENCH_POSTGRES_URL (padrão postgresql://postgres@localhost:5432/uwb_bench); ignorado, com o
+            motivo no relatório, se não conectar. Use um banco dedicado: o benchmark grava relatórios nele.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_ingestao
+    python -m benchmarks.bench_ingestao --modos cliente --lotes 1,20,100 --leituras 5000
+    python -m benchmarks.bench_ingestao --saida atual.json --comparar base.json
+    python -m benchmarks.bench_ingestao --historico benchmarks/resultados/ingestao.jsonl
+
+O relatório (JSON) traz commit, máquina, parâmetros e um resultado por cenário, identificado por
+"banco/modo/endpoint/lote"; --comparar mostra a variação de leituras/s e p99 em relação a outro relatório.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import argparse
+import platform
+import tempfile
+import logging
+import socket
+import http.client
+import threading
+import json
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from benchmarks.trafego import gerar_leituras, payloads  # noqa: E402
+
+POSTGRES_PADRAO = 'postgresql://postgres@localhost:5432/uwb_bench'
+ENDPOINTS = {'data': '/api/uwb/data', 'data-rssi': '/api/uwb/data-rssi'}
+
+
+def _lista(valor, tipo=str):
+    return [tipo(parte) for parte in valor.split(',') if parte.strip()]
+
+
+def _argumentos(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bancos', type=_lista, default=['sqlite', 'postgres'], help='sqlite,postgres')
+    parser.add_argument('--modos', type=_lista, default=['cliente', 'gunicorn'], help='cliente,gunicorn')
+    parser.add_argument('--endpoints', type=_lista, default=['data', 'data-rssi'], help='data,data-rssi')
+    parser.add_argument('--lotes', type=lambda v: _lista(v, int), default=[1, 50], help='leituras por requisição')
+    parser.add_argument('--leituras', type=int, default=2000, help='leituras medidas por cenário')
+    parser.add_argument('--aquecimento', type=int, default=20, help='requisições descartadas no início de cada cenário')
+    parser.add_argument('--concorrencia', type=int, default=4, help='conexões simultâneas no modo gunicorn')
+    parser.add_argument('--tags', type=int, default=4)
+    parser.add_argument('--kx', type=float, default=300)
+    parser.add_argument('--ky', type=float, default=300)
+    parser.add_argument('--ruido-cm', type=float, default=8.0)
+    parser.add_argument('--perda', type=float, default=0.1, help='probabilidade de uma âncora não responder')
+    parser.add_argument('--semente', type=int, default=1)
+    parser.add_argument('--perfil', default='minimal', help='perfil de resposta de /uwb/data (minimal|standard|debug)')
+    parser.add_argument('--assincrono', action='store_true', help='/uwb/data com ?assincrono=1 (fila de ingestão)')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    parser.add_argument('--historico', help='acrescenta o relatório como uma linha JSON neste arquivo')
+    parser.add_argument('--comparar', help='relatório JSON anterior para comparação')
+    # Execução do modo cliente num processo filho (src.main lê DATABASE_URL na importação)
+    parser.add_argument('--interno-url', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def percentil(valores, p):
+    """Percentil por interpolação linear (valores já ordenados)"""
+    if not valores:
+        return None
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicao - inferior)
+
+
+def _caminho(endpoint, args):
+    parametros = [f'perfil={args.perfil}']
+    if endpoint == 'data':
+        parametros.append(f"assincrono={'1' if args.assincrono else '0'}")
+    return f"{ENDPOINTS[endpoint]}?{'&'.join(parametros)}"
+
+
+def _corpos(endpoint, lote, n_leituras, args):
+    """Corpos já serializados, para que a geração do tráfego não entre na medição"""
+    leituras = gerar_leituras(n_leituras, args.tags, args.kx, args.ky, ruido_cm=args.ruido_cm,
+                              perda=args.perda, semente=args.semente)
+    return [json.dumps(corpo).encode() for corpo in payloads(leituras, endpoint, lote)]
+
+
+def executar_cenario(enviar, endpoint, lote, args, concorrencia=1):
+    """
+    Mede um cenário com `enviar(metodo, caminho, corpo) -> status`.
+    Aquecimento e medição usam trechos diferentes da mesma trajetória.
+    """
+    enviar('POST', '/api/relatorio/finalizar', b'{}')
+    status = enviar('POST', '/api/relatorio/iniciar', json.dumps({'kx': args.kx, 'ky': args.ky}).encode())
+    if status != 201:
+        raise RuntimeError(f'Não foi possível iniciar o relatório (HTTP {status})')
+
+    caminho = _caminho(endpoint, args)
+    corpos = _corpos(endpoint, lote, args.leituras + args.aquecimento * lote, args)
+    aquecimento, medidos = corpos[:args.aquecimento], corpos[args.aquecimento:]
+    for corpo in aquecimento:
+        enviar('POST', caminho, corpo)
+
+    def medir(corpo):
+        inicio = time.perf_counter()
+        codigo = enviar('POST', caminho, corpo)
+        return time.perf_counter() - inicio, codigo
+
+    inicio = time.perf_counter()
+    if concorrencia > 1:
+        with ThreadPoolExecutor(concorrencia) as executor:
+            medicoes = list(executor.map(medir, medidos))
+    else:
+        medicoes = [medir(corpo) for corpo in medidos]
+    duracao = time.perf_counter() - inicio
+    enviar('POST', '/api/relatorio/finalizar', b'{}')
+
+    latencias = sorted(latencia * 1000 for latencia, _ in medicoes)
+    codigos = {}
+    for _, codigo in medicoes:
+        codigos[str(codigo)] = codigos.get(str(codigo), 0) + 1
+    return {
+        'endpoint': endpoint,
+        'lote': lote,
+        'concorrencia': concorrencia,
+        'requisicoes': len(medidos),
+        'leituras': args.leituras,
+        'segundos': round(duracao, 4),
+        'requisicoes_por_s': round(len(medidos) / duracao, 1),
+        'leituras_por_s': round(args.leituras / duracao, 1),
+        'latencia_ms': {
+            'media': round(sum(latencias) / len(latencias), 3),
+            'p50': round(percentil(latencias, 50), 3),
+            'p90': round(percentil(latencias, 90), 3),
+            'p99': round(percentil(latencias, 99), 3),
+            'max': round(latencias[-1], 3),
+        },
+        'status': codigos,
+        'erros': sum(n for codigo, n in codigos.items() if int(codigo) >= 400),
+    }
+
+
+def _cenarios(args):
+    return [(endpoint, lote) for endpoint in args.endpoints for lote in args.lotes]
+
+
+def _executar_cliente_interno(args):
+    """Processo filho do modo cliente: importa a aplicação com o banco pedido e imprime os resultados"""
+    os.environ['DATABASE_URL'] = args.interno_url
+    logging.disable(logging.WARNING)
+    from src.main import app
+
+    cliente = app.test_client()
+
+    def enviar(metodo, caminho, corpo):
+        return cliente.open(caminho, method=metodo, data=corpo, content_type='application/json').status_code
+
+    resultados = [executar_cenario(enviar, endpoint, lote, args) for endpoint, lote in _cenarios(args)]
+    print(json.dumps(resultados))
+
+
+def _modo_cliente(url, args):
+    comando = [sys.executable, '-m', 'benchmarks.bench_ingestao', *sys.argv[1:], '--interno-url', url]
+    processo = subprocess.run(comando, cwd=RAIZ, capture_output=True, text=True)
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'falhou')
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+def _porta_livre():
+    with socket.socket() as conexao:
+        conexao.bind(('127.0.0.1', 0))
+        return conexao.getsockname()[1]
+
+
+class ServidorGunicorn:
+    """gunicorn com gunicorn.conf.py num banco e porta próprios; log em arquivo temporário"""
+
+    def __init__(self, url):
+        self.url = url
+        self.porta = _porta_livre()
+        self.diretorio = tempfile.mkdtemp(prefix='uwb-bench-gunicorn-')
+        self.processo = None
+        self._local = threading.local()
+
+    def __enter__(self):
+        ambiente = dict(os.environ, DATABASE_URL=self.url, PORT=str(self.porta),
+                        PROMETHEUS_MULTIPROC_DIR=os.path.join(self.diretorio, 'metricas'))
+        self._log = open(os.path.join(self.diretorio, 'gunicorn.log'), 'w')
+        self.processo = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{self.porta}',
+             '--access-logfile', '/dev/null', '--log-level', 'warning', 'src.main:app'],
+            cwd=RAIZ, env=ambiente, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if self.processo.poll() is not None:
+                raise RuntimeError(f'gunicorn terminou (código {self.processo.returncode}); log em {self._log.name}')
+            try:
+                if self.enviar('GET', '/api/uwb/health', None) == 200:
+                    return self
+            except OSError:
+                self._local.conexao = None
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'gunicorn não respondeu em 30 s; log em {self._log.name}')
+
+    def __exit__(self, *excecao):
+        if self.processo and self.processo.poll() is None:
+            self.processo.terminate()
+            try:
+                self.processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+        self._log.close()
+
+    def enviar(self, metodo, caminho, corpo):
+        """Uma conexão keep-alive por thread"""
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = self._local.conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=60)
+        try:
+            conexao.request(metodo, caminho, body=corpo, headers={'Content-Type': 'application/json'})
+            resposta = conexao.getresponse()
+            resposta.read()
+        except (http.client.HTTPException, OSError):
+            conexao.close()
+            self._local.conexao = None
+            raise
+        if resposta.will_close:
+            conexao.close()
+            self._local.conexao = None
+        return resposta.status
+
+
+def _modo_gunicorn(url, args):
+    with ServidorGunicorn(url) as servidor:
+        return [executar_cenario(servidor.enviar, endpoint, lote, args, args.concorrencia)
+                for endpoint, lote in _cenarios(args)]
+
+
+def _url_banco(banco):
+    """URL do banco, ou (None, motivo) quando não está disponível"""
+    if banco == 'sqlite':
+        return 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='uwb-bench-'), 'bench.db'), None
+    if banco == 'postgres':
+        url = os.environ.get('BENCH_POSTGRES_URL', POSTGRES_PADRAO)
+        try:
+            from sqlalchemy import create_engine
+            engine = create_engine(url, connect_args={'connect_timeout': 3})
+            with engine.connect():
+                pass
+            engine.dispose()
+            return url, None
+        except Exception as e:
+            return None, f'PostgreSQL indisponível em {url.rsplit("@", 1)[-1]}: {str(e).splitlines()[0]}'
+    return None, f'banco desconhecido: {banco}'
+
+
+def commit_atual():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        alterado = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RAIZ,
+                                  capture_output=True, text=True).stdout.strip()
+        return commit + ('-alterado' if alterado else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, base):
+    """Variação (%) de leituras/s e da latência p99 por cenário presente nos dois relatórios"""
+    anteriores = {r['cenario']: r for r in base.get('resultados', []) if 'leituras_por_s' in r}
+    comparacao = {}
+    for resultado in atual['resultados']:
+        anterior = anteriores.get(resultado['cenario'])
+        if anterior is None or 'leituras_por_s' not in resultado:
+            continue
+        comparacao[resultado['cenario']] = {
+            'leituras_por_s': round(100 * (resultado['leituras_por_s'] / anterior['leituras_por_s'] - 1), 1),
+            'p99': round(100 * (resultado['latencia_ms']['p99'] / anterior['latencia_ms']['p99'] - 1), 1),
+        }
+    return {'base': base.get('commit'), 'base_data': base.get('data'), 'variacao_percentual': comparacao}
+
+
+def main():
+    args = _argumentos()
+    if args.interno_url:
+        _executar_cliente_interno(args)
+        return
+
+    relatorio = {
+        'benchmark': 'ingestao_http',
+        'data': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit_atual(),
+        'maquina': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'parametros': {
+            'leituras': args.leituras, 'aquecimento': args.aquecimento, 'concorrencia': args.concorrencia,
+            'tags': args.tags, 'kx': args.kx, 'ky': args.ky, 'ruido_cm': args.ruido_cm, 'perda': args.perda,
+            'semente': args.semente, 'perfil': args.perfil, 'assincrono': args.assincrono
+        },
+        'resultados': [],
+    }
+    executores = {'cliente': _modo_cliente, 'gunicorn': _modo_gunicorn}
+    for banco in args.bancos:
+        url, motivo = _url_banco(banco)
+        for modo in args.modos:
+            if modo not in executores:
+                relatorio['resultados'].append({'cenario': f'{banco}/{modo}', 'ignorado': f'modo desconhecido: {modo}'})
+                continue
+            if url is None:
+                relatorio['resultados'].append({'cenario': f'{banco}/{modo}', 'ignorado': motivo})
+                continue
+            print(f'{banco}/{modo}...', file=sys.stderr)
+            try:
+                resultados = executores[modo](url, args)
+            except Exception as e:
+                relatorio['resultados'].append({'cenario': f'{banco}/{modo}', 'erro': str(e)})
+                continue
+            for resultado in resultados:
+                relatorio['resultados'].append({
+                    'cenario': f"{banco}/{modo}/{resultado['endpoint']}/{resultado['lote']}",
+                    'banco': banco, 'modo': modo, **resultado
+                })
+
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            relatorio['comparacao'] = comparar(relatorio, json.load(arquivo))
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            json.dump(relatorio, arquivo, indent=2)
+    if args.historico:
+        os.makedirs(os.path.dirname(os.path.abspath(args.historico)), exist_ok=True)
+        with open(args.historico, 'a') as arquivo:
+            arquivo.write(json.dumps(relatorio) + '\n')
+    print(json.dumps(relatorio, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark da gravação de /uwb/data-rssi: caminho antigo (add + flush por item) x gravação em lote
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_rssi --itens 200 --rodadas 20
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.bench_rssi
+
+Sem BENCH_DATABASE_URL usa um SQLite temporário. Imprime um JSON com linhas/s de cada caminho.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _gerar_linhas(n):
+    linhas = []
+    for i in range(n):
+        linha = {'tag_number': str(3 + i % 10), 'criado_em': None}
+        for a in range(8):
+            linha[f'da{a}'] = round(random.uniform(10, 500), 1)
+            linha[f'rssi{a}'] = round(random.uniform(-95, -40), 1)
+        linhas.append(linha)
+    return linhas
+
+
+def _caminho_antigo(db, UWBDataRSSI, linhas):
+    """Reprodução do caminho anterior: um INSERT (add + flush) por item para obter o id"""
+    ids = []
+    for linha in linhas:
+        rec = UWBDataRSSI(**linha)
+        db.session.add(rec)
+        db.session.flush()
+        ids.append(rec.id)
+    db.session.commit()
+    return ids
+
+
+def _caminho_lote(db, inserir, linhas):
+    ids = inserir(linhas)
+    db.session.commit()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--itens', type=int, default=200, help='linhas por requisição')
+    parser.add_argument('--rodadas', type=int, default=20, help='requisições simuladas por caminho')
+    args = parser.parse_args()
+
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if not url:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='uwb-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = url
+    logging.disable(logging.WARNING)
+
+    from src.main import app
+    from src.models.user import db
+    from src.models.uwb_rssi import UWBDataRSSI
+    from src.routes.uwb import _inserir_rssi_em_lote
+
+    resultado = {'banco': url.split(':', 1)[0], 'itens': args.itens, 'rodadas': args.rodadas}
+    with app.app_context():
+        for nome, executar in (
+            ('antigo', lambda linhas: _caminho_antigo(db, UWBDataRSSI, linhas)),
+            ('lote', lambda linhas: _caminho_lote(db, _inserir_rssi_em_lote, linhas)),
+        ):
+            executar(_gerar_linhas(args.itens))  # aquecimento
+            lotes = [_gerar_linhas(args.itens) for _ in range(args.rodadas)]
+            inicio = time.perf_counter()
+            for linhas in lotes:
+                executar(linhas)
+            duracao = time.perf_counter() - inicio
+            resultado[nome] = {
+                'segundos': round(duracao, 4),
+                'linhas_por_segundo': round(args.itens * args.rodadas / duracao, 1),
+            }
+
+    resultado['ganho'] = round(
+        resultado['lote']['linhas_por_segundo'] / resultado['antigo']['linhas_por_segundo'], 2
+    )
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == '__main__':
+    main()
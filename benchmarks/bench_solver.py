@@ -0,0 +1,228 @@
+"""
+Micro-benchmark e regressão de precisão da TrilateracaoUWB
+
+Varre layouts de âncoras (kx/ky), quantidade de âncoras válidas e ruído sobre posições reais
+sintéticas (sementes fixas: as entradas são sempre as mesmas). Para cada combinação mede µs por
+solução e os percentis do erro de posição (cm) do caminho do solver que ela exercita:
+  basica             processar_distancias com 3 âncoras válidas (da0..da2)
+  minimos_quadrados  processar_distancias com 4 ou mais âncoras válidas (subconjuntos sorteados)
+  fallback           calcular_minimos_quadrados com menos de 3 âncoras válidas (posição padrão 57/57)
+                     + aplicar_correcao, a mesma sequência de processar_distancias
+  lote               processar_lote com as entradas de basica e minimos_quadrados; o resultado precisa
+                     ser idêntico ao de processar_distancias linha a linha
+
+Compara com o baseline gravado (benchmarks/baseline_solver.json) e termina com código 1 se:
+  - o tempo de um caminho (média geométrica das combinações) passou de baseline x (1 + --tolerancia-tempo)
+  - um percentil de erro de uma combinação passou de baseline x (1 + --tolerancia-erro) + 0,05 cm
+  - processar_lote divergiu de processar_distancias
+Código 2 quando não há baseline ou ele foi gerado com outros parâmetros.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_solver
+    python -m benchmarks.bench_solver --sem-tempo               # só precisão (outra máquina, CI)
+    python -m benchmarks.bench_solver --atualizar-baseline      # após uma mudança intencional
+"""
+import argparse
+import platform
+import logging
+import math
+import json
+import time
+import sys
+import os
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import numpy as np  # noqa: E402
+from benchmarks.trafego import ancoras_do_layout, medir_distancias  # noqa: E402
+from benchmarks.bench_ingestao import percentil, commit_atual  # noqa: E402
+
+BASELINE_PADRAO = os.path.join(RAIZ, 'benchmarks', 'baseline_solver.json')
+LAYOUTS = ((None, None), (300.0, 300.0), (600.0, 400.0), (1000.0, 1000.0))  # (None, None): âncoras padrão (114 cm)
+ANCORAS_VALIDAS = (2, 3, 4, 6, 8)
+RUIDOS_CM = (0.0, 5.0, 20.0)
+MARGEM_CM = 2.0  # aplicar_correcao limita a posição a [2, k - 2]
+
+
+def _argumentos():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--amostras', type=int, default=500, help='posições por combinação')
+    parser.add_argument('--repeticoes', type=int, default=5, help='medições de tempo por combinação (vale a menor)')
+    parser.add_argument('--semente', type=int, default=7)
+    parser.add_argument('--baseline', default=BASELINE_PADRAO)
+    parser.add_argument('--tolerancia-tempo', type=float, default=0.25)
+    parser.add_argument('--tolerancia-erro', type=float, default=0.02)
+    parser.add_argument('--sem-tempo', action='store_true', help='não compara os tempos')
+    parser.add_argument('--atualizar-baseline', action='store_true', help='grava esta execução como baseline')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    return parser.parse_args()
+
+
+def _nome_layout(kx, ky):
+    return 'padrao' if kx is None else f'{kx:g}x{ky:g}'
+
+
+def _caminho(validas):
+    if validas < 3:
+        return 'fallback'
+    return 'basica' if validas == 3 else 'minimos_quadrados'
+
+
+def gerar_entradas(kx, ky, validas, ruido_cm, amostras, rng):
+    """(posições reais (N, 2), distâncias (N, 8)) com 0 nas âncoras inválidas"""
+    limite = np.array([kx or 114.0, ky or 114.0])
+    reais = rng.uniform(MARGEM_CM, limite - MARGEM_CM, (amostras, 2))
+    distancias, _ = medir_distancias(reais, ancoras_do_layout(kx, ky), rng, ruido_cm, perda=0.0, nlos=0.0)
+    mascara = np.zeros((amostras, 8), dtype=bool)
+    if validas == 3:
+        mascara[:, :3] = True
+    else:
+        for linha in mascara:
+            linha[rng.choice(8, validas, replace=False)] = True
+    return reais, np.where(mascara, distancias, 0.0)
+
+
+def _resolvedor(solver, caminho, kx, ky):
+    if caminho == 'fallback':
+        def resolver(linha):
+            x, y = solver.calcular_minimos_quadrados({f'da{i}': v for i, v in enumerate(linha)}, kx, ky)
+            x, y = solver.aplicar_correcao(x, y, kx, ky)
+            return round(x, 2), round(y, 2)
+        return resolver
+    return lambda linha: solver.processar_distancias(*linha, kx=kx, ky=ky)
+
+
+def _cronometrar(funcao, repeticoes):
+    """Menor tempo entre as repetições (o menos afetado por outros processos)"""
+    melhor = math.inf
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def _erros(reais, posicoes):
+    erros = np.sort(np.linalg.norm(np.asarray(posicoes) - reais, axis=1)).tolist()
+    return {p: round(percentil(erros, int(p[1:])), 3) for p in ('p50', 'p90', 'p99')}
+
+
+def executar(args):
+    from src.routes.uwb import TrilateracaoUWB
+
+    solver = TrilateracaoUWB()
+    rng = np.random.default_rng(args.semente)
+    combinacoes = {}
+    divergencias = []
+    for kx, ky in LAYOUTS:
+        for validas in ANCORAS_VALIDAS:
+            for ruido in RUIDOS_CM:
+                caminho = _caminho(validas)
+                reais, distancias = gerar_entradas(kx, ky, validas, ruido, args.amostras, rng)
+                linhas = distancias.tolist()
+                resolver = _resolvedor(solver, caminho, kx, ky)
+                posicoes = [resolver(linha) for linha in linhas]  # também aquece o cache de geometria
+                segundos = _cronometrar(lambda: [resolver(linha) for linha in linhas], args.repeticoes)
+                sufixo = f'{_nome_layout(kx, ky)}/k{validas}/ruido{ruido:g}'
+                combinacoes[f'{caminho}/{sufixo}'] = {
+                    'us_por_solucao': round(1e6 * segundos / len(linhas), 3),
+                    'erro_cm': _erros(reais, posicoes),
+                }
+                if caminho == 'fallback':
+                    continue
+
+                lote = solver.processar_lote(distancias, kx=kx, ky=ky)
+                if not np.array_equal(lote, np.array(posicoes)):
+                    divergencias.append(f'lote/{sufixo}')
+                segundos = _cronometrar(lambda: solver.processar_lote(distancias, kx=kx, ky=ky), args.repeticoes)
+                combinacoes[f'lote/{sufixo}'] = {
+                    'us_por_solucao': round(1e6 * segundos / len(linhas), 3),
+                    'erro_cm': _erros(reais, lote),
+                }
+
+    caminhos = {}
+    for chave, resultado in combinacoes.items():
+        caminhos.setdefault(chave.split('/', 1)[0], []).append(resultado['us_por_solucao'])
+    return {
+        'caminhos': {
+            caminho: {'us_por_solucao': round(math.exp(sum(map(math.log, tempos)) / len(tempos)), 3),
+                      'combinacoes': len(tempos)}
+            for caminho, tempos in caminhos.items()
+        },
+        'combinacoes': combinacoes,
+        'lote_divergente': divergencias,
+    }
+
+
+def regressoes(atual, base, args):
+    encontradas = [f'{chave}: processar_lote diverge de processar_distancias' for chave in atual['lote_divergente']]
+    if not args.sem_tempo:
+        for caminho, anterior in base['caminhos'].items():
+            tempo = atual['caminhos'].get(caminho, {}).get('us_por_solucao')
+            if tempo is not None and tempo > anterior['us_por_solucao'] * (1 + args.tolerancia_tempo):
+                encontradas.append(f"{caminho}: {tempo} µs por solução (baseline {anterior['us_por_solucao']})")
+    for chave, anterior in base['combinacoes'].items():
+        resultado = atual['combinacoes'].get(chave)
+        if resultado is None:
+            encontradas.append(f'{chave}: ausente nesta execução')
+            continue
+        for p, erro_base in anterior['erro_cm'].items():
+            erro = resultado['erro_cm'][p]
+            if erro > erro_base * (1 + args.tolerancia_erro) + 0.05:
+                encontradas.append(f'{chave}: erro {p} {erro} cm (baseline {erro_base})')
+    return encontradas
+
+
+def main():
+    args = _argumentos()
+    logging.disable(logging.WARNING)
+    parametros = {
+        'amostras': args.amostras, 'semente': args.semente,
+        'layouts': [_nome_layout(kx, ky) for kx, ky in LAYOUTS],
+        'ancoras_validas': list(ANCORAS_VALIDAS), 'ruidos_cm': list(RUIDOS_CM),
+    }
+    relatorio = {
+        'benchmark': 'solver',
+        'data': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit_atual(),
+        'maquina': {'python': platform.python_version(), 'numpy': np.__version__,
+                    'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+        'parametros': parametros,
+        **executar(args),
+    }
+
+    codigo = 0
+    if args.atualizar_baseline:
+        with open(args.baseline, 'w') as arquivo:
+            json.dump(relatorio, arquivo, indent=2)
+            arquivo.write('\n')
+        relatorio['regressoes'] = []
+    elif not os.path.exists(args.baseline):
+        relatorio['regressoes'] = None
+        relatorio['mensagem'] = f'Baseline {args.baseline} não encontrado; gere com --atualizar-baseline'
+        codigo = 2
+    else:
+        with open(args.baseline) as arquivo:
+            base = json.load(arquivo)
+        if base.get('parametros') != parametros:
+            relatorio['regressoes'] = None
+            relatorio['mensagem'] = 'Baseline gerado com outros parâmetros; compare com os mesmos ou atualize-o'
+            codigo = 2
+        else:
+            relatorio['baseline'] = {'commit': base.get('commit'), 'data': base.get('data'),
+                                     'caminhos': base['caminhos']}
+            relatorio['regressoes'] = regressoes(relatorio, base, args)
+            codigo = 1 if relatorio['regressoes'] else 0
+
+    if args.saida:
+        with open(args.saida, 'w') as arquivo:
+            json.dump(relatorio, arquivo, indent=2)
+    resumo = {chave: relatorio.get(chave) for chave in
+              ('commit', 'caminhos', 'baseline', 'lote_divergente', 'regressoes', 'mensagem') if chave in relatorio}
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    sys.exit(codigo)
+
+
+if __name__ == '__main__':
+    main()
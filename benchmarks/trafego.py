@@ -0,0 +1,112 @@
+"""
+Tráfego sintético dos ESP32: trajetórias de tags convertidas nas 8 distâncias às âncoras
+
+Cada tag anda pela sala (kx x ky cm) alternando trechos em movimento (60-140 cm/s, direção
+variando suavemente, refletindo nas paredes) e paradas. Cada leitura traz a distância real a
+cada âncora com ruído gaussiano, um desvio positivo ocasional (sem linha de visada) e perdas
+(âncora sem resposta, enviada como 0, como faz o firmware). As âncoras seguem o mesmo layout
+de TrilateracaoUWB.obter_coordenadas_ancoras.
+
+    from benchmarks.trafego import gerar_leituras, payloads
+    leituras = gerar_leituras(n_leituras=1000, n_tags=4, kx=300, ky=300, semente=1)
+    for corpo in payloads(leituras, endpoint='data', lote=50): ...
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+
+# Arrays (N,) / (N, 8) ordenados por tempo, com as tags intercaladas
+Leituras = namedtuple('Leituras', 'tag t x y distancias rssi')
+
+TAG_INICIAL = 3  # TAG1 e TAG2 são de calibração e não passam pela trilateração
+MARGEM_PAREDE_CM = 10.0
+
+
+def ancoras_do_layout(kx, ky):
+    """Coordenadas (8, 2) das âncoras da0..da7 para o kx/ky do relatório"""
+    from src.routes.uwb import TrilateracaoUWB
+    coordenadas = TrilateracaoUWB().obter_coordenadas_ancoras(kx, ky)
+    return np.array([coordenadas[f'da{i}'] for i in range(8)], dtype=float)
+
+
+def trajetoria(passos, kx, ky, hz, rng, movimento_s=8.0, parada_s=3.0):
+    """Posições (passos, 2) de uma tag amostradas a `hz` leituras por segundo"""
+    dt = 1.0 / hz
+    limite = np.array([kx, ky], dtype=float)
+    posicao = rng.uniform(MARGEM_PAREDE_CM, limite - MARGEM_PAREDE_CM)
+    direcao = rng.uniform(0, 2 * np.pi)
+    velocidade = rng.uniform(60, 140)
+    em_movimento = rng.random() < movimento_s / (movimento_s + parada_s)
+    pontos = np.empty((passos, 2))
+    for i in range(passos):
+        # Cadeia de Markov movimento/parada com as durações médias pedidas
+        if rng.random() < dt / (movimento_s if em_movimento else parada_s):
+            em_movimento = not em_movimento
+            if em_movimento:
+                velocidade = rng.uniform(60, 140)
+        if em_movimento:
+            direcao += rng.normal(0, 1.2 * np.sqrt(dt))
+            posicao = posicao + velocidade * dt * np.array([np.cos(direcao), np.sin(direcao)])
+            for eixo in (0, 1):
+                if posicao[eixo] < MARGEM_PAREDE_CM or posicao[eixo] > limite[eixo] - MARGEM_PAREDE_CM:
+                    posicao[eixo] = np.clip(posicao[eixo], MARGEM_PAREDE_CM, limite[eixo] - MARGEM_PAREDE_CM)
+                    direcao = np.pi - direcao if eixo == 0 else -direcao
+        pontos[i] = posicao
+    return pontos
+
+
+def medir_distancias(posicoes, ancoras, rng, ruido_cm=8.0, perda=0.1, nlos=0.05):
+    """
+    Distâncias (N, 8) medidas de cada posição a cada âncora: real + N(0, ruido_cm), mais um
+    desvio exponencial (média 30 cm) com probabilidade `nlos`; com probabilidade `perda` a
+    âncora não responde (0). Também devolve o RSSI (dBm) correspondente, 0 nas perdas.
+    """
+    reais = np.linalg.norm(posicoes[:, None, :] - ancoras[None, :, :], axis=2)
+    medidas = reais + rng.normal(0, ruido_cm, reais.shape)
+    medidas += np.where(rng.random(reais.shape) < nlos, rng.exponential(30.0, reais.shape), 0.0)
+    medidas = np.maximum(medidas, 1.0)
+    rssi = -45.0 - 20 * np.log10(np.maximum(reais, 10.0) / 100.0) + rng.normal(0, 2.0, reais.shape)
+    perdidas = rng.random(reais.shape) < perda
+    return np.where(perdidas, 0.0, medidas.round(2)), np.where(perdidas, 0.0, rssi.round(1))
+
+
+def gerar_leituras(n_leituras, n_tags=4, kx=300, ky=300, hz=10.0, ruido_cm=8.0, perda=0.1, nlos=0.05, semente=0):
+    """`n_leituras` leituras de `n_tags` tags (ids a partir de 3), intercaladas por tempo"""
+    rng = np.random.default_rng(semente)
+    ancoras = ancoras_do_layout(kx, ky)
+    por_tag = -(-n_leituras // n_tags)
+    tags, tempos, posicoes = [], [], []
+    for indice in range(n_tags):
+        tags.append(np.full(por_tag, TAG_INICIAL + indice))
+        # Tags não sincronizadas: cada uma começa com uma defasagem dentro do período
+        tempos.append(np.arange(por_tag) / hz + rng.uniform(0, 1.0 / hz))
+        posicoes.append(trajetoria(por_tag, kx, ky, hz, rng))
+    ordem = np.argsort(np.concatenate(tempos), kind='stable')[:n_leituras]
+    posicoes = np.concatenate(posicoes)[ordem]
+    distancias, rssi = medir_distancias(posicoes, ancoras, rng, ruido_cm, perda, nlos)
+    return Leituras(np.concatenate(tags)[ordem], np.concatenate(tempos)[ordem],
+                    posicoes[:, 0], posicoes[:, 1], distancias, rssi)
+
+
+def payloads(leituras, endpoint='data', lote=1, inicio=None):
+    """
+    Corpos JSON como os enviados pelos ESP32, na ordem das leituras
+    - endpoint='data':      {"id": "3", "range": [...]}                        (/uwb/data)
+    - endpoint='data-rssi': {"id": 3, "range": [...], "rssi": [...], "timestamp": "..."} (/uwb/data-rssi)
+    lote=1 gera objetos únicos; lote>1 gera arrays de até `lote` objetos.
+    """
+    inicio = inicio or datetime.utcnow()
+    itens = []
+    for i in range(len(leituras.tag)):
+        if endpoint == 'data':
+            itens.append({'id': str(int(leituras.tag[i])), 'range': leituras.distancias[i].tolist()})
+        else:
+            itens.append({
+                'id': int(leituras.tag[i]),
+                'range': leituras.distancias[i].tolist(),
+                'rssi': leituras.rssi[i].tolist(),
+                'timestamp': (inicio + timedelta(seconds=float(leituras.t[i]))).isoformat()
+            })
+    if lote <= 1:
+        return itens
+    return [itens[i:i + lote] for i in range(0, len(itens), lote)]
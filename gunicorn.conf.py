@@ -1,12 +1,27 @@
 # Configuração do Gunicorn para produção no Render
 import os
+import glob
+
+# Métricas Prometheus em modo multiprocesso: cada worker grava seus valores em arquivos neste
+# diretório e /metrics soma todos. A variável precisa existir antes da aplicação ser importada
+# (preload_app), por isso é definida aqui. Os arquivos de uma execução anterior são removidos.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/uwb-metricas')
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+for _arquivo in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+    os.remove(_arquivo)
 
 # Bind to the port provided by Render
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
 
 # Worker configuration
+# gthread: cada worker atende `threads` requisições ao mesmo tempo e as conexões ociosas (keep-alive)
+# não ocupam thread. Uma conexão do stream SSE (/api/uwb/stream) ocupa uma thread enquanto aberta;
+# o stream usa no máximo UWB_STREAM_MAX_LEITORES threads por worker e as demais ficam para a ingestão.
+# O timeout vale para o worker (heartbeat do processo), não para uma requisição longa.
 workers = 2
-worker_class = "sync"
+worker_class = "gthread"
+threads = int(os.environ.get('UWB_GUNICORN_THREADS', '8'))
+os.environ.setdefault('UWB_STREAM_MAX_LEITORES', str(max(1, threads // 2)))
 worker_connections = 1000
 timeout = 30
 keepalive = 2
@@ -24,3 +39,25 @@ preload_app = True
 max_requests = 1000
 max_requests_jitter = 50
 
+
+def post_fork(server, worker):
+    # Conexões herdadas do processo principal (preload_app) não são reutilizadas no worker, e o LISTEN
+    # do stream de posições começa junto com o worker, antes do primeiro leitor
+    from src.main import app
+    from src.models.user import db
+    from src.services.stream_posicoes import publicador_posicoes
+    with app.app_context():
+        db.engine.dispose(close=False)
+        publicador_posicoes.iniciar_ouvinte(db.engine)
+
+
+def worker_exit(server, worker):
+    # Grava as leituras que ainda estão na fila de ingestão assíncrona do worker
+    from src.services.fila_ingestao import fila_ingestao
+    fila_ingestao.parar()
+
+
+def child_exit(server, worker):
+    # Remove os arquivos de métricas "live" do worker encerrado; contadores e histogramas são mantidos
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
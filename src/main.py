@@ -1,5 +1,7 @@
 import os
 import sys
+import atexit
+import logging
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
@@ -9,10 +11,18 @@ from src.models.user import db
 from src.models.uwb_data import UWBData
 from src.models.relatorio import Relatorio
 from src.routes.user import user_bp
-from src.routes.uwb import uwb_bp
+from src.routes.uwb import uwb_bp, processar_lote_fila
 from src.routes.relatorio import relatorio_bp
-from src.routes.migration import migration_bp
+from src.routes.migration import migration_bp, garantir_coluna_relatorio
 from src.routes.adicional_api import relatorio_kodular_bp
+from src.routes.agregados import agregados_bp
+from src.routes.retencao import retencao_bp
+from src.routes.metricas import metricas_bp
+from src.routes.perfilador import perfilador_bp
+from src.services.fila_ingestao import fila_ingestao
+from src.services.metricas import instrumentar_app
+from src.services.perfil_sql import instrumentar_sql
+from src.services.perfilador import instrumentar_perfilador
 
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -26,6 +36,13 @@ app.register_blueprint(uwb_bp, url_prefix='/api')
 app.register_blueprint(relatorio_bp, url_prefix='/api')
 app.register_blueprint(migration_bp, url_prefix='/api')
 app.register_blueprint(relatorio_kodular_bp, url_prefix="/api")
+app.register_blueprint(agregados_bp, url_prefix='/api')
+app.register_blueprint(retencao_bp, url_prefix='/api')
+app.register_blueprint(perfilador_bp, url_prefix='/api')
+# /metrics fica fora de /api, no caminho padrão do Prometheus
+app.register_blueprint(metricas_bp)
+instrumentar_app(app)
+instrumentar_perfilador(app)
 
 
 # Configuração do banco de dados
@@ -42,8 +59,19 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
+instrumentar_sql(app)
 with app.app_context():
     db.create_all()
+    # Tabelas criadas antes da coluna relatorio_number (create_all não altera tabelas existentes)
+    try:
+        garantir_coluna_relatorio()
+    except Exception as e:
+        logging.error(f"Não foi possível adicionar relatorio_number: {e}. Use POST /api/migration/add-relatorio-column")
+
+# Fila de ingestão assíncrona: a thread de escrita é criada no worker na primeira leitura enfileirada
+# e o que restar na fila é gravado ao encerrar o processo (worker_exit no gunicorn)
+fila_ingestao.configurar(app, processar_lote_fila)
+atexit.register(fila_ingestao.parar)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,42 @@
+from src.models.user import db
+
+class AgregadoPosicao(db.Model):
+    """
+    Agregado das posições de uma tag num intervalo fixo de tempo (rollup)
+    Mantido de forma incremental pela ingestão e reconstruível a partir de distancias_processadas
+    - resolucao: tamanho do intervalo em segundos (1 ou 60)
+    - inicio: início do intervalo (criado_em truncado para a resolução, UTC)
+    - soma_x/soma_y: somas das coordenadas; a média é soma / amostras, o que permite somar
+      contribuições de lotes diferentes num mesmo intervalo
+    - distancia: soma de distancia_percorrida (cm) das posições do intervalo
+    """
+    __tablename__ = 'posicoes_agregadas'
+
+    resolucao = db.Column(db.Integer, primary_key=True)
+    tag_number = db.Column(db.String(50), primary_key=True)
+    inicio = db.Column(db.DateTime, primary_key=True)
+    amostras = db.Column(db.Integer, nullable=False, default=0)
+    soma_x = db.Column(db.Float, nullable=False, default=0.0)
+    soma_y = db.Column(db.Float, nullable=False, default=0.0)
+    x_min = db.Column(db.Float, nullable=True)
+    x_max = db.Column(db.Float, nullable=True)
+    y_min = db.Column(db.Float, nullable=True)
+    y_max = db.Column(db.Float, nullable=True)
+    distancia = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<AgregadoPosicao {self.resolucao}s tag={self.tag_number} inicio={self.inicio}>'
+
+    def to_dict(self):
+        return {
+            'tag_number': self.tag_number,
+            'inicio': self.inicio.isoformat() if self.inicio else None,
+            'amostras': self.amostras,
+            'x_medio': round(self.soma_x / self.amostras, 3) if self.amostras else None,
+            'y_medio': round(self.soma_y / self.amostras, 3) if self.amostras else None,
+            'x_min': self.x_min,
+            'x_max': self.x_max,
+            'y_min': self.y_min,
+            'y_max': self.y_max,
+            'distancia': round(self.distancia, 3)
+        }
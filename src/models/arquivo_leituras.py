@@ -0,0 +1,46 @@
+from src.models.user import db
+from datetime import datetime
+import json
+
+class ArquivoLeituras(db.Model):
+    """
+    Leituras brutas (distancias_uwb) arquivadas pela retenção, um bloco por linha
+    - dados: .npz comprimido com um vetor por coluna de distancias_uwb
+      (tag_number como índices em tag_number_categorias, criado_em em datetime64[us], ausentes como NaN)
+    - leituras_por_tag: contagem por tag do bloco (JSON), usada pelo resumo do relatório
+      sem descomprimir os dados
+    """
+    __tablename__ = 'distancias_uwb_arquivo'
+    __table_args__ = (
+        db.UniqueConstraint('relatorio_number', 'parte', name='uq_distancias_uwb_arquivo_parte'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    relatorio_number = db.Column(db.Integer, db.ForeignKey('relatorio.relatorio_number'), nullable=False, index=True)
+    parte = db.Column(db.Integer, nullable=False)
+    linhas = db.Column(db.Integer, nullable=False)
+    primeiro_id = db.Column(db.Integer, nullable=False)
+    ultimo_id = db.Column(db.Integer, nullable=False)
+    inicio = db.Column(db.DateTime, nullable=True)  # menor criado_em do bloco
+    fim = db.Column(db.DateTime, nullable=True)     # maior criado_em do bloco
+    leituras_por_tag = db.Column(db.Text, nullable=False, default='{}')
+    dados = db.Column(db.LargeBinary, nullable=False)
+    tamanho_bytes = db.Column(db.Integer, nullable=False)
+    arquivado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ArquivoLeituras relatorio={self.relatorio_number} parte={self.parte} linhas={self.linhas}>'
+
+    def to_dict(self):
+        return {
+            'relatorio_number': self.relatorio_number,
+            'parte': self.parte,
+            'linhas': self.linhas,
+            'primeiro_id': self.primeiro_id,
+            'ultimo_id': self.ultimo_id,
+            'inicio': self.inicio.isoformat() if self.inicio else None,
+            'fim': self.fim.isoformat() if self.fim else None,
+            'leituras_por_tag': json.loads(self.leituras_por_tag or '{}'),
+            'tamanho_bytes': self.tamanho_bytes,
+            'arquivado_em': self.arquivado_em.isoformat() if self.arquivado_em else None
+        }
@@ -0,0 +1,42 @@
+from src.models.user import db
+from datetime import datetime
+
+class ResumoRelatorio(db.Model):
+    """
+    Resumo materializado da trajetória de cada tag num relatório
+    Calculado ao finalizar o relatório (ou sob demanda) a partir de distancias_processadas
+    - distancia_total: soma de distancia_percorrida (cm)
+    - duracao_s: intervalo entre a primeira e a última posição da tag no relatório
+    - velocidade_media: distancia_total / soma de tempo_em_segundos (cm/s)
+    - velocidade_maxima: maior distancia_percorrida / tempo_em_segundos entre posições consecutivas (cm/s)
+    """
+    __tablename__ = 'relatorio_resumo'
+
+    relatorio_number = db.Column(db.Integer, db.ForeignKey('relatorio.relatorio_number'), primary_key=True)
+    tag_number = db.Column(db.String(50), primary_key=True)
+    amostras = db.Column(db.Integer, nullable=False, default=0)  # posições gravadas
+    leituras = db.Column(db.Integer, nullable=False, default=0)  # leituras brutas (distancias_uwb)
+    distancia_total = db.Column(db.Float, nullable=True)
+    duracao_s = db.Column(db.Float, nullable=True)
+    velocidade_media = db.Column(db.Float, nullable=True)
+    velocidade_maxima = db.Column(db.Float, nullable=True)
+    primeira_posicao_em = db.Column(db.DateTime, nullable=True)
+    ultima_posicao_em = db.Column(db.DateTime, nullable=True)
+    calculado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ResumoRelatorio relatorio={self.relatorio_number} tag={self.tag_number}>'
+
+    def to_dict(self):
+        return {
+            'tag_number': self.tag_number,
+            'amostras': self.amostras,
+            'leituras': self.leituras,
+            'distancia_total': self.distancia_total,
+            'duracao_s': self.duracao_s,
+            'velocidade_media': self.velocidade_media,
+            'velocidade_maxima': self.velocidade_maxima,
+            'primeira_posicao_em': self.primeira_posicao_em.isoformat() if self.primeira_posicao_em else None,
+            'ultima_posicao_em': self.ultima_posicao_em.isoformat() if self.ultima_posicao_em else None,
+            'calculado_em': self.calculado_em.isoformat() if self.calculado_em else None
+        }
@@ -3,6 +3,10 @@ from datetime import datetime
 
 class UWBData(db.Model):
     __tablename__ = 'distancias_uwb'
+    __table_args__ = (
+        db.Index('ix_distancias_uwb_tag_criado_em', 'tag_number', 'criado_em'),
+        db.Index('ix_distancias_uwb_criado_em', 'criado_em'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tag_number = db.Column(db.String(50), nullable=False)
@@ -15,6 +19,7 @@ class UWBData(db.Model):
     da6 = db.Column(db.Float, nullable=True)
     da7 = db.Column(db.Float, nullable=True)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    relatorio_number = db.Column(db.Integer, db.ForeignKey('relatorio.relatorio_number'), nullable=True, index=True)
 
     def __repr__(self):
         return f'<UWBData tag={self.tag_number} id={self.id}>'
@@ -31,7 +36,8 @@ class UWBData(db.Model):
             'da5': self.da5,
             'da6': self.da6,
             'da7': self.da7,
-            'criado_em': self.criado_em.isoformat() if self.criado_em else None
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'relatorio_number': self.relatorio_number
         }
 
 class UWBDataProcessada(db.Model):
@@ -42,6 +48,10 @@ class UWBDataProcessada(db.Model):
     - Campos da2-da7 removidos conforme nova estrutura
     """
     __tablename__ = 'distancias_processadas'
+    __table_args__ = (
+        db.Index('ix_distancias_processadas_tag_criado_em', 'tag_number', 'criado_em'),
+        db.Index('ix_distancias_processadas_criado_em', 'criado_em'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     tag_number = db.Column(db.String(50), nullable=False)
@@ -50,6 +60,7 @@ class UWBDataProcessada(db.Model):
     criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     distancia_percorrida = db.Column(db.Float, nullable=True)
     tempo_em_segundos = db.Column(db.Float, nullable=True)
+    relatorio_number = db.Column(db.Integer, db.ForeignKey('relatorio.relatorio_number'), nullable=True, index=True)
 
 
     def __repr__(self):
@@ -61,7 +72,8 @@ class UWBDataProcessada(db.Model):
             'tag_number': self.tag_number,
             'x': self.x,
             'y': self.y,
-            'criado_em': self.criado_em.isoformat() if self.criado_em else None
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'relatorio_number': self.relatorio_number
         }
 
     def to_dict_detalhado(self):
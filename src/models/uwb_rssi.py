@@ -4,6 +4,10 @@ from datetime import datetime
 
 class UWBDataRSSI(db.Model):
     __tablename__ = 'distancias_uwb_rssi'
+    __table_args__ = (
+        db.Index('ix_distancias_uwb_rssi_tag_criado_em', 'tag_number', 'criado_em'),
+        db.Index('ix_distancias_uwb_rssi_criado_em', 'criado_em'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     tag_number = db.Column(db.String(50), nullable=False)
@@ -29,7 +33,17 @@ class UWBDataRSSI(db.Model):
     rssi7 = db.Column(db.Float, nullable=True)
 
     criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    relatorio_number = db.Column(db.Integer, db.ForeignKey('relatorio.relatorio_number'), nullable=True, index=True)
 
     def __repr__(self):
         return f'<UWBDataRSSI tag={self.tag_number} id={self.id}>'
-{"status":500,"name":"Error","message":"Input buffer contains unsupported image format"}
\ No newline at end of file
+
+    def to_dict(self):
+        dados = {'id': self.id, 'tag_number': self.tag_number}
+        for i in range(8):
+            dados[f'da{i}'] = getattr(self, f'da{i}')
+        for i in range(8):
+            dados[f'rssi{i}'] = getattr(self, f'rssi{i}')
+        dados['criado_em'] = self.criado_em.isoformat() if self.criado_em else None
+        dados['relatorio_number'] = self.relatorio_number
+        return dados
@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify
 from src.models.relatorio import Relatorio
 from src.models.user import db
+from src.routes.uwb import trilateracao
+from src.services.cache_posicoes import cache_posicoes
+from src.services.cache_relatorio import cache_relatorio
+from src.services.resumo_relatorio import resumir_ao_finalizar
+from src.services.fila_ingestao import fila_ingestao
 from datetime import datetime
 import logging
 
@@ -19,6 +24,10 @@ def iniciar_ou_finalizar_kodular():
             logging.info(f"[Kodular] Texto recebido: {raw_data}")
 
             if raw_data.lower() == "finalizar_relatorio":
+                # Leituras já aceitas pela fila de ingestão são gravadas no relatório antes de fechá-lo
+                if not fila_ingestao.esvaziar():
+                    logging.warning("[Kodular] Fila de ingestão não esvaziou antes da finalização")
+
                 # Tentar finalizar o relatório ativo
                 relatorio_ativo = Relatorio.query.filter(
                     Relatorio.inicio_do_relatorio.isnot(None),
@@ -33,13 +42,17 @@ def iniciar_ou_finalizar_kodular():
 
                 relatorio_ativo.fim_do_relatorio = datetime.utcnow()
                 db.session.commit()
+                cache_posicoes.limpar()
+                cache_relatorio.invalidar()
 
                 logging.info(f"[Kodular] Relatório finalizado: ID {relatorio_ativo.relatorio_number}")
+                resumo = resumir_ao_finalizar(relatorio_ativo.relatorio_number)
 
                 return jsonify({
                     "success": True,
                     "message": "Relatório finalizado com sucesso",
                     "relatorio": relatorio_ativo.to_dict(),
+                    "resumo": resumo,
                     "leituras_habilitadas": False
                 }), 200
 
@@ -95,6 +108,11 @@ def iniciar_ou_finalizar_kodular():
         db.session.add(novo_relatorio)
         db.session.commit()
 
+        # Novo kx/ky invalida a geometria em cache da trilateração
+        trilateracao.atualizar_layout(novo_relatorio.kx or None, novo_relatorio.ky or None)
+        cache_posicoes.limpar()
+        cache_relatorio.invalidar()
+
         logging.info(f"[Kodular] Novo relatório: ID {novo_relatorio.relatorio_number}, Kx={kx}, Ky={ky}")
 
         return jsonify({
@@ -0,0 +1,155 @@
+from flask import Blueprint, jsonify, request, current_app
+from src.models.user import db
+from src.services.agregados import (
+    reconstruir_agregados, escolher_resolucao, consultar_agregados, RESOLUCOES, NOMES_RESOLUCAO
+)
+from src.services.consulta import interpretar_data, ErroConsulta
+from datetime import datetime, timedelta
+import threading
+import logging
+import click
+
+agregados_bp = Blueprint('agregados', __name__, cli_group='agregados')
+
+# Pontos por tag que o painel consegue mostrar; define a resolução escolhida automaticamente
+MAX_PONTOS_PADRAO = 1000
+# Limite de linhas por resposta
+LIMITE_RESPOSTA = 20000
+
+_NOME_POR_RESOLUCAO = {segundos: nome for nome, segundos in NOMES_RESOLUCAO.items()}
+
+@agregados_bp.route('/agregados/posicoes', methods=['GET'])
+def posicoes_agregadas():
+    """
+    Agregados por intervalo de tempo (amostras, média, mínimo/máximo de x e y, distância) de cada tag
+    - desde/ate: datas ISO 8601 (padrão: a última hora)
+    - resolucao=auto|1s|1min: com auto, usa 1 s enquanto o período couber em max_pontos intervalos
+      e 1 min para períodos maiores
+    - tag=N: apenas uma tag
+    """
+    try:
+        ate = interpretar_data(request.args.get('ate'), 'ate') or datetime.utcnow()
+        desde = interpretar_data(request.args.get('desde'), 'desde') or ate - timedelta(hours=1)
+        if desde > ate:
+            raise ErroConsulta('desde deve ser anterior a ate')
+        max_pontos = request.args.get('max_pontos', MAX_PONTOS_PADRAO, type=int)
+        if max_pontos <= 0:
+            raise ErroConsulta('max_pontos deve ser positivo')
+
+        nome = request.args.get('resolucao', 'auto').lower()
+        if nome == 'auto':
+            resolucao = escolher_resolucao(desde, ate, max_pontos)
+        elif nome in NOMES_RESOLUCAO:
+            resolucao = NOMES_RESOLUCAO[nome]
+        else:
+            raise ErroConsulta(f'resolucao inválida: {nome}. Use auto, ' + ', '.join(NOMES_RESOLUCAO))
+
+        agregados = consultar_agregados(resolucao, desde, ate, tag=request.args.get('tag'),
+                                        limite=LIMITE_RESPOSTA + 1)
+        truncado = len(agregados) > LIMITE_RESPOSTA
+
+        return jsonify({
+            'resolucao': _NOME_POR_RESOLUCAO[resolucao],
+            'resolucao_s': resolucao,
+            'desde': desde.isoformat(),
+            'ate': ate.isoformat(),
+            'total': min(len(agregados), LIMITE_RESPOSTA),
+            'truncado': truncado,
+            'intervalos': [agregado.to_dict() for agregado in agregados[:LIMITE_RESPOSTA]]
+        }), 200
+
+    except ErroConsulta as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Erro ao consultar agregados: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+# ===== RECONSTRUÇÃO =====
+# Recalcula os agregados de um período a partir de distancias_processadas: preenche o histórico
+# gravado antes dos agregados existirem ou corrige um período após um backfill.
+
+_reconstrucao = {'em_andamento': False, 'inicio': None, 'fim': None, 'periodo': None, 'progresso': {}, 'erro': None}
+_lock_reconstrucao = threading.Lock()
+
+def _executar_reconstrucao(app, desde, ate, tag):
+    try:
+        with app.app_context():
+            reconstruir_agregados(desde, ate, tag=tag, progresso=_reconstrucao['progresso'])
+    except Exception as e:
+        with app.app_context():
+            db.session.rollback()
+        logging.error(f"Erro na reconstrução dos agregados: {e}")
+        _reconstrucao['erro'] = str(e)
+    finally:
+        _reconstrucao['em_andamento'] = False
+        _reconstrucao['fim'] = datetime.utcnow().isoformat()
+
+@agregados_bp.route('/agregados/reconstruir', methods=['POST'])
+def reconstruir():
+    """
+    Reconstrói os agregados de um período em segundo plano
+    Corpo: {"desde": "...", "ate": "...", "tag": "opcional"}; sem "ate", até agora.
+    Acompanhe por GET /agregados/reconstruir
+    """
+    dados = request.get_json(silent=True) or {}
+    try:
+        desde = interpretar_data(dados.get('desde'), 'desde')
+        ate = interpretar_data(dados.get('ate'), 'ate') or datetime.utcnow()
+        if desde is None:
+            raise ErroConsulta('desde é obrigatório')
+        if desde > ate:
+            raise ErroConsulta('desde deve ser anterior a ate')
+    except ErroConsulta as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    with _lock_reconstrucao:
+        if _reconstrucao['em_andamento']:
+            return jsonify({
+                'success': True,
+                'message': 'Reconstrução já em andamento',
+                'action': 'nenhuma',
+                'reconstrucao': _reconstrucao
+            }), 200
+        _reconstrucao.update({
+            'em_andamento': True,
+            'inicio': datetime.utcnow().isoformat(),
+            'fim': None,
+            'periodo': {'desde': desde.isoformat(), 'ate': ate.isoformat(), 'tag': dados.get('tag')},
+            'progresso': {},
+            'erro': None
+        })
+
+    threading.Thread(
+        target=_executar_reconstrucao,
+        args=(current_app._get_current_object(), desde, ate, dados.get('tag')),
+        name='uwb-reconstrucao-agregados',
+        daemon=True
+    ).start()
+
+    return jsonify({
+        'success': True,
+        'message': 'Reconstrução dos agregados iniciada',
+        'action': 'reconstrucao_iniciada'
+    }), 202
+
+@agregados_bp.route('/agregados/reconstruir', methods=['GET'])
+def reconstruir_status():
+    """Progresso da reconstrução dos agregados neste worker"""
+    return jsonify({'success': True, 'reconstrucao': _reconstrucao}), 200
+
+@agregados_bp.cli.command('reconstruir')
+@click.option('--desde', required=True, help='Início do período (ISO 8601)')
+@click.option('--ate', default=None, help='Fim do período (ISO 8601); padrão: agora')
+@click.option('--tag', default=None, help='Apenas uma tag')
+def reconstruir_comando(desde, ate, tag):
+    """Reconstrói os agregados de um período (flask --app src.main agregados reconstruir --desde ...)"""
+    try:
+        desde = interpretar_data(desde, 'desde')
+        ate = interpretar_data(ate, 'ate') or datetime.utcnow()
+    except ErroConsulta as e:
+        raise click.BadParameter(str(e))
+    progresso = reconstruir_agregados(desde, ate, tag=tag)
+    click.echo(
+        f"{progresso['posicoes']} posições em {progresso['janelas']} janelas -> "
+        f"{progresso['intervalos']} intervalos ({', '.join(_NOME_POR_RESOLUCAO[r] for r in RESOLUCOES)})"
+    )
@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from src.services.metricas import gerar_metricas
+
+metricas_bp = Blueprint('metricas', __name__)
+
+@metricas_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato texto do Prometheus, somadas entre os workers do gunicorn"""
+    conteudo, tipo = gerar_metricas()
+    return Response(conteudo, mimetype=tipo)
@@ -1,7 +1,13 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, current_app
 from src.models.user import db
 from src.models.relatorio import Relatorio
+from src.models.uwb_data import UWBData, UWBDataProcessada
+from src.models.uwb_rssi import UWBDataRSSI
+from sqlalchemy import text, update
+from datetime import datetime, timedelta
+import threading
 import logging
+import time
 
 migration_bp = Blueprint('migration', __name__)
 
@@ -112,6 +118,379 @@ def reset_relatorio_table():
             'action': 'erro'
         }), 500
 
+# ===== ÍNDICES DAS TABELAS distancias_* =====
+# Os índices declarados nos modelos só são criados pelo create_all() em tabelas novas.
+# Em tabelas existentes (milhões de linhas) são construídos por /migration/create-indexes
+# numa thread em segundo plano: CREATE INDEX CONCURRENTLY no PostgreSQL (sem bloquear a ingestão)
+# e CREATE INDEX simples no SQLite. Um índice deixado inválido por uma construção interrompida
+# é removido e reconstruído.
+
+MODELOS_INDEXADOS = (UWBData, UWBDataProcessada, UWBDataRSSI)
+CHAVE_LOCK_INDICES = 7240013  # pg_advisory_lock: uma construção por vez entre os workers
+
+_construcao_indices = {'em_andamento': False, 'inicio': None, 'fim': None, 'indices': {}, 'erro': None}
+_lock_indices = threading.Lock()
+
+def _indices_declarados():
+    for modelo in MODELOS_INDEXADOS:
+        for indice in sorted(modelo.__table__.indexes, key=lambda i: i.name):
+            yield modelo.__tablename__, indice
+
+def _estado_indices(conexao):
+    """Estado de cada índice declarado no banco: 'valido', 'invalido' ou 'ausente'"""
+    nomes = [indice.name for _, indice in _indices_declarados()]
+    estados = dict.fromkeys(nomes, 'ausente')
+    if conexao.dialect.name == 'postgresql':
+        linhas = conexao.execute(text("""
+            SELECT c.relname, i.indisvalid
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = ANY(:nomes)
+        """), {'nomes': nomes})
+        for nome, valido in linhas:
+            estados[nome] = 'valido' if valido else 'invalido'
+    else:
+        inspector = db.inspect(conexao)
+        for modelo in MODELOS_INDEXADOS:
+            if not inspector.has_table(modelo.__tablename__):
+                continue
+            for indice in inspector.get_indexes(modelo.__tablename__):
+                if indice['name'] in estados:
+                    estados[indice['name']] = 'valido'
+    return estados
+
+def _progresso_indices(conexao):
+    """Progresso das construções em andamento (pg_stat_progress_create_index, PostgreSQL 12+)"""
+    if conexao.dialect.name != 'postgresql':
+        return []
+    try:
+        linhas = conexao.execute(text("""
+            SELECT t.relname, i.relname, p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+            FROM pg_stat_progress_create_index p
+            JOIN pg_class t ON t.oid = p.relid
+            LEFT JOIN pg_class i ON i.oid = p.index_relid
+        """))
+        return [{
+            'tabela': tabela,
+            'indice': indice,
+            'fase': fase,
+            'blocos': [blocos_feitos, blocos_total],
+            'tuplas': [tuplas_feitas, tuplas_total],
+            'percentual_blocos': round(100.0 * blocos_feitos / blocos_total, 1) if blocos_total else None
+        } for tabela, indice, fase, blocos_feitos, blocos_total, tuplas_feitas, tuplas_total in linhas]
+    except Exception as e:
+        return [{'error': f'Progresso indisponível: {str(e)}'}]
+
+def _construir_indices(app):
+    """Constrói os índices ausentes ou inválidos (thread em segundo plano)"""
+    estado = _construcao_indices
+    try:
+        with app.app_context():
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+                postgres = conexao.dialect.name == 'postgresql'
+                if postgres:
+                    if not conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {'chave': CHAVE_LOCK_INDICES}).scalar():
+                        estado['erro'] = 'Outra construção de índices está em andamento em outro worker'
+                        return
+                    conexao.execute(text("SET statement_timeout = 0"))
+                try:
+                    for tabela, indice in _indices_declarados():
+                        atual = _estado_indices(conexao)[indice.name]
+                        if atual == 'valido':
+                            estado['indices'][indice.name] = {'estado': 'existente'}
+                            continue
+                        
+                        inicio = time.perf_counter()
+                        estado['indices'][indice.name] = {'estado': 'construindo'}
+                        colunas = ', '.join(coluna.name for coluna in indice.columns)
+                        if postgres:
+                            if atual == 'invalido':
+                                logging.warning(f"Índice {indice.name} inválido, reconstruindo")
+                                conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.name}"))
+                            conexao.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {indice.name} ON {tabela} ({colunas})"))
+                        else:
+                            conexao.execute(text(f"CREATE INDEX IF NOT EXISTS {indice.name} ON {tabela} ({colunas})"))
+                        
+                        duracao = round(time.perf_counter() - inicio, 2)
+                        estado['indices'][indice.name] = {'estado': 'criado', 'duracao_s': duracao}
+                        logging.info(f"Índice {indice.name} criado em {duracao}s")
+                finally:
+                    if postgres:
+                        conexao.execute(text("SELECT pg_advisory_unlock(:chave)"), {'chave': CHAVE_LOCK_INDICES})
+    except Exception as e:
+        logging.error(f"Erro ao construir índices: {e}")
+        estado['erro'] = str(e)
+        for nome, item in estado['indices'].items():
+            if item['estado'] == 'construindo':
+                item['estado'] = 'erro'
+    finally:
+        estado['em_andamento'] = False
+        estado['fim'] = datetime.utcnow().isoformat()
+
+@migration_bp.route('/migration/create-indexes', methods=['POST'])
+def create_indexes():
+    """
+    Cria os índices (tag_number, criado_em) e (criado_em) das tabelas distancias_* em segundo plano.
+    Idempotente: índices válidos são mantidos. Acompanhe por GET /migration/indexes.
+    """
+    with _lock_indices:
+        if _construcao_indices['em_andamento']:
+            return jsonify({
+                'success': True,
+                'message': 'Construção de índices já em andamento',
+                'action': 'nenhuma',
+                'construcao': _construcao_indices
+            }), 200
+        _construcao_indices.update({
+            'em_andamento': True,
+            'inicio': datetime.utcnow().isoformat(),
+            'fim': None,
+            'indices': {},
+            'erro': None
+        })
+    
+    threading.Thread(
+        target=_construir_indices,
+        args=(current_app._get_current_object(),),
+        name='uwb-construcao-indices',
+        daemon=True
+    ).start()
+    
+    return jsonify({
+        'success': True,
+        'message': 'Construção de índices iniciada',
+        'action': 'construcao_iniciada',
+        'indices': [indice.name for _, indice in _indices_declarados()]
+    }), 202
+
+@migration_bp.route('/migration/indexes', methods=['GET'])
+def indexes_status():
+    """Estado dos índices das tabelas distancias_* e progresso da construção"""
+    try:
+        with db.engine.connect() as conexao:
+            estados = _estado_indices(conexao)
+            progresso = _progresso_indices(conexao)
+        
+        return jsonify({
+            'success': True,
+            'indices': [{
+                'tabela': tabela,
+                'nome': indice.name,
+                'colunas': [coluna.name for coluna in indice.columns],
+                'estado': estados[indice.name]
+            } for tabela, indice in _indices_declarados()],
+            'construcao': _construcao_indices,
+            'progresso': progresso
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Erro ao verificar índices: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao verificar índices: {str(e)}'
+        }), 500
+
+# ===== COLUNA relatorio_number DAS TABELAS distancias_* =====
+# A coluna é preenchida na ingestão; as linhas antigas são atribuídas por /migration/backfill-relatorio.
+# O índice da coluna é construído por /migration/create-indexes.
+
+def garantir_coluna_relatorio():
+    """
+    Adiciona relatorio_number (nullable) às tabelas distancias_* que ainda não a têm. Idempotente.
+    No PostgreSQL, ADD COLUMN sem default só altera o catálogo; a FK entra como NOT VALID
+    (sem varrer a tabela) e é validada ao fim do backfill.
+    Retorna a lista de tabelas alteradas.
+    """
+    alteradas = []
+    with db.engine.begin() as conexao:
+        postgres = conexao.dialect.name == 'postgresql'
+        inspector = db.inspect(conexao)
+        if postgres:
+            # Não espera indefinidamente pelo lock da tabela se houver transações longas
+            conexao.execute(text("SET LOCAL lock_timeout = '5s'"))
+        for modelo in MODELOS_INDEXADOS:
+            tabela = modelo.__tablename__
+            if not inspector.has_table(tabela):
+                continue
+            if 'relatorio_number' in [coluna['name'] for coluna in inspector.get_columns(tabela)]:
+                continue
+            if postgres:
+                conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS relatorio_number INTEGER"))
+                conexao.execute(text(
+                    f"ALTER TABLE {tabela} ADD CONSTRAINT {tabela}_relatorio_number_fkey "
+                    f"FOREIGN KEY (relatorio_number) REFERENCES relatorio (relatorio_number) NOT VALID"
+                ))
+            else:
+                conexao.execute(text(
+                    f"ALTER TABLE {tabela} ADD COLUMN relatorio_number INTEGER REFERENCES relatorio (relatorio_number)"
+                ))
+            alteradas.append(tabela)
+            logging.info(f"Coluna relatorio_number adicionada em {tabela}")
+    return alteradas
+
+@migration_bp.route('/migration/add-relatorio-column', methods=['POST'])
+def add_relatorio_column():
+    """Adiciona a coluna relatorio_number às tabelas distancias_* (idempotente)"""
+    try:
+        alteradas = garantir_coluna_relatorio()
+        return jsonify({
+            'success': True,
+            'message': 'Coluna relatorio_number adicionada' if alteradas else 'Coluna relatorio_number já existe',
+            'action': 'coluna_adicionada' if alteradas else 'nenhuma',
+            'tabelas': alteradas,
+            'proximos_passos': [
+                'POST /api/migration/create-indexes',
+                'POST /api/migration/backfill-relatorio'
+            ]
+        }), 201 if alteradas else 200
+        
+    except Exception as e:
+        logging.error(f"Erro ao adicionar coluna relatorio_number: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao adicionar coluna: {str(e)}',
+            'action': 'erro'
+        }), 500
+
+_backfill_relatorio = {'em_andamento': False, 'inicio': None, 'fim': None, 'tabelas': {}, 'erro': None}
+_lock_backfill = threading.Lock()
+
+def _janelas_relatorios():
+    """
+    (relatorio_number, inicio, fim) de cada relatório iniciado, em ordem cronológica.
+    Um relatório nunca finalizado vai até o início do seguinte (ou até agora).
+    """
+    relatorios = Relatorio.query.filter(
+        Relatorio.inicio_do_relatorio.isnot(None)
+    ).order_by(Relatorio.inicio_do_relatorio).all()
+    
+    janelas = []
+    for i, relatorio in enumerate(relatorios):
+        fim = relatorio.fim_do_relatorio
+        if fim is None:
+            fim = relatorios[i + 1].inicio_do_relatorio if i + 1 < len(relatorios) else datetime.utcnow()
+        janelas.append((relatorio.relatorio_number, relatorio.inicio_do_relatorio, fim))
+    return janelas
+
+def _executar_backfill(app, passo, pausa):
+    """
+    Atribui relatorio_number às linhas antigas, por janelas de `passo` dentro de cada relatório.
+    Cada janela é um UPDATE curto com commit próprio (só as linhas da janela ficam bloqueadas),
+    com `pausa` segundos entre janelas para não competir com a ingestão.
+    """
+    estado = _backfill_relatorio
+    try:
+        with app.app_context():
+            janelas = _janelas_relatorios()
+            for modelo in MODELOS_INDEXADOS:
+                tabela = modelo.__table__
+                progresso = {'relatorios': len(janelas), 'relatorios_concluidos': 0, 'janelas': 0, 'linhas': 0}
+                estado['tabelas'][tabela.name] = progresso
+                
+                for relatorio_number, inicio, fim in janelas:
+                    atual = inicio
+                    while True:
+                        proximo = min(atual + passo, fim)
+                        resultado = db.session.execute(
+                            update(tabela)
+                            .where(
+                                tabela.c.relatorio_number.is_(None),
+                                tabela.c.criado_em >= atual,
+                                tabela.c.criado_em <= proximo
+                            )
+                            .values(relatorio_number=relatorio_number)
+                        )
+                        db.session.commit()
+                        progresso['janelas'] += 1
+                        progresso['linhas'] += resultado.rowcount
+                        if proximo >= fim:
+                            break
+                        atual = proximo
+                        if pausa:
+                            time.sleep(pausa)
+                    progresso['relatorios_concluidos'] += 1
+                logging.info(f"Backfill de relatorio_number em {tabela.name}: {progresso['linhas']} linhas")
+            
+            if db.engine.dialect.name == 'postgresql':
+                # VALIDATE CONSTRAINT varre a tabela sem bloquear INSERT/UPDATE
+                for modelo in MODELOS_INDEXADOS:
+                    db.session.execute(text(
+                        f"ALTER TABLE {modelo.__tablename__} VALIDATE CONSTRAINT {modelo.__tablename__}_relatorio_number_fkey"
+                    ))
+                    db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Erro no backfill de relatorio_number: {e}")
+        estado['erro'] = str(e)
+    finally:
+        estado['em_andamento'] = False
+        estado['fim'] = datetime.utcnow().isoformat()
+
+@migration_bp.route('/migration/backfill-relatorio', methods=['POST'])
+def backfill_relatorio():
+    """
+    Preenche relatorio_number das linhas antigas em segundo plano, pelo intervalo de cada relatório.
+    Corpo opcional: {"passo_minutos": 5, "pausa_segundos": 0.1}. Linhas já atribuídas são mantidas,
+    então pode ser executado de novo com segurança. Acompanhe por GET /migration/backfill-relatorio.
+    """
+    dados = request.get_json(silent=True) or {}
+    try:
+        passo = timedelta(minutes=float(dados.get('passo_minutos', 5)))
+        pausa = float(dados.get('pausa_segundos', 0.1))
+        if passo.total_seconds() <= 0 or pausa < 0:
+            raise ValueError('passo_minutos deve ser positivo e pausa_segundos não negativa')
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Parâmetros inválidos: {str(e)}'}), 400
+    
+    with _lock_backfill:
+        if _backfill_relatorio['em_andamento']:
+            return jsonify({
+                'success': True,
+                'message': 'Backfill já em andamento',
+                'action': 'nenhuma',
+                'backfill': _backfill_relatorio
+            }), 200
+        _backfill_relatorio.update({
+            'em_andamento': True,
+            'inicio': datetime.utcnow().isoformat(),
+            'fim': None,
+            'tabelas': {},
+            'erro': None
+        })
+    
+    threading.Thread(
+        target=_executar_backfill,
+        args=(current_app._get_current_object(), passo, pausa),
+        name='uwb-backfill-relatorio',
+        daemon=True
+    ).start()
+    
+    return jsonify({
+        'success': True,
+        'message': 'Backfill de relatorio_number iniciado',
+        'action': 'backfill_iniciado'
+    }), 202
+
+@migration_bp.route('/migration/backfill-relatorio', methods=['GET'])
+def backfill_relatorio_status():
+    """Progresso do backfill de relatorio_number neste worker e linhas ainda sem relatório"""
+    try:
+        pendentes = {
+            modelo.__tablename__: modelo.query.filter(modelo.relatorio_number.is_(None)).count()
+            for modelo in MODELOS_INDEXADOS
+        }
+        return jsonify({
+            'success': True,
+            'backfill': _backfill_relatorio,
+            'linhas_sem_relatorio': pendentes
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Erro ao verificar backfill: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Erro ao verificar backfill: {str(e)}'
+        }), 500
+
 @migration_bp.route('/migration/health', methods=['GET'])
 def migration_health():
     """Health check para o módulo de migração"""
@@ -122,6 +501,11 @@ def migration_health():
             'POST /api/migration/create-relatorio-table - Criar tabela relatorio',
             'GET /api/migration/check-tables - Verificar tabelas existentes',
             'POST /api/migration/reset-relatorio-table - Recriar tabela relatorio (PERIGOSO)',
+            'POST /api/migration/create-indexes - Criar índices das tabelas distancias_* (em segundo plano)',
+            'GET /api/migration/indexes - Estado e progresso dos índices',
+            'POST /api/migration/add-relatorio-column - Adicionar relatorio_number às tabelas distancias_*',
+            'POST /api/migration/backfill-relatorio - Preencher relatorio_number das linhas antigas (em segundo plano)',
+            'GET /api/migration/backfill-relatorio - Progresso do backfill',
             'GET /api/migration/health - Health check'
         ],
         'warning': 'Use os endpoints de migração com cuidado em produção'
@@ -0,0 +1,91 @@
+from flask import Blueprint, jsonify, request, send_file
+from src.services.perfilador import (
+    perfilador, listar_perfis, caminho_perfil, SEGREDO, CABECALHO, DIRETORIO, MAX_ARQUIVOS, JANELA_MAXIMA_S
+)
+from functools import wraps
+import logging
+import pstats
+import io
+import os
+
+perfilador_bp = Blueprint('perfilador', __name__)
+
+# Perfis cProfile das requisições (.pstats). Todas as rotas exigem o cabeçalho X-UWB-Profile com o
+# segredo (UWB_PROFILER_SEGREDO); sem o segredo configurado respondem 404.
+
+def _protegido(funcao):
+    @wraps(funcao)
+    def verificar(*args, **kwargs):
+        if SEGREDO is None:
+            return jsonify({'error': 'Perfilador desabilitado'}), 404
+        if not perfilador.segredo_valido(request.headers.get(CABECALHO)):
+            return jsonify({'error': 'Não autorizado'}), 403
+        return funcao(*args, **kwargs)
+    return verificar
+
+def _estado():
+    return {
+        'pid': os.getpid(),
+        'amostragem': perfilador.amostragem,
+        'janela_restante_segundos': round(perfilador.janela_restante(), 1),
+        'diretorio': DIRETORIO,
+        'max_arquivos': MAX_ARQUIVOS
+    }
+
+@perfilador_bp.route('/perfilador/perfis', methods=['GET'])
+@_protegido
+def listar():
+    """Perfis gravados (de todos os workers), do mais recente ao mais antigo, e o estado deste worker"""
+    try:
+        return jsonify({'perfilador': _estado(), 'perfis': listar_perfis()}), 200
+    except Exception as e:
+        logging.error(f"Erro ao listar perfis: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@perfilador_bp.route('/perfilador/perfis/<nome>', methods=['GET'])
+@_protegido
+def baixar(nome):
+    """
+    Um perfil .pstats (python -m pstats <arquivo>, snakeviz)
+    ?formato=texto: as 40 funções com maior tempo acumulado (ordenar=cumulative|tottime|calls)
+    """
+    try:
+        caminho = caminho_perfil(nome)
+        if caminho is None:
+            return jsonify({'error': 'Perfil não encontrado'}), 404
+        if request.args.get('formato') != 'texto':
+            return send_file(caminho, mimetype='application/octet-stream', as_attachment=True, download_name=nome)
+
+        ordenar = request.args.get('ordenar', 'cumulative')
+        if ordenar not in ('cumulative', 'tottime', 'calls'):
+            return jsonify({'error': 'ordenar deve ser cumulative, tottime ou calls'}), 400
+        saida = io.StringIO()
+        pstats.Stats(caminho, stream=saida).strip_dirs().sort_stats(ordenar).print_stats(40)
+        return saida.getvalue(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    except Exception as e:
+        logging.error(f"Erro ao baixar perfil: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@perfilador_bp.route('/perfilador/janela', methods=['POST'])
+@_protegido
+def janela():
+    """
+    Perfila todas as requisições do worker que receber esta chamada pelos próximos N segundos
+    Corpo: {"segundos": 30} (máximo 300; 0 encerra a janela)
+    """
+    dados = request.get_json(silent=True) or {}
+    try:
+        segundos = float(dados.get('segundos', 30))
+        if segundos < 0:
+            raise ValueError('segundos não pode ser negativo')
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Parâmetros inválidos: {str(e)}'}), 400
+
+    segundos = perfilador.abrir_janela(segundos)
+    logging.info(f"Perfilador: janela de {segundos:.0f}s no worker {os.getpid()}")
+    return jsonify({
+        'success': True,
+        'message': f'Janela de {segundos:.0f}s aberta' if segundos else 'Janela encerrada',
+        'janela_maxima_segundos': JANELA_MAXIMA_S,
+        'perfilador': _estado()
+    }), 200
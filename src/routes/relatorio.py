@@ -1,5 +1,16 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file
 from src.models.relatorio import Relatorio, db
+from src.routes.uwb import trilateracao
+from src.services.cache_posicoes import cache_posicoes
+from src.services.cache_relatorio import cache_relatorio
+from src.services.fila_ingestao import fila_ingestao
+from src.services.resumo_relatorio import obter_resumo, resumir_ao_finalizar, formatar_resumo
+from src.models.resumo_relatorio import ResumoRelatorio
+from src.services.consulta import MODELOS_CONSULTA
+from src.services.exportacao import gerar_exportacao, FORMATOS_EXPORTACAO
+from src.services.exportacao_colunar import gerar_arquivo_colunar, formato_colunar_padrao, FORMATOS_COLUNARES
+from src.services.trajetoria import obter_trajetorias, NIVEIS_LOD, MAX_PONTOS_PADRAO
+import os
 from datetime import datetime
 import logging
 
@@ -41,6 +52,11 @@ def iniciar_relatorio():
         db.session.add(novo_relatorio)
         db.session.commit()
         
+        # Novo kx/ky invalida a geometria em cache da trilateração
+        trilateracao.atualizar_layout(novo_relatorio.kx or None, novo_relatorio.ky or None)
+        cache_posicoes.limpar()
+        cache_relatorio.invalidar()
+        
         logging.info(f"Novo relatório iniciado: ID {novo_relatorio.relatorio_number}, Kx={kx_value}, Ky={ky_value}")
         
         return jsonify({
@@ -62,6 +78,10 @@ def finalizar_relatorio():
     Chamado quando o botão flash é pressionado novamente
     """
     try:
+        # Leituras já aceitas pela fila de ingestão são gravadas no relatório antes de fechá-lo
+        if not fila_ingestao.esvaziar():
+            logging.warning("Fila de ingestão não esvaziou antes da finalização do relatório")
+        
         # Buscar relatório ativo (que tem inicio mas não tem fim)
         relatorio_ativo = Relatorio.query.filter(
             Relatorio.inicio_do_relatorio.isnot(None),
@@ -78,13 +98,17 @@ def finalizar_relatorio():
         relatorio_ativo.fim_do_relatorio = datetime.utcnow()
         
         db.session.commit()
+        cache_posicoes.limpar()
+        cache_relatorio.invalidar()
         
         logging.info(f"Relatório finalizado: ID {relatorio_ativo.relatorio_number}")
+        resumo = resumir_ao_finalizar(relatorio_ativo.relatorio_number)
         
         return jsonify({
             'success': True,
             'message': 'Relatório finalizado com sucesso',
             'relatorio': relatorio_ativo.to_dict(),
+            'resumo': resumo,
             'leituras_habilitadas': False
         }), 200
         
@@ -100,11 +124,8 @@ def status_relatorio():
     Usado pelo ESP32 para saber se deve fazer leituras
     """
     try:
-        # Buscar relatório ativo (que tem inicio mas não tem fim)
-        relatorio_ativo = Relatorio.query.filter(
-            Relatorio.inicio_do_relatorio.isnot(None),
-            Relatorio.fim_do_relatorio.is_(None)
-        ).first()
+        # Relatório ativo em cache (invalidado ao iniciar/finalizar, com TTL curto entre workers)
+        relatorio_ativo = cache_relatorio.obter()
         
         if relatorio_ativo:
             return jsonify({
@@ -127,13 +148,25 @@ def status_relatorio():
 def historico_relatorios():
     """
     Endpoint para recuperar histórico de relatórios
+    Com ?resumo=1, inclui o resumo materializado de cada relatório (uma única consulta, sem recalcular)
     """
     try:
         limit = request.args.get('limit', 50, type=int)
         relatorios = Relatorio.query.order_by(Relatorio.relatorio_number.desc()).limit(limit).all()
+        dados = [relatorio.to_dict() for relatorio in relatorios]
+        
+        if request.args.get('resumo') in ('1', 'true'):
+            por_relatorio = {}
+            for resumo in ResumoRelatorio.query.filter(
+                ResumoRelatorio.relatorio_number.in_([r.relatorio_number for r in relatorios])
+            ).order_by(ResumoRelatorio.tag_number):
+                por_relatorio.setdefault(resumo.relatorio_number, []).append(resumo)
+            for item in dados:
+                resumos = por_relatorio.get(item['relatorio_number'])
+                item['resumo'] = formatar_resumo(resumos) if resumos else None
         
         return jsonify({
-            'relatorios': [relatorio.to_dict() for relatorio in relatorios],
+            'relatorios': dados,
             'total': len(relatorios)
         }), 200
         
@@ -145,6 +178,8 @@ def historico_relatorios():
 def obter_relatorio(relatorio_number):
     """
     Endpoint para obter detalhes de um relatório específico
+    Inclui o resumo por tag (distância, duração, velocidades, amostras), gravado ao finalizar.
+    ?recalcular=1 refaz o resumo (num relatório ativo, calcula sem gravar)
     """
     try:
         relatorio = Relatorio.query.get(relatorio_number)
@@ -152,14 +187,126 @@ def obter_relatorio(relatorio_number):
         if not relatorio:
             return jsonify({'error': 'Relatório não encontrado'}), 404
         
+        recalcular = request.args.get('recalcular') in ('1', 'true')
         return jsonify({
-            'relatorio': relatorio.to_dict()
+            'relatorio': relatorio.to_dict(),
+            'resumo': obter_resumo(relatorio, recalcular=recalcular)
         }), 200
         
     except Exception as e:
         logging.error(f"Erro ao obter relatório: {e}")
         return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
+@relatorio_bp.route('/relatorio/<int:relatorio_number>/export', methods=['GET'])
+def exportar_relatorio(relatorio_number):
+    """
+    Exporta as leituras de um relatório em fluxo (memória constante, qualquer tamanho de relatório)
+    - format=csv|ndjson, kind=raw|processed|rssi
+    - format=parquet|npz (ou columnar: parquet se houver pyarrow, senão npz): arquivo colunar,
+      em cache no disco para relatórios finalizados
+    - gzip=1: arquivo .gz comprimido durante o envio
+    - offset=N: retoma após as N primeiras linhas (ordem por id); limit=N: no máximo N linhas
+    Uma exportação interrompida pode ser retomada com offset = linhas já recebidas (ou baixada em partes com offset/limit).
+    """
+    try:
+        formato = request.args.get('format', 'csv').lower()
+        tipo = request.args.get('kind', 'processed').lower()
+        if formato == 'columnar':
+            formato = formato_colunar_padrao()
+        offset = request.args.get('offset', 0, type=int)
+        limite = request.args.get('limit', type=int)
+        comprimir = request.args.get('gzip') in ('1', 'true')
+        
+        if formato not in FORMATOS_EXPORTACAO and formato not in FORMATOS_COLUNARES:
+            return jsonify({'error': f'Formato inválido: {formato}. Use csv, ndjson, parquet, npz ou columnar'}), 400
+        if tipo not in MODELOS_CONSULTA:
+            return jsonify({'error': f'Tipo inválido: {tipo}. Use raw, processed ou rssi'}), 400
+        if offset < 0 or (limite is not None and limite <= 0):
+            return jsonify({'error': 'offset deve ser >= 0 e limit > 0'}), 400
+        
+        relatorio = Relatorio.query.get(relatorio_number)
+        if not relatorio:
+            return jsonify({'error': 'Relatório não encontrado'}), 404
+        
+        if formato == 'parquet' and formato_colunar_padrao() != 'parquet':
+            return jsonify({'error': 'Parquet indisponível (pyarrow não instalado); use format=npz'}), 400
+        if formato in FORMATOS_COLUNARES:
+            caminho, temporario = gerar_arquivo_colunar(
+                MODELOS_CONSULTA[tipo], relatorio_number, formato,
+                finalizado=relatorio.fim_do_relatorio is not None
+            )
+            resposta = send_file(
+                caminho,
+                mimetype=FORMATOS_COLUNARES[formato],
+                as_attachment=True,
+                download_name=f'relatorio_{relatorio_number}_{tipo}.{formato}'
+            )
+            if temporario:
+                resposta.call_on_close(lambda: os.remove(caminho))
+            return resposta
+        
+        nome = f'relatorio_{relatorio_number}_{tipo}.{formato}' + ('.gz' if comprimir else '')
+        conteudo = gerar_exportacao(
+            MODELOS_CONSULTA[tipo], relatorio_number,
+            formato=formato, offset=offset, limite=limite, gzip=comprimir
+        )
+        return Response(
+            stream_with_context(conteudo),
+            mimetype='application/gzip' if comprimir else FORMATOS_EXPORTACAO[formato],
+            headers={
+                'Content-Disposition': f'attachment; filename="{nome}"',
+                'X-Export-Offset': str(offset),
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        logging.error(f"Erro ao exportar relatório: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@relatorio_bp.route('/relatorio/<int:relatorio_number>/trajetoria', methods=['GET'])
+def trajetoria_relatorio(relatorio_number):
+    """
+    Trajetória simplificada (Ramer–Douglas–Peucker) de cada tag do relatório, para plotagem
+    - epsilon=N: tolerância em cm (desvio máximo dos pontos descartados)
+    - max_pontos=N: no máximo N pontos por tag, os mais importantes
+    - lod=0..3: nível de detalhe pré-definido (NIVEIS_LOD pontos por tag)
+    - tag=N: apenas uma tag
+    Sem parâmetros, max_pontos=MAX_PONTOS_PADRAO. Relatórios finalizados ficam em cache.
+    """
+    try:
+        epsilon = request.args.get('epsilon', type=float)
+        max_pontos = request.args.get('max_pontos', type=int)
+        lod = request.args.get('lod', type=int)
+        tag = request.args.get('tag')
+        
+        if epsilon is not None and epsilon < 0:
+            return jsonify({'error': 'epsilon deve ser >= 0'}), 400
+        if max_pontos is not None and max_pontos < 2:
+            return jsonify({'error': 'max_pontos deve ser >= 2'}), 400
+        if lod is not None:
+            if not 0 <= lod < len(NIVEIS_LOD):
+                return jsonify({'error': f'lod deve estar entre 0 e {len(NIVEIS_LOD) - 1}'}), 400
+            max_pontos = NIVEIS_LOD[lod]
+        if epsilon is None and max_pontos is None:
+            max_pontos = MAX_PONTOS_PADRAO
+        
+        relatorio = Relatorio.query.get(relatorio_number)
+        if not relatorio:
+            return jsonify({'error': 'Relatório não encontrado'}), 404
+        
+        return jsonify({
+            'relatorio_number': relatorio_number,
+            'epsilon': epsilon,
+            'max_pontos': max_pontos,
+            'niveis_lod': list(NIVEIS_LOD),
+            'tags': obter_trajetorias(relatorio, tag=tag, epsilon=epsilon, max_pontos=max_pontos)
+        }), 200
+        
+    except Exception as e:
+        logging.error(f"Erro ao obter trajetória do relatório: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
 @relatorio_bp.route('/relatorio/health', methods=['GET'])
 def health_check_relatorio():
     """Health check específico para o módulo de relatórios"""
@@ -188,7 +335,8 @@ def health_check_relatorio():
                 '/api/relatorio/finalizar', 
                 '/api/relatorio/status',
                 '/api/relatorio/historico',
-                '/api/relatorio/<relatorio_number>'
+                '/api/relatorio/<relatorio_number>',
+                '/api/relatorio/<relatorio_number>/export'
             ],
             'timestamp': datetime.utcnow().isoformat()
         }), 200
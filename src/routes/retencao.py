@@ -0,0 +1,148 @@
+from flask import Blueprint, jsonify, request, current_app, Response
+from src.models.user import db
+from src.models.arquivo_leituras import ArquivoLeituras
+from src.services.retencao import (
+    planejar_retencao, executar_retencao, tamanho_tabelas, RETENCAO_DIAS, TAMANHO_LOTE_RETENCAO
+)
+from datetime import datetime
+import threading
+import logging
+import click
+import json
+
+retencao_bp = Blueprint('retencao', __name__, cli_group='retencao')
+
+# Leituras brutas (distancias_uwb) de relatórios finalizados há mais de N dias são movidas, em blocos
+# comprimidos, para distancias_uwb_arquivo. Posições processadas, resumos e agregados são mantidos.
+
+_retencao = {'em_andamento': False, 'inicio': None, 'fim': None, 'parametros': None, 'resultado': {}, 'erro': None}
+_lock_retencao = threading.Lock()
+
+def _parametros(dados):
+    dias = float(dados.get('dias', RETENCAO_DIAS))
+    lote = int(dados.get('tamanho_lote', TAMANHO_LOTE_RETENCAO))
+    pausa = float(dados.get('pausa_segundos', 0.1))
+    if dias < 0 or lote <= 0 or pausa < 0:
+        raise ValueError('dias e pausa_segundos não podem ser negativos e tamanho_lote deve ser positivo')
+    return dias, lote, pausa
+
+def _executar(app, dias, lote, pausa, vacuum):
+    try:
+        with app.app_context():
+            executar_retencao(dias, lote, pausa, vacuum, estado=_retencao['resultado'])
+    except Exception as e:
+        with app.app_context():
+            db.session.rollback()
+        logging.error(f"Erro na retenção de leituras: {e}")
+        _retencao['erro'] = str(e)
+    finally:
+        _retencao['em_andamento'] = False
+        _retencao['fim'] = datetime.utcnow().isoformat()
+
+@retencao_bp.route('/retencao/executar', methods=['POST'])
+def executar():
+    """
+    Arquiva as leituras brutas dos relatórios finalizados há mais de `dias` (padrão UWB_RETENCAO_DIAS)
+    Corpo opcional: {"dias": 90, "tamanho_lote": 5000, "pausa_segundos": 0.1, "simular": false, "vacuum": true}
+    - simular=true: apenas lista relatórios, linhas e espaço estimado (nada é alterado)
+    - senão executa em segundo plano; acompanhe por GET /retencao/status
+    """
+    dados = request.get_json(silent=True) or {}
+    try:
+        dias, lote, pausa = _parametros(dados)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Parâmetros inválidos: {str(e)}'}), 400
+
+    if dados.get('simular'):
+        try:
+            return jsonify({'success': True, 'simulacao': planejar_retencao(dias)}), 200
+        except Exception as e:
+            logging.error(f"Erro na simulação da retenção: {e}")
+            return jsonify({'success': False, 'error': f'Erro na simulação: {str(e)}'}), 500
+
+    with _lock_retencao:
+        if _retencao['em_andamento']:
+            return jsonify({
+                'success': True,
+                'message': 'Retenção já em andamento',
+                'action': 'nenhuma',
+                'retencao': _retencao
+            }), 200
+        _retencao.update({
+            'em_andamento': True,
+            'inicio': datetime.utcnow().isoformat(),
+            'fim': None,
+            'parametros': {'dias': dias, 'tamanho_lote': lote, 'pausa_segundos': pausa},
+            'resultado': {},
+            'erro': None
+        })
+
+    threading.Thread(
+        target=_executar,
+        args=(current_app._get_current_object(), dias, lote, pausa, bool(dados.get('vacuum', True))),
+        name='uwb-retencao',
+        daemon=True
+    ).start()
+
+    return jsonify({
+        'success': True,
+        'message': 'Retenção iniciada',
+        'action': 'retencao_iniciada'
+    }), 202
+
+@retencao_bp.route('/retencao/status', methods=['GET'])
+def status():
+    """Progresso da última retenção neste worker e espaço atual das tabelas"""
+    try:
+        return jsonify({
+            'success': True,
+            'retencao': _retencao,
+            'tabelas': tamanho_tabelas()
+        }), 200
+    except Exception as e:
+        logging.error(f"Erro ao verificar retenção: {e}")
+        return jsonify({'success': False, 'error': f'Erro ao verificar retenção: {str(e)}'}), 500
+
+@retencao_bp.route('/retencao/arquivo/<int:relatorio_number>', methods=['GET'])
+def listar_arquivo(relatorio_number):
+    """Blocos arquivados das leituras brutas de um relatório"""
+    try:
+        partes = ArquivoLeituras.query.filter_by(relatorio_number=relatorio_number).order_by(ArquivoLeituras.parte).all()
+        return jsonify({
+            'relatorio_number': relatorio_number,
+            'linhas': sum(parte.linhas for parte in partes),
+            'partes': [parte.to_dict() for parte in partes]
+        }), 200
+    except Exception as e:
+        logging.error(f"Erro ao listar arquivo: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@retencao_bp.route('/retencao/arquivo/<int:relatorio_number>/<int:parte>', methods=['GET'])
+def baixar_arquivo(relatorio_number, parte):
+    """Um bloco arquivado como .npz (numpy.load); tag_number vem como índices em tag_number_categorias"""
+    try:
+        arquivo = ArquivoLeituras.query.filter_by(relatorio_number=relatorio_number, parte=parte).first()
+        if not arquivo:
+            return jsonify({'error': 'Parte não encontrada'}), 404
+        return Response(
+            arquivo.dados,
+            mimetype='application/octet-stream',
+            headers={'Content-Disposition': f'attachment; filename=relatorio_{relatorio_number}_bruto_{parte}.npz'}
+        )
+    except Exception as e:
+        logging.error(f"Erro ao baixar arquivo: {e}")
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
+
+@retencao_bp.cli.command('executar')
+@click.option('--dias', type=float, default=RETENCAO_DIAS, show_default=True, help='Idade mínima desde a finalização')
+@click.option('--tamanho-lote', type=int, default=TAMANHO_LOTE_RETENCAO, show_default=True)
+@click.option('--pausa', type=float, default=0.1, show_default=True, help='Segundos entre blocos')
+@click.option('--simular', is_flag=True, help='Apenas mostra o que seria arquivado')
+@click.option('--sem-vacuum', is_flag=True, help='Não executa VACUUM ao final (PostgreSQL)')
+def executar_comando(dias, tamanho_lote, pausa, simular, sem_vacuum):
+    """Arquiva as leituras brutas antigas (flask --app src.main retencao executar --simular)"""
+    if simular:
+        resultado = planejar_retencao(dias)
+    else:
+        resultado = executar_retencao(dias, tamanho_lote, pausa, vacuum=not sem_vacuum)
+    click.echo(json.dumps(resultado, indent=2, default=str))
@@ -1,15 +1,37 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response
 from src.models.uwb_data import UWBData, UWBDataProcessada, db
 from src.models.relatorio import Relatorio
 from datetime import datetime
 from src.models.uwb_rssi import UWBDataRSSI
+from src.services.cache_posicoes import cache_posicoes, UltimaPosicao
+from src.services.cache_relatorio import cache_relatorio
+from src.services.rastreamento import log_uwb, log_ingestao, log_solver, amostrador, buffer_traces, trace
+from src.services.fila_ingestao import fila_ingestao, INGESTAO_ASSINCRONA
+from src.services.stream_posicoes import publicador_posicoes
+from src.services.consulta import consultar_pagina, interpretar_data, ErroConsulta, MODELOS_CONSULTA
+from src.services.agregados import atualizar_agregados
+from src.services.resumo_relatorio import atualizar_resumos
+from src.services.metricas import medir, contar_caminho, contar_resultados
 import numpy as np
 import math
 import logging
 import json
+import threading
+import time
+import io
+import os
+from collections import OrderedDict
+from sqlalchemy import insert, text
 # No topo do seu arquivo uwb_bp.py
 MOVIMENTO_MINIMO_CM = 5.0 
 
+# Perfis de resposta da ingestão (query param ?perfil=, header X-UWB-Perfil ou padrão do servidor)
+# - minimal: apenas status e posição de cada item
+# - standard: resposta completa sem debug_info
+# - debug: resposta completa, com debug_info e eco dos dados recebidos em caso de erro
+PERFIS_RESPOSTA = ('minimal', 'standard', 'debug')
+PERFIL_RESPOSTA_PADRAO = os.environ.get('UWB_PERFIL_RESPOSTA', 'debug')
+
 
 uwb_bp = Blueprint('uwb', __name__)
 
@@ -19,7 +41,7 @@ class TrilateracaoUWB:
     Integrada diretamente na API para melhor performance
     """
     
-    def __init__(self):
+    def __init__(self, tamanho_cache_geometria=512):
         # Coordenadas das âncoras serão definidas dinamicamente com base em kx e ky
         # Valores padrão caso kx e ky não estejam disponíveis
         self.ancoras_padrao = {
@@ -32,6 +54,15 @@ class TrilateracaoUWB:
             'da6': (0, 57),     # Âncora 6: opcional
             'da7': (114, 57)    # Âncora 7: opcional
         }
+        
+        # Cache de geometria por (kx, ky, máscara de âncoras válidas):
+        # guarda os índices das âncoras, a pseudo-inversa de A e a parte constante de b,
+        # de modo que cada solução vira um único produto matriz-vetor
+        self._cache_geometria = OrderedDict()
+        self._cache_ancoras = {}
+        self._tamanho_cache_geometria = tamanho_cache_geometria
+        self._layout_atual = None
+        self._lock_geometria = threading.Lock()
     
     def obter_coordenadas_ancoras(self, kx=None, ky=None):
         """
@@ -59,24 +90,76 @@ class TrilateracaoUWB:
                 ancoras['da6'] = (0, ky_float/2)
                 ancoras['da7'] = (kx_float, ky_float/2)
                 
-                logging.info(f"[DEBUG] Coordenadas das âncoras atualizadas com kx={kx_float}, ky={ky_float}")
-                logging.info(f"[DEBUG] Âncora 0: {ancoras['da0']}, Âncora 1: {ancoras['da1']}, Âncora 2: {ancoras['da2']}")
+                log_solver.debug("Coordenadas das âncoras atualizadas com kx=%s, ky=%s", kx_float, ky_float)
+                log_solver.debug("Âncora 0: %s, Âncora 1: %s, Âncora 2: %s", ancoras['da0'], ancoras['da1'], ancoras['da2'])
                 
             except (ValueError, TypeError) as e:
-                logging.warning(f"[DEBUG] Erro ao converter kx={kx} ou ky={ky} para float: {e}. Usando valores padrão.")
+                log_solver.warning("Erro ao converter kx=%s ou ky=%s para float: %s. Usando valores padrão.", kx, ky, e)
         else:
-            logging.info("[DEBUG] kx ou ky não fornecidos, usando coordenadas padrão das âncoras")
+            log_solver.debug("kx ou ky não fornecidos, usando coordenadas padrão das âncoras")
         
         return ancoras
     
+    def atualizar_layout(self, kx=None, ky=None):
+        """
+        Informa o kx/ky do relatório que está começando.
+        Se o layout das âncoras mudou, descarta o cache de geometria.
+        """
+        with self._lock_geometria:
+            if self._layout_atual != (kx, ky):
+                log_solver.info("Layout das âncoras alterado para kx=%s, ky=%s. Limpando cache de geometria.", kx, ky)
+                self._cache_geometria.clear()
+                self._cache_ancoras.clear()
+                self._layout_atual = (kx, ky)
+    
+    def _obter_ancoras(self, kx=None, ky=None):
+        """Coordenadas das 8 âncoras (da0..da7) como matriz (8, 2), em cache por kx/ky"""
+        chave = (kx, ky)
+        ancoras = self._cache_ancoras.get(chave)
+        if ancoras is None:
+            coordenadas = self.obter_coordenadas_ancoras(kx, ky)
+            ancoras = np.array([coordenadas[f'da{i}'] for i in range(8)], dtype=float)
+            with self._lock_geometria:
+                self._cache_ancoras[chave] = ancoras
+        return ancoras
+    
+    def _obter_geometria(self, mascara: int, kx=None, ky=None) -> tuple:
+        """
+        Retorna (índices, matriz, constante) para a máscara de âncoras válidas (bit i = âncora dai).
+        Posição = matriz @ (r[1:]**2 - r[0]**2 + constante), com r na ordem dos índices.
+        Cache LRU limitado a tamanho_cache_geometria entradas.
+        """
+        chave = (kx, ky, mascara)
+        with self._lock_geometria:
+            geometria = self._cache_geometria.get(chave)
+            if geometria is not None:
+                self._cache_geometria.move_to_end(chave)
+                return geometria
+        
+        indices = np.array([i for i in range(8) if mascara >> i & 1])
+        ancoras_validas = self._obter_ancoras(kx, ky)[indices]
+        x0, y0 = ancoras_validas[0]
+        xi, yi = ancoras_validas[1:, 0], ancoras_validas[1:, 1]
+        
+        A = np.column_stack((2 * (xi - x0), 2 * (yi - y0)))
+        matriz = np.linalg.pinv(A)
+        constante = -xi**2 + x0**2 - yi**2 + y0**2
+        geometria = (indices, matriz, constante)
+        
+        with self._lock_geometria:
+            self._cache_geometria[chave] = geometria
+            if len(self._cache_geometria) > self._tamanho_cache_geometria:
+                self._cache_geometria.popitem(last=False)
+        return geometria
+    
     def calcular_trilateracao_basica(self, da0: float, da1: float, da2: float, kx=None, ky=None) -> tuple:
         """Trilateração básica com 3 âncoras principais usando coordenadas dinâmicas"""
         try:
-            logging.info(f"[DEBUG] Iniciando trilateração básica com da0={da0}, da1={da1}, da2={da2}")
+            log_solver.debug("Iniciando trilateração básica com da0=%s, da1=%s, da2=%s", da0, da1, da2)
             
             # Verificar distâncias válidas
             if da0 <= 0 or da1 <= 0 or da2 <= 0:
-                logging.warning(f"[DEBUG] Distâncias inválidas detectadas: da0={da0}, da1={da1}, da2={da2}")
+                log_solver.warning("Distâncias inválidas detectadas: da0=%s, da1=%s, da2=%s", da0, da1, da2)
                 return 57.0, 57.0
             
             # Obter coordenadas das âncoras
@@ -87,7 +170,7 @@ class TrilateracaoUWB:
             x1, y1 = ancoras['da1']  # (kx, 0)
             x2, y2 = ancoras['da2']  # (0, ky)
             
-            logging.info(f"[DEBUG] Coordenadas das âncoras: A0=({x0},{y0}), A1=({x1},{y1}), A2=({x2},{y2})")
+            log_solver.debug("Coordenadas das âncoras: A0=(%s,%s), A1=(%s,%s), A2=(%s,%s)", x0, y0, x1, y1, x2, y2)
             
             # Raios
             r0, r1, r2 = da0, da1, da2
@@ -101,85 +184,72 @@ class TrilateracaoUWB:
             E = 2 * (y2 - y0)  # 2 * (ky - 0) = 2 * ky
             F = r0**2 - r2**2 + x2**2 - x0**2 + y2**2 - y0**2  # r0² - r2² + ky²
             
-            logging.info(f"[DEBUG] Coeficientes do sistema: A={A}, B={B}, C={C}, D={D}, E={E}, F={F}")
+            log_solver.debug("Coeficientes do sistema: A=%s, B=%s, C=%s, D=%s, E=%s, F=%s", A, B, C, D, E, F)
             
             # Resolver o sistema:
             if A != 0:  # Se kx != 0
                 x = C / A  # x = (r0² - r1² + kx²) / (2*kx)
             else:
                 x = 57.0  # Valor padrão se kx = 0
-                logging.warning("[DEBUG] A=0, usando valor padrão x=57.0")
+                log_solver.warning("A=0, usando valor padrão x=57.0")
             
             if E != 0:  # Se ky != 0
                 y = F / E  # y = (r0² - r2² + ky²) / (2*ky)
             else:
                 y = 57.0  # Valor padrão se ky = 0
-                logging.warning("[DEBUG] E=0, usando valor padrão y=57.0")
+                log_solver.warning("E=0, usando valor padrão y=57.0")
             
-            logging.info(f"[DEBUG] Trilateração básica resultado: x={x:.2f}, y={y:.2f}")
+            log_solver.debug("Trilateração básica resultado: x=%.2f, y=%.2f", x, y)
             return x, y
             
         except Exception as e:
-            logging.error(f"[DEBUG] Erro na trilateração básica: {e}")
+            log_solver.error("Erro na trilateração básica: %s", e)
             return 57.0, 57.0
     
     def calcular_minimos_quadrados(self, distancias: dict, kx=None, ky=None) -> tuple:
         """Mínimos quadrados com todas as âncoras disponíveis usando coordenadas dinâmicas"""
         try:
-            logging.info(f"[DEBUG] Iniciando mínimos quadrados com {len(distancias)} âncoras")
-            
-            # Obter coordenadas das âncoras
-            ancoras = self.obter_coordenadas_ancoras(kx, ky)
-            
-            # Filtrar âncoras válidas
-            ancoras_validas = []
-            distancias_validas = []
+            log_solver.debug("Iniciando mínimos quadrados com %s âncoras", len(distancias))
             
+            # Filtrar âncoras válidas (máscara com bit i para a âncora dai)
+            mascara = 0
             for ancora_id, distancia in distancias.items():
-                if (ancora_id in ancoras and 
+                if (ancora_id in self.ancoras_padrao and 
                     distancia is not None and 
                     distancia > 0):
-                    ancoras_validas.append(ancoras[ancora_id])
-                    distancias_validas.append(distancia)
-                    logging.info(f"[DEBUG] Âncora válida {ancora_id}: coord={ancoras[ancora_id]}, dist={distancia}")
+                    mascara |= 1 << int(ancora_id[2:])
+                    log_solver.debug("Âncora válida %s: dist=%s", ancora_id, distancia)
                 else:
-                    logging.warning(f"[DEBUG] Âncora inválida {ancora_id}: dist={distancia}")
+                    log_solver.debug("Âncora inválida %s: dist=%s", ancora_id, distancia)
             
-            if len(ancoras_validas) < 3:
-                logging.warning(f"[DEBUG] Poucas âncoras válidas ({len(ancoras_validas)}), usando trilateração básica")
+            num_validas = bin(mascara).count('1')
+            if num_validas < 3:
+                log_solver.debug("Poucas âncoras válidas (%s), usando trilateração básica", num_validas)
+                contar_caminho('fallback')
                 # Fallback para trilateração básica
                 da0 = distancias.get('da0', 50)
                 da1 = distancias.get('da1', 50)
                 da2 = distancias.get('da2', 50)
                 return self.calcular_trilateracao_basica(da0, da1, da2, kx, ky)
             
-            # Método matricial dos mínimos quadrados
-            n = len(ancoras_validas)
-            x0, y0 = ancoras_validas[0]
-            r0 = distancias_validas[0]
+            # Método matricial dos mínimos quadrados (pseudo-inversa em cache por layout e máscara)
+            indices, matriz, constante = self._obter_geometria(mascara, kx, ky)
+            r = np.array([distancias[f'da{i}'] for i in indices], dtype=float)
+            b = r[1:]**2 - r[0]**2 + constante
             
-            A = np.zeros((n-1, 2))
-            b = np.zeros(n-1)
-            
-            for i in range(1, n):
-                xi, yi = ancoras_validas[i]
-                ri = distancias_validas[i]
-                
-                A[i-1, 0] = 2 * (xi - x0)
-                A[i-1, 1] = 2 * (yi - y0)
-                b[i-1] = ri**2 - r0**2 - xi**2 + x0**2 - yi**2 + y0**2
-            
-            logging.info(f"[DEBUG] Matriz A: {A}")
-            logging.info(f"[DEBUG] Vetor b: {b}")
+            log_solver.debug("Pseudo-inversa de A: %s", matriz)
+            log_solver.debug("Vetor b: %s", b)
             
             # Resolver usando pseudo-inversa
-            pos = np.linalg.pinv(A) @ b
+            pos = matriz @ b
             
-            logging.info(f"[DEBUG] Mínimos quadrados resultado: x={pos[0]:.2f}, y={pos[1]:.2f}")
+            log_solver.debug("Mínimos quadrados resultado: x=%.2f, y=%.2f", pos[0], pos[1])
+            contar_caminho('minimos_quadrados')
             return float(pos[0]), float(pos[1])
                 
         except Exception as e:
-            logging.error(f"[DEBUG] Erro nos mínimos quadrados: {e}")
+            log_solver.error("Erro nos mínimos quadrados: %s", e)
+            contar_caminho('fallback')
             # Fallback para trilateração básica
             da0 = distancias.get('da0', 50)
             da1 = distancias.get('da1', 50)
@@ -192,13 +262,13 @@ class TrilateracaoUWB:
         max_x = float(kx) if kx is not None else 114.0
         max_y = float(ky) if ky is not None else 114.0
         
-        logging.info(f"[DEBUG] Aplicando correção: entrada x={x:.2f}, y={y:.2f}, limites max_x={max_x}, max_y={max_y}")
+        log_solver.debug("Aplicando correção: entrada x=%.2f, y=%.2f, limites max_x=%s, max_y=%s", x, y, max_x, max_y)
         
         # Limitar à área física com margem de 2cm
         x_corrigido = max(2.0, min(max_x - 2.0, x))
         y_corrigido = max(2.0, min(max_y - 2.0, y))
         
-        logging.info(f"[DEBUG] Correção aplicada: saída x={x_corrigido:.2f}, y={y_corrigido:.2f}")
+        log_solver.debug("Correção aplicada: saída x=%.2f, y=%.2f", x_corrigido, y_corrigido)
         
         return x_corrigido, y_corrigido
     
@@ -208,7 +278,7 @@ class TrilateracaoUWB:
         Processa distâncias e retorna posição X,Y final
         Usa kx e ky para definir as coordenadas das âncoras 1 e 2
         """
-        logging.info(f"[DEBUG] Processando distâncias: da0={da0}, da1={da1}, da2={da2}, da3={da3}, da4={da4}, da5={da5}, da6={da6}, da7={da7}")
+        log_solver.debug("Processando distâncias: da0=%s, da1=%s, da2=%s, da3=%s, da4=%s, da5=%s, da6=%s, da7=%s", da0, da1, da2, da3, da4, da5, da6, da7)
         
         # Preparar dicionário de distâncias válidas
         distancias = {}
@@ -218,17 +288,18 @@ class TrilateracaoUWB:
             if valor is not None and valor > 0:
                 distancias[f'da{i}'] = valor
         
-        logging.info(f"[DEBUG] Distâncias válidas: {distancias}")
+        log_solver.debug("Distâncias válidas: %s", distancias)
         
         # Contar âncoras válidas
         num_ancoras = len(distancias)
         
         if num_ancoras >= 4:
-            logging.info(f"[DEBUG] Usando mínimos quadrados com {num_ancoras} âncoras")
+            log_solver.debug("Usando mínimos quadrados com %s âncoras", num_ancoras)
             # Usar mínimos quadrados para melhor precisão
             x, y = self.calcular_minimos_quadrados(distancias, kx, ky)
         else:
-            logging.info(f"[DEBUG] Usando trilateração básica com {num_ancoras} âncoras")
+            log_solver.debug("Usando trilateração básica com %s âncoras", num_ancoras)
+            contar_caminho('basica')
             # Usar trilateração básica
             da0_val = distancias.get('da0', 50)
             da1_val = distancias.get('da1', 50)
@@ -238,10 +309,85 @@ class TrilateracaoUWB:
         # Aplicar correções finais
         x_final, y_final = self.aplicar_correcao(x, y, kx, ky)
         
-        logging.info(f"[DEBUG] Posição final calculada: x={x_final:.2f}, y={y_final:.2f}")
+        log_solver.debug("Posição final calculada: x=%.2f, y=%.2f", x_final, y_final)
         
         return round(x_final, 2), round(y_final, 2)
 
+    def processar_lote(self, distancias, mascara=None, kx=None, ky=None):
+        """
+        Processa N leituras de uma só vez e retorna uma matriz (N, 2) com as posições X,Y finais
+        - distancias: matriz (N, 8) com da0..da7 (NaN onde não houver valor)
+        - mascara: matriz booleana (N, 8) opcional com as âncoras que podem ser usadas
+        Resultado idêntico a chamar processar_distancias linha a linha (mesmos caminhos e mesma correção)
+        """
+        d = np.asarray(distancias, dtype=float).reshape(-1, 8)
+        with np.errstate(invalid='ignore'):
+            validas = np.isfinite(d) & (d > 0)
+        if mascara is not None:
+            validas &= np.asarray(mascara, dtype=bool).reshape(-1, 8)
+
+        n = d.shape[0]
+        posicoes = np.empty((n, 2))
+        if n == 0:
+            return posicoes
+
+        ancoras = self._obter_ancoras(kx, ky)
+        num_validas = validas.sum(axis=1)
+
+        # Menos de 4 âncoras: trilateração básica com da0..da2 (ausentes valem 50, como em processar_distancias)
+        basica = num_validas < 4
+        if basica.any():
+            r = np.where(validas[basica, :3], d[basica, :3], 50.0)
+            posicoes[basica] = self._trilateracao_basica_lote(r, ancoras)
+            contar_caminho('basica', int(basica.sum()))
+
+        # 4 ou mais âncoras: mínimos quadrados, uma pseudo-inversa por máscara distinta de âncoras válidas
+        indices_mq = np.flatnonzero(~basica)
+        if indices_mq.size:
+            codigos = validas[indices_mq] @ (1 << np.arange(8))
+            for codigo in np.unique(codigos).tolist():
+                linhas = indices_mq[codigos == codigo]
+                try:
+                    indices, matriz, constante = self._obter_geometria(codigo, kx, ky)
+                    r = d[np.ix_(linhas, indices)]
+                    b = r[:, 1:]**2 - r[:, :1]**2 + constante
+                    posicoes[linhas] = b @ matriz.T
+                    contar_caminho('minimos_quadrados', len(linhas))
+                except Exception as e:
+                    log_solver.error("Erro nos mínimos quadrados em lote: %s", e)
+                    r = np.where(validas[linhas, :3], d[linhas, :3], 50.0)
+                    posicoes[linhas] = self._trilateracao_basica_lote(r, ancoras)
+                    contar_caminho('fallback', len(linhas))
+
+        # Mesma correção de aplicar_correcao (fmin/fmax reproduzem min/max do Python com NaN)
+        max_x = float(kx) if kx is not None else 114.0
+        max_y = float(ky) if ky is not None else 114.0
+        posicoes[:, 0] = np.fmax(2.0, np.fmin(max_x - 2.0, posicoes[:, 0]))
+        posicoes[:, 1] = np.fmax(2.0, np.fmin(max_y - 2.0, posicoes[:, 1]))
+
+        # round() do Python para arredondar exatamente como processar_distancias
+        return np.array([round(v, 2) for v in posicoes.ravel().tolist()]).reshape(n, 2)
+
+    def _trilateracao_basica_lote(self, r, ancoras):
+        """Versão vetorizada de calcular_trilateracao_basica para uma matriz (N, 3) de raios"""
+        x0, y0 = ancoras[0]
+        x1, y1 = ancoras[1]
+        x2, y2 = ancoras[2]
+
+        A = 2 * (x1 - x0)
+        C = r[:, 0]**2 - r[:, 1]**2 + x1**2 - x0**2 + y1**2 - y0**2
+        E = 2 * (y2 - y0)
+        F = r[:, 0]**2 - r[:, 2]**2 + x2**2 - x0**2 + y2**2 - y0**2
+
+        resultado = np.full((r.shape[0], 2), 57.0)
+        if A != 0:
+            resultado[:, 0] = C / A
+        if E != 0:
+            resultado[:, 1] = F / E
+        # Distâncias não positivas caem no valor padrão, como na versão escalar
+        resultado[(r <= 0).any(axis=1)] = 57.0
+        return resultado
+
 # Instância global da trilateração
 trilateracao = TrilateracaoUWB()
 
@@ -250,12 +396,12 @@ def validar_e_converter_array(range_data, campo_nome="range"):
     Valida e converte dados de array de diferentes formatos para lista de floats
     Suporta: lista, string JSON, string separada por vírgulas
     """
-    logging.info(f"[DEBUG] Validando array {campo_nome}: tipo={type(range_data)}, valor={range_data}")
+    log_ingestao.debug("Validando array %s: tipo=%s, valor=%s", campo_nome, type(range_data), range_data)
     
     try:
         # Se já é uma lista
         if isinstance(range_data, list):
-            logging.info(f"[DEBUG] {campo_nome} já é uma lista")
+            log_ingestao.debug("%s já é uma lista", campo_nome)
             resultado = []
             for i, valor in enumerate(range_data):
                 try:
@@ -264,27 +410,27 @@ def validar_e_converter_array(range_data, campo_nome="range"):
                     else:
                         resultado.append(float(valor))
                 except (ValueError, TypeError) as e:
-                    logging.warning(f"[DEBUG] Erro ao converter elemento {i} ({valor}) para float: {e}")
+                    log_ingestao.warning("Erro ao converter elemento %s (%s) para float: %s", i, valor, e)
                     resultado.append(None)
             return resultado
         
         # Se é uma string, tentar diferentes formatos
         elif isinstance(range_data, str):
-            logging.info(f"[DEBUG] {campo_nome} é string, tentando conversões")
+            log_ingestao.debug("%s é string, tentando conversões", campo_nome)
             
             # Tentar JSON primeiro
             try:
                 array_json = json.loads(range_data)
                 if isinstance(array_json, list):
-                    logging.info(f"[DEBUG] {campo_nome} convertido de JSON com sucesso")
+                    log_ingestao.debug("%s convertido de JSON com sucesso", campo_nome)
                     return validar_e_converter_array(array_json, campo_nome)
             except json.JSONDecodeError:
-                logging.info(f"[DEBUG] {campo_nome} não é JSON válido")
+                log_ingestao.debug("%s não é JSON válido", campo_nome)
             
             # Tentar separação por vírgulas
             try:
                 elementos = range_data.split(',')
-                logging.info(f"[DEBUG] {campo_nome} separado por vírgulas: {elementos}")
+                log_ingestao.debug("%s separado por vírgulas: %s", campo_nome, elementos)
                 resultado = []
                 for elemento in elementos:
                     elemento = elemento.strip()
@@ -294,14 +440,14 @@ def validar_e_converter_array(range_data, campo_nome="range"):
                         resultado.append(float(elemento))
                 return resultado
             except (ValueError, TypeError) as e:
-                logging.error(f"[DEBUG] Erro ao converter string separada por vírgulas: {e}")
+                log_ingestao.error("Erro ao converter string separada por vírgulas: %s", e)
         
         # Se não conseguiu converter
-        logging.error(f"[DEBUG] Não foi possível converter {campo_nome} para array válido")
+        log_ingestao.error("Não foi possível converter %s para array válido", campo_nome)
         return None
         
     except Exception as e:
-        logging.error(f"[DEBUG] Erro geral na validação do array {campo_nome}: {e}")
+        log_ingestao.error("Erro geral na validação do array %s: %s", campo_nome, e)
         return None
 
 def _to_float_list(value):
@@ -343,6 +489,31 @@ def _to_float_list(value):
     except Exception as e:
         raise ValueError(f"Não foi possível converter '{value}' em lista de float: {e}")
 
+def _perfil_resposta():
+    """Perfil de resposta pedido pelo cliente (?perfil= ou header X-UWB-Perfil), ou o padrão do servidor"""
+    perfil = request.args.get('perfil') or request.headers.get('X-UWB-Perfil')
+    if perfil:
+        perfil = perfil.lower()
+        if perfil in PERFIS_RESPOSTA:
+            return perfil
+    return PERFIL_RESPOSTA_PADRAO
+
+def _aplicar_perfil(resultado, perfil):
+    """Reduz o resultado de um item conforme o perfil de resposta"""
+    if perfil == 'debug' or not isinstance(resultado, dict):
+        return resultado
+    
+    if perfil == 'standard':
+        return {k: v for k, v in resultado.items() if k not in ('debug_info', 'item')}
+    
+    # minimal: status do item e posição, se houver
+    enxuto = {k: resultado[k] for k in ('success', 'error', 'status') if k in resultado}
+    posicao = resultado.get('posicao') or resultado.get('posicao_calculada')
+    if posicao:
+        enxuto['x'] = posicao['x']
+        enxuto['y'] = posicao['y']
+    return enxuto
+
 def _pad_or_trim_eight(xs):
     """ Garante exatamente 8 posições (completa com None ou corta). """
     xs = list(xs or [])
@@ -350,6 +521,95 @@ def _pad_or_trim_eight(xs):
         xs = xs + [None] * (8 - len(xs))
     return xs[:8]
 
+# Colunas de distancias_uwb_rssi na ordem usada pela gravação em lote
+_COLUNAS_RSSI = (
+    ['tag_number']
+    + [f'da{i}' for i in range(8)]
+    + [f'rssi{i}' for i in range(8)]
+    + ['criado_em', 'relatorio_number']
+)
+
+# Nome da sequence da coluna id por tabela (consultado uma vez por processo)
+_sequences_postgres = {}
+
+def _valor_copy(valor):
+    """Formata um valor para o formato texto do COPY do PostgreSQL"""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, str):
+        return (valor.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return repr(valor)
+
+def _inserir_rssi_em_lote(linhas):
+    """
+    Insere as linhas (dicts com _COLUNAS_RSSI) em distancias_uwb_rssi e retorna os ids na mesma ordem.
+    Linhas sem relatorio_number recebem o do relatório ativo (ou NULL).
+    - PostgreSQL: reserva os ids na sequence numa única consulta e envia as linhas por COPY ... FROM STDIN
+      (sem sequence associada à coluna id, usa o INSERT multi-linha)
+    - SQLite: executemany; os ids são sequenciais porque a transação detém o lock de escrita do arquivo
+    - Outros bancos: INSERT multi-linha com RETURNING id
+    O commit fica a cargo de quem chama.
+    """
+    if not linhas:
+        return []
+    
+    agora = datetime.utcnow()
+    relatorio_ativo = cache_relatorio.obter()
+    relatorio_number = relatorio_ativo.relatorio_number if relatorio_ativo else None
+    for linha in linhas:
+        if linha.get('criado_em') is None:
+            linha['criado_em'] = agora
+        linha.setdefault('relatorio_number', relatorio_number)
+    
+    tabela = UWBDataRSSI.__tablename__
+    dialeto = db.session.get_bind().dialect.name
+    conexao = db.session.connection()
+    
+    if dialeto == 'postgresql':
+        sequence = _sequences_postgres.get(tabela)
+        if sequence is None:
+            sequence = conexao.execute(
+                text(f"SELECT pg_get_serial_sequence('{tabela}', 'id')")
+            ).scalar() or ''
+            _sequences_postgres[tabela] = sequence
+    
+    if dialeto == 'postgresql' and sequence:
+        ids = conexao.execute(
+            text("SELECT nextval(:sequence) FROM generate_series(1, :n)"),
+            {'sequence': sequence, 'n': len(linhas)}
+        ).scalars().all()
+        
+        buffer = io.StringIO()
+        for id_reservado, linha in zip(ids, linhas):
+            buffer.write(str(id_reservado))
+            for coluna in _COLUNAS_RSSI:
+                buffer.write('\t')
+                buffer.write(_valor_copy(linha[coluna]))
+            buffer.write('\n')
+        buffer.seek(0)
+        
+        cursor = conexao.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {tabela} (id, {', '.join(_COLUNAS_RSSI)}) FROM STDIN", buffer
+            )
+        finally:
+            cursor.close()
+        return list(ids)
+    
+    if dialeto == 'sqlite':
+        conexao.execute(insert(UWBDataRSSI), linhas)
+        ultimo_id = conexao.execute(text(f"SELECT max(id) FROM {tabela}")).scalar()
+        return list(range(ultimo_id - len(linhas) + 1, ultimo_id + 1))
+    
+    resultado = conexao.execute(
+        insert(UWBDataRSSI).returning(UWBDataRSSI.id, sort_by_parameter_order=True), linhas
+    )
+    return resultado.scalars().all()
+
 @uwb_bp.route("/uwb/data", methods=["POST"])
 def receive_uwb_data():
     """
@@ -361,59 +621,238 @@ def receive_uwb_data():
     - Lista: {"id": "3", "range": [10.5, 20.3, 15.7, ...]}\n    - String JSON: {"id": "3", "range": "[10.5, 20.3, 15.7, ...]"}\n    - String CSV: {"id": "3", "range": "10.5,20.3,15.7,..."}\n    - **NOVO: Array de objetos JSON**: [{"id": "3", "range": [...]}, {"id": "4", "range": [...]}]
     """
     try:
-        logging.info(f"[DEBUG] Requisição POST recebida no endpoint /uwb/data")
-        logging.info(f"[DEBUG] Content-Type: {request.content_type}")
-        raw_data = request.get_data()
-        logging.info(f"[DEBUG] Dados brutos: {raw_data}")
-        
-        data = request.json
+        log_ingestao.debug("Requisição POST recebida no endpoint /uwb/data")
+        log_ingestao.debug("Content-Type: %s", request.content_type)
+        with medir('json'):
+            raw_data = request.get_data()
+            log_ingestao.debug("Dados brutos: %s", raw_data)
+            
+            data = request.json
         
         if not data:
-            logging.error("[DEBUG] Nenhum dado JSON fornecido na requisição")
+            log_ingestao.error("Nenhum dado JSON fornecido na requisição")
             return jsonify({'error': 'Nenhum dado JSON fornecido'}), 400
         
+        # Modo assíncrono: as leituras vão para a fila e são gravadas em segundo plano
+        if _ingestao_assincrona():
+            itens = data if isinstance(data, list) else [data]
+            results = _enfileirar_itens(itens)
+            if results is None:
+                resposta = jsonify({'error': 'Fila de ingestão cheia, tente novamente em instantes',
+                                    'fila': fila_ingestao.profundidade})
+                resposta.headers['Retry-After'] = '1'
+                return resposta, 429
+            
+            perfil = _perfil_resposta()
+            enfileirados = any(r.get('status') == 'enfileirado' for r in results)
+            if isinstance(data, list):
+                status = 202 if enfileirados else (200 if all('success' in r for r in results) else 207)
+                return jsonify([_aplicar_perfil(r, perfil) for r in results]), status
+            status = 202 if enfileirados else (201 if 'success' in results[0] else 400)
+            return jsonify(_aplicar_perfil(results[0], perfil)), status
+        
         # Se for um array de objetos, processar cada um
         if isinstance(data, list):
-            logging.info(f"[DEBUG] Recebido um array de {len(data)} objetos. Processando cada um.")
-            results = []
-            for item in data:
-                try:
-                    # Processar cada item individualmente
-                    result = process_single_uwb_data_item(item)
-                    results.append(result)
-                except Exception as e:
-                    logging.error(f"[DEBUG] Erro ao processar item do array: {item}. Erro: {e}")
-                    results.append({'error': f'Erro ao processar item: {str(e)}', 'item': item})
+            log_ingestao.debug("Recebido um array de %s objetos. Processando cada um.", len(data))
+            # Trilateração de todo o array numa única passada vetorizada
+            preparados = _calcular_posicoes_lote(data)
+            results = _ingerir_preparados(data, preparados)
+            status = 200 if all('success' in r for r in results) else 207 # 207 Multi-Status
             
             # Retornar uma lista de resultados
-            return jsonify(results), 200 if all('success' in r for r in results) else 207 # 207 Multi-Status
+            perfil = _perfil_resposta()
+            return jsonify([_aplicar_perfil(r, perfil) for r in results]), status
         
         # Se for um único objeto, processar normalmente
         else:
-            logging.info(f"[DEBUG] Recebido um único objeto JSON.")
+            log_ingestao.debug("Recebido um único objeto JSON.")
             result = process_single_uwb_data_item(data)
-            return jsonify(result), 201 if 'success' in result else 400
+            status = 201 if 'success' in result else 400
+            return jsonify(_aplicar_perfil(result, _perfil_resposta())), status
             
     except ValueError as e:
-        logging.error(f"[DEBUG] Erro de conversão de dados: {e}")
+        log_ingestao.error("Erro de conversão de dados: %s", e)
         db.session.rollback()
-        return jsonify({
-            'error': f'Erro de conversão de dados: {str(e)}',
-            'debug_info': {
-                'dados_recebidos': str(raw_data),
-                'content_type': request.content_type
-            }
-        }), 400
+        return jsonify(_resposta_erro_ingestao(f'Erro de conversão de dados: {str(e)}')), 400
     except Exception as e:
-        logging.error(f"[DEBUG] Erro interno do servidor: {e}")
+        log_ingestao.error("Erro interno do servidor: %s", e)
         db.session.rollback()
-        return jsonify({
-            'error': f'Erro interno do servidor: {str(e)}',
-            'debug_info': {
-                'dados_recebidos': str(raw_data),
-                'content_type': request.content_type
-            }
-        }), 500
+        return jsonify(_resposta_erro_ingestao(f'Erro interno do servidor: {str(e)}')), 500
+
+def _ingestao_assincrona():
+    """Modo de ingestão da requisição: ?assincrono=0|1 ou o padrão do servidor (UWB_INGESTAO_ASSINCRONA)"""
+    assincrono = request.args.get('assincrono')
+    if assincrono is not None:
+        return assincrono.lower() in ('1', 'true', 'sim')
+    return INGESTAO_ASSINCRONA
+
+def _enfileirar_itens(itens):
+    """
+    Ingestão assíncrona: valida os itens na requisição e enfileira os que serão gravados.
+    Erros, tags de calibração e leituras sem relatório ativo são respondidos na hora (nada é gravado).
+    Retorna a lista de resultados, ou None se a fila não comporta as leituras (nenhuma é enfileirada).
+    """
+    recebido_em = datetime.utcnow()
+    with medir('relatorio_ativo'):
+        relatorio_ativo = cache_relatorio.obter()
+    results = []
+    entradas = []
+    for item in itens:
+        try:
+            leitura, erro = _validar_item_uwb(item)
+        except Exception as e:
+            leitura, erro = None, {'error': f'Erro ao processar item: {str(e)}', 'item': item}
+        if erro:
+            contar_resultados([erro])
+            results.append(erro)
+        elif leitura['tag_id_int'] in (1, 2) or not relatorio_ativo:
+            results.append(process_single_uwb_data_item(item, leitura))
+        else:
+            # A leitura guarda o horário de chegada e o relatório ativo nesse momento (número e kx/ky):
+            # criado_em e o relatório não dependem da espera na fila
+            leitura['recebido_em'] = recebido_em
+            leitura['relatorio'] = relatorio_ativo
+            entradas.append((item, leitura))
+            results.append({
+                'success': True,
+                'status': 'enfileirado',
+                'message': 'Leitura recebida e enfileirada para gravação',
+                'tag_number': leitura['tag_id']
+            })
+    
+    if entradas and not fila_ingestao.enfileirar(entradas):
+        return None
+    return results
+
+def processar_lote_fila(entradas):
+    """
+    Processador da fila de ingestão (thread de escrita, dentro do app context).
+    entradas: pares (item, leitura) já validados; trilateração vetorizada e gravação numa única transação.
+    Retorna quantas leituras foram gravadas.
+    """
+    itens = [item for item, _ in entradas]
+    preparados = [[leitura, None, None] for _, leitura in entradas]
+    _trilaterar_preparados(preparados)
+    results = _ingerir_preparados(itens, preparados)
+    
+    descartados = [r for r in results if not r.get('success')]
+    if descartados:
+        log_ingestao.warning("%s de %s leituras da fila não foram gravadas (ex.: %s)",
+                             len(descartados), len(results),
+                             descartados[0].get('error') or descartados[0].get('message'))
+    
+    # Leituras gravadas depois da finalização do relatório em que foram aceitas: o resumo é refeito
+    relatorio_ativo = cache_relatorio.obter()
+    relatorios = {leitura['relatorio'].relatorio_number for (_, leitura), r in zip(entradas, results)
+                  if r.get('success') and leitura.get('relatorio')}
+    if relatorio_ativo:
+        relatorios.discard(relatorio_ativo.relatorio_number)
+    atualizar_resumos(relatorios)
+    return len(results) - len(descartados)
+
+@uwb_bp.route('/uwb/ingestao/status', methods=['GET'])
+def status_ingestao():
+    """Estado da fila de ingestão assíncrona deste worker (profundidade, lotes gravados, recusas)"""
+    status = fila_ingestao.status()
+    status['assincrona'] = INGESTAO_ASSINCRONA
+    return jsonify(status), 200
+
+def _resposta_erro_ingestao(mensagem):
+    """Resposta de erro da ingestão; o corpo recebido só é ecoado no perfil debug"""
+    resposta = {'error': mensagem}
+    if _perfil_resposta() == 'debug':
+        resposta['debug_info'] = {
+            'dados_recebidos': str(request.get_data()),
+            'content_type': request.content_type
+        }
+    return resposta
+
+# Formato binário (little-endian) aceito em /uwb/data-bin:
+#   cabeçalho de 8 bytes: magic "UWB1", versão (u8 = 1), flags (u8, bit 0 = quadros com RSSI), reservado (u16)
+#   seguido de N quadros de tamanho fixo:
+#     tag (u16), reservado (u16), timestamp do dispositivo em ms (u32), range[8] (f32, cm; 0 = ausente)
+#     e, com a flag de RSSI, rssi[8] (f32, dBm)
+_MAGIC_BINARIO = b'UWB1'
+_VERSAO_BINARIO = 1
+_FLAG_BINARIO_RSSI = 0x01
+_CABECALHO_BINARIO = np.dtype([('magic', 'S4'), ('versao', 'u1'), ('flags', 'u1'), ('reservado', '<u2')])
+_QUADRO_BINARIO = np.dtype([
+    ('tag', '<u2'), ('reservado', '<u2'), ('timestamp', '<u4'), ('range', '<f4', (8,))
+])
+_QUADRO_BINARIO_RSSI = np.dtype([
+    ('tag', '<u2'), ('reservado', '<u2'), ('timestamp', '<u4'), ('range', '<f4', (8,)), ('rssi', '<f4', (8,))
+])
+
+def _float32_para_lista(valores):
+    """Converte uma linha float32 para list[float] com 2 casas (10.3 em vez de 10.300000190734863); NaN vira None"""
+    return [None if math.isnan(v) else v for v in np.round(valores.astype(float), 2).tolist()]
+
+@uwb_bp.route('/uwb/data-bin', methods=['POST'])
+def receive_uwb_data_binario():
+    """
+    Endpoint binário (application/octet-stream) para os quadros de distância do ESP32
+    O corpo é decodificado sem cópia com np.frombuffer e segue o mesmo caminho de
+    gravação e trilateração do POST em array de /uwb/data.
+    Quadros com RSSI também são gravados em distancias_uwb_rssi.
+    """
+    try:
+        corpo = request.get_data(cache=False)
+        if len(corpo) < _CABECALHO_BINARIO.itemsize:
+            return jsonify({'error': 'Corpo binário menor que o cabeçalho'}), 400
+        
+        cabecalho = np.frombuffer(corpo, dtype=_CABECALHO_BINARIO, count=1)[0]
+        if cabecalho['magic'] != _MAGIC_BINARIO or cabecalho['versao'] != _VERSAO_BINARIO:
+            return jsonify({'error': 'Cabeçalho binário inválido (esperado magic UWB1, versão 1)'}), 400
+        
+        com_rssi = bool(cabecalho['flags'] & _FLAG_BINARIO_RSSI)
+        formato = _QUADRO_BINARIO_RSSI if com_rssi else _QUADRO_BINARIO
+        tamanho = len(corpo) - _CABECALHO_BINARIO.itemsize
+        if tamanho == 0 or tamanho % formato.itemsize:
+            return jsonify({
+                'error': f'Tamanho do corpo incompatível com quadros de {formato.itemsize} bytes'
+            }), 400
+        
+        quadros = np.frombuffer(corpo, dtype=formato, offset=_CABECALHO_BINARIO.itemsize)
+        log_ingestao.debug("Recebidos %s quadros binários (RSSI: %s)", len(quadros), com_rssi)
+        
+        distancias = np.round(quadros['range'].astype(float), 2)
+        tags = quadros['tag'].tolist()
+        timestamps = quadros['timestamp'].tolist()
+        
+        itens, preparados = [], []
+        for i, tag in enumerate(tags):
+            range_values = _float32_para_lista(quadros['range'][i])
+            itens.append({'id': str(tag), 'range': range_values, 'timestamp_dispositivo': timestamps[i]})
+            preparados.append([{
+                'tag_id': str(tag),
+                'tag_id_int': tag,
+                'range_data': range_values,
+                'range_values': range_values
+            }, None, None])
+        
+        _trilaterar_preparados(preparados, distancias)
+        results = _ingerir_preparados(itens, preparados)
+        status = 200 if all('success' in r for r in results) else 207
+        
+        if com_rssi:
+            linhas = []
+            for i, item in enumerate(itens):
+                linha = {'tag_number': item['id'], 'criado_em': None}
+                rssi = _float32_para_lista(quadros['rssi'][i])
+                for a in range(8):
+                    linha[f'da{a}'] = item['range'][a]
+                    linha[f'rssi{a}'] = rssi[a]
+                linhas.append(linha)
+            _inserir_rssi_em_lote(linhas)
+            db.session.commit()
+        
+        perfil = _perfil_resposta()
+        return jsonify([_aplicar_perfil(r, perfil) for r in results]), status
+    
+    except Exception as e:
+        log_ingestao.error("Erro no endpoint binário: %s", e)
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno do servidor: {str(e)}'}), 500
 
 @uwb_bp.route('/uwb/data-rssi', methods=['POST'])
 @uwb_bp.route('/uwb/data-rssi', methods=['POST'])
@@ -426,6 +865,7 @@ def receive_uwb_data_rssi():
          -> grava distâncias e RSSIs normalmente.
 
     Aceita objeto único ou lista.
+    Todas as linhas válidas são gravadas de uma vez (ver _inserir_rssi_em_lote).
     """
     try:
         payload = request.get_json(silent=True)
@@ -434,7 +874,7 @@ def receive_uwb_data_rssi():
 
         items = payload if isinstance(payload, list) else [payload]
 
-        saved_ids, errors = [], []
+        linhas, errors = [], []
 
         for idx, item in enumerate(items):
             try:
@@ -446,22 +886,17 @@ def receive_uwb_data_rssi():
                         ts = ts_raw.replace('Z', '+00:00') if isinstance(ts_raw, str) else ts_raw
                         criado_em = datetime.fromisoformat(ts)  # manteremos como está
                     except Exception:
-                        logging.warning("timestamp inválido em item %s: %s", idx, ts_raw)
+                        log_ingestao.warning("timestamp inválido em item %s: %s", idx, ts_raw)
                         criado_em = None
 
                 # ---------- 1) Modo CABEÇALHO ----------
                 nome_rel = item.get('relatorio_nome') or item.get('nome') or item.get('nome_relatorio')
                 if nome_rel:
                     nome_rel = str(nome_rel)[:50]  # cabe em VARCHAR(50)
-                    rec = UWBDataRSSI(
-                        tag_number=nome_rel,
-                        da0=None, da1=None, da2=None, da3=None, da4=None, da5=None, da6=None, da7=None,
-                        rssi0=None, rssi1=None, rssi2=None, rssi3=None, rssi4=None, rssi5=None, rssi6=None, rssi7=None,
-                        criado_em=criado_em
-                    )
-                    db.session.add(rec)
-                    db.session.flush()
-                    saved_ids.append(rec.id)
+                    linha = dict.fromkeys(_COLUNAS_RSSI)  # distâncias e RSSIs NULL
+                    linha['tag_number'] = nome_rel
+                    linha['criado_em'] = criado_em
+                    linhas.append(linha)
                     continue  # próximo item
 
                 # ---------- 2) Modo DADOS (validações) ----------
@@ -484,22 +919,17 @@ def receive_uwb_data_rssi():
                 ranges8 = _pad_or_trim_eight(ranges)
                 rssi8 = _pad_or_trim_eight(rssi)
 
-                rec = UWBDataRSSI(
-                    tag_number=tag_id,
-                    da0=ranges8[0], da1=ranges8[1], da2=ranges8[2], da3=ranges8[3],
-                    da4=ranges8[4], da5=ranges8[5], da6=ranges8[6], da7=ranges8[7],
-                    rssi0=rssi8[0], rssi1=rssi8[1], rssi2=rssi8[2], rssi3=rssi8[3],
-                    rssi4=rssi8[4], rssi5=rssi8[5], rssi6=rssi8[6], rssi7=rssi8[7],
-                    criado_em=criado_em
-                )
-                db.session.add(rec)
-                db.session.flush()
-                saved_ids.append(rec.id)
+                linha = {'tag_number': tag_id, 'criado_em': criado_em}
+                for i in range(8):
+                    linha[f'da{i}'] = ranges8[i]
+                    linha[f'rssi{i}'] = rssi8[i]
+                linhas.append(linha)
 
             except Exception as e:
-                logging.exception("Falha ao processar item %s: %s", idx, item)
+                log_ingestao.exception("Falha ao processar item %s: %s", idx, item)
                 errors.append({"index": idx, "error": str(e)})
 
+        saved_ids = _inserir_rssi_em_lote(linhas)
         if saved_ids:
             db.session.commit()
         else:
@@ -509,53 +939,261 @@ def receive_uwb_data_rssi():
         return jsonify({"saved": len(saved_ids), "ids": saved_ids, "errors": errors}), status
 
     except Exception as e:
-        logging.exception("Erro inesperado em /uwb/data-rssi: %s", e)
+        log_ingestao.exception("Erro inesperado em /uwb/data-rssi: %s", e)
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-def process_single_uwb_data_item(data):
+def _validar_item_uwb(data):
     """
-    Função auxiliar para processar um único objeto de dados UWB.
+    Valida os campos de um objeto de dados UWB.
+    Retorna (leitura, None) com tag_id, tag_id_int, range_data e range_values, ou (None, erro).
     """
-    try:
-        # Validar campos obrigatórios
-        if 'id' not in data:
-            logging.error("[DEBUG] Campo 'id' não encontrado nos dados do item")
-            return {'error': 'Campo obrigatório: id'}
-            
-        if 'range' not in data:
-            logging.error("[DEBUG] Campo 'range' não encontrado nos dados do item")
-            return {'error': 'Campo obrigatório: range'}
-        
-        tag_id = str(data['id'])
-        range_data = data['range']
-        
-        logging.info(f"[DEBUG] Processando item - Tag ID: {tag_id}, Range data: {range_data} (tipo: {type(range_data)})")
-        
-        # Validar e converter array de range
-        range_values = validar_e_converter_array(range_data, "range")
+    # Validar campos obrigatórios
+    if 'id' not in data:
+        log_ingestao.error("Campo 'id' não encontrado nos dados do item")
+        return None, {'error': 'Campo obrigatório: id'}
         
-        if range_values is None:
-            logging.error(f"[DEBUG] Falha na validação do array range do item: {range_data}")
-            return {'error': 'Range deve ser um array válido (lista, JSON string ou CSV string)'}
-        
-        # Verificar se tem exatamente 8 valores
-        if len(range_values) != 8:
-            logging.error(f"[DEBUG] Array range do item tem {len(range_values)} elementos, esperado 8")
-            return {'error': f'Range deve ter exatamente 8 valores, recebido {len(range_values)}'}
+    if 'range' not in data:
+        log_ingestao.error("Campo 'range' não encontrado nos dados do item")
+        return None, {'error': 'Campo obrigatório: range'}
+    
+    tag_id = str(data['id'])
+    range_data = data['range']
+    
+    log_ingestao.debug("Processando item - Tag ID: %s, Range data: %s (tipo: %s)", tag_id, range_data, type(range_data))
+    
+    # Validar e converter array de range
+    range_values = validar_e_converter_array(range_data, "range")
+    
+    if range_values is None:
+        log_ingestao.error("Falha na validação do array range do item: %s", range_data)
+        return None, {'error': 'Range deve ser um array válido (lista, JSON string ou CSV string)'}
+    
+    # Verificar se tem exatamente 8 valores
+    if len(range_values) != 8:
+        log_ingestao.error("Array range do item tem %s elementos, esperado 8", len(range_values))
+        return None, {'error': f'Range deve ter exatamente 8 valores, recebido {len(range_values)}'}
+    
+    log_ingestao.debug("Array range do item validado com sucesso: %s", range_values)
+    
+    # Verificar se é TAG1 ou TAG2 (sempre processadas) ou outras tags
+    try:
+        tag_id_int = int(tag_id)
+        log_ingestao.debug("Tag ID do item convertido para inteiro: %s", tag_id_int)
+    except ValueError:
+        log_ingestao.error("Erro ao converter tag_id '%s' do item para inteiro", tag_id)
+        return None, {'error': f'ID da tag deve ser um número válido, recebido: {tag_id}'}
+    
+    return {
+        'tag_id': tag_id,
+        'tag_id_int': tag_id_int,
+        'range_data': range_data,
+        'range_values': range_values
+    }, None
+
+def _calcular_posicoes_lote(itens):
+    """
+    Valida todos os itens de um POST em array e calcula, numa única passada vetorizada,
+    a posição dos que serão trilaterados (tags fora de calibração com relatório ativo).
+    Retorna uma lista paralela a itens com (leitura, erro, posicao); posicao é None quando não se aplica.
+    """
+    preparados = []
+    for item in itens:
+        try:
+            leitura, erro = _validar_item_uwb(item)
+        except Exception:
+            leitura, erro = None, None  # Deixa process_single_uwb_data_item reportar o erro
+        preparados.append([leitura, erro, None])
+
+    _trilaterar_preparados(preparados)
+    return preparados
+
+def _trilaterar_preparados(preparados, distancias=None):
+    """
+    Preenche a posição dos itens preparados que serão trilaterados, uma chamada a processar_lote por kx/ky.
+    distancias: matriz (N, 8) já decodificada, paralela a preparados (NaN = ausente);
+    se omitida, é montada a partir de range_values.
+    Leituras da fila trazem o relatório ativo quando foram aceitas; as demais usam o relatório ativo agora.
+    """
+    indices = [i for i, (leitura, _, _) in enumerate(preparados)
+               if leitura is not None and leitura['tag_id_int'] not in (1, 2)]
+    if not indices:
+        return
+
+    relatorio_ativo = None
+    if any(preparados[i][0].get('relatorio') is None for i in indices):
+        with medir('relatorio_ativo'):
+            relatorio_ativo = cache_relatorio.obter()
+
+    grupos = {}
+    for i in indices:
+        relatorio = preparados[i][0].get('relatorio') or relatorio_ativo
+        if relatorio:
+            grupos.setdefault((relatorio.kx or None, relatorio.ky or None), []).append(i)
+
+    for (kx_relatorio, ky_relatorio), indices_grupo in grupos.items():
+        if distancias is not None:
+            matriz = distancias[indices_grupo]
+        else:
+            matriz = np.array(
+                [[np.nan if v is None else v for v in preparados[i][0]['range_values']] for i in indices_grupo],
+                dtype=float
+            )
+        try:
+            with medir('trilateracao_lote'):
+                posicoes = trilateracao.processar_lote(matriz, kx=kx_relatorio, ky=ky_relatorio)
+        except Exception as e:
+            # Cada item volta a calcular a própria posição e reporta o erro individualmente
+            log_ingestao.error("Erro na trilateração em lote: %s", e)
+            continue
+
+        for i, (x, y) in zip(indices_grupo, posicoes.tolist()):
+            preparados[i][2] = (x, y)
+
+def _ingerir_preparados(itens, preparados):
+    """Processa os itens preparados e grava todos numa única transação. Retorna a lista de resultados."""
+    lote = LoteIngestao()
+    results = []
+    for item, (leitura, erro, posicao) in zip(itens, preparados):
+        try:
+            # Processar cada item individualmente
+            result = erro if erro else process_single_uwb_data_item(item, leitura, posicao, lote)
+            results.append(result)
+        except Exception as e:
+            log_ingestao.error("Erro ao processar item do array: %s. Erro: %s", item, e)
+            results.append({'error': f'Erro ao processar item: {str(e)}', 'item': item})
+    
+    # Todos os registros numa única transação
+    lote.gravar()
+    contar_resultados(results)
+    return results
+
+class LoteIngestao:
+    """
+    Acumula os registros de uma requisição para gravá-los numa única transação.
+    Os agregados por intervalo (posicoes_agregadas) são atualizados na mesma transação.
+    Os objetos só entram na sessão em gravar(): o flush do SQLAlchemy 2.0 agrupa os INSERTs
+    de cada tabela num único comando com RETURNING (insertmanyvalues) e um único commit.
+    """
+    
+    def __init__(self):
+        self.pendentes = []  # (resultado, uwb_data, uwb_data_processada ou None)
+        self.posicoes = {}   # tag_number -> UltimaPosicao aceita neste lote (ainda não gravada)
+    
+    def ultima_posicao(self, tag_number):
+        """Última posição da tag considerando as posições aceitas neste lote"""
+        if tag_number in self.posicoes:
+            return self.posicoes[tag_number]
+        return cache_posicoes.obter(tag_number)
+    
+    def adicionar(self, resultado, uwb_data, uwb_data_processada=None):
+        self.pendentes.append((resultado, uwb_data, uwb_data_processada))
+        if uwb_data_processada is not None:
+            self.posicoes[uwb_data_processada.tag_number] = UltimaPosicao(
+                uwb_data_processada.x, uwb_data_processada.y, uwb_data_processada.criado_em
+            )
+    
+    def gravar(self):
+        """
+        Grava todos os registros pendentes num único commit e preenche os ids nos resultados.
+        Se a transação em lote falhar, regrava item a item para manter o resultado individual de cada um.
+        """
+        if not self.pendentes:
+            return
+        with medir('gravacao'):
+            self._gravar_lote()
+    
+    def _gravar_lote(self):
+        try:
+            for _, uwb_data, uwb_data_processada in self.pendentes:
+                db.session.add(uwb_data)
+                if uwb_data_processada is not None:
+                    db.session.add(uwb_data_processada)
+            db.session.flush()
+            self._preencher_resultados(self.pendentes)
+            atualizar_agregados(db.session, [p for _, _, p in self.pendentes if p is not None])
+            eventos = self._eventos_stream(self.pendentes)
+            publicador_posicoes.enviar(db.session, eventos)
+            db.session.commit()
+            log_ingestao.debug("%s leituras gravadas numa única transação", len(self.pendentes))
+        except Exception as e:
+            db.session.rollback()
+            log_ingestao.error("Falha na gravação em lote, gravando item a item: %s", e)
+            self._gravar_item_a_item()
+            return
         
-        logging.info(f"[DEBUG] Array range do item validado com sucesso: {range_values}")
+        publicador_posicoes.confirmar(db.session, eventos)
+        for tag_number, posicao in self.posicoes.items():
+            cache_posicoes.atualizar(tag_number, posicao.x, posicao.y, posicao.criado_em)
+    
+    def _gravar_item_a_item(self):
+        cache_posicoes.limpar()
+        for pendente in self.pendentes:
+            resultado, uwb_data, uwb_data_processada = pendente
+            try:
+                db.session.add(uwb_data)
+                if uwb_data_processada is not None:
+                    db.session.add(uwb_data_processada)
+                db.session.flush()
+                self._preencher_resultados([pendente])
+                if uwb_data_processada is not None:
+                    atualizar_agregados(db.session, [uwb_data_processada])
+                eventos = self._eventos_stream([pendente])
+                publicador_posicoes.enviar(db.session, eventos)
+                db.session.commit()
+                publicador_posicoes.confirmar(db.session, eventos)
+            except Exception as e:
+                db.session.rollback()
+                log_ingestao.error("Erro ao gravar item da tag %s: %s", uwb_data.tag_number, e)
+                resultado.clear()
+                resultado['error'] = f'Erro ao gravar item: {str(e)}'
+    
+    @staticmethod
+    def _eventos_stream(pendentes):
+        """Eventos do stream /uwb/stream para as posições gravadas (ids já atribuídos pelo flush)"""
+        return [p.to_dict() for _, _, p in pendentes if p is not None]
+    
+    @staticmethod
+    def _preencher_resultados(pendentes):
+        for resultado, uwb_data, uwb_data_processada in pendentes:
+            if 'data_original' in resultado:
+                resultado['data_original'] = uwb_data.to_dict()
+            if 'data_processada' in resultado:
+                resultado['data_processada'] = uwb_data_processada.to_dict()
+
+def process_single_uwb_data_item(data, leitura=None, posicao=None, lote=None):
+    """
+    Função auxiliar para processar um único objeto de dados UWB.
+    leitura e posicao podem vir pré-calculadas pelo processamento em lote.
+    Com lote, os registros são apenas acumulados para gravação em LoteIngestao.gravar();
+    sem lote, o item é gravado (commit) antes de retornar.
+    """
+    if lote is None:
+        lote = LoteIngestao()
+        resultado = process_single_uwb_data_item(data, leitura, posicao, lote)
+        lote.gravar()
+        contar_resultados([resultado])
+        return resultado
+    
+    try:
+        if leitura is None:
+            leitura, erro = _validar_item_uwb(data)
+            if erro:
+                return erro
+
+        tag_id = leitura['tag_id']
+        tag_id_int = leitura['tag_id_int']
+        range_data = leitura['range_data']
+        range_values = leitura['range_values']
+        # Na ingestão assíncrona vale o horário de chegada da leitura, não o da gravação
+        agora = leitura.get('recebido_em') or datetime.utcnow()
         
-        # Verificar se é TAG1 ou TAG2 (sempre processadas) ou outras tags
-        try:
-            tag_id_int = int(tag_id)
-            logging.info(f"[DEBUG] Tag ID do item convertido para inteiro: {tag_id_int}")
-        except ValueError:
-            logging.error(f"[DEBUG] Erro ao converter tag_id '{tag_id}' do item para inteiro")
-            return {'error': f'ID da tag deve ser um número válido, recebido: {tag_id}'}
+        # Rastreamento amostrado: 1 a cada N leituras da tag vai para o buffer de traces
+        rastrear = amostrador.deve_rastrear(tag_id)
+        trace(rastrear, tag_id, "Leitura da TAG %s: range=%s", tag_id, range_values)
         
         if tag_id_int == 1 or tag_id_int == 2:
-            logging.info(f"[DEBUG] TAG{tag_id_int} do item identificada como tag de calibração")
+            trace(rastrear, tag_id, "TAG%s do item identificada como tag de calibração", tag_id_int)
             return {
                 'success': True,
                 'message': f'TAG{tag_id_int} recebida para calibração (não salva no banco)',
@@ -572,14 +1210,15 @@ def process_single_uwb_data_item(data):
             }
         
         # Para outras tags, verificar se há relatório ativo
-        logging.info(f"[DEBUG] Verificando relatório ativo para TAG{tag_id_int} do item")
-        relatorio_ativo = Relatorio.query.filter(
-            Relatorio.inicio_do_relatorio.isnot(None),
-            Relatorio.fim_do_relatorio.is_(None)
-        ).first()
+        trace(rastrear, tag_id, "Verificando relatório ativo para TAG%s do item", tag_id_int)
+        # Na ingestão assíncrona vale o relatório ativo quando a leitura foi aceita
+        relatorio_ativo = leitura.get('relatorio')
+        if relatorio_ativo is None:
+            with medir('relatorio_ativo'):
+                relatorio_ativo = cache_relatorio.obter()
         
         if not relatorio_ativo:
-            logging.warning(f"[DEBUG] Nenhum relatório ativo encontrado para TAG{tag_id_int} do item")
+            trace(rastrear, tag_id, "Nenhum relatório ativo encontrado para TAG%s do item", tag_id_int)
             return {
                 'success': False,
                 'message': 'Nenhum relatório ativo. Inicie um relatório para processar dados de tags.',
@@ -592,7 +1231,7 @@ def process_single_uwb_data_item(data):
                 }
             }
         
-        logging.info(f"[DEBUG] Relatório ativo encontrado para item: {relatorio_ativo.relatorio_number}")
+        trace(rastrear, tag_id, "Relatório ativo encontrado para item: %s", relatorio_ativo.relatorio_number)
         
         # Criar registro original
         uwb_data = UWBData(
@@ -605,13 +1244,11 @@ def process_single_uwb_data_item(data):
             da5=range_values[5] if range_values[5] is not None else None,
             da6=range_values[6] if range_values[6] is not None else None,
             da7=range_values[7] if range_values[7] is not None else None,
-            criado_em=datetime.utcnow()
+            criado_em=agora,
+            relatorio_number=relatorio_ativo.relatorio_number
         )
         
-        logging.info(f"[DEBUG] Registro UWBData do item criado: da0={uwb_data.da0}, da1={uwb_data.da1}, da2={uwb_data.da2}, da3={uwb_data.da3}, da4={uwb_data.da4}, da5={uwb_data.da5}, da6={uwb_data.da6}, da7={uwb_data.da7}")
-        
-        # Salvar dados originais
-        db.session.add(uwb_data)
+        trace(rastrear, tag_id, "Registro UWBData do item criado: da0=%s, da1=%s, da2=%s, da3=%s, da4=%s, da5=%s, da6=%s, da7=%s", uwb_data.da0, uwb_data.da1, uwb_data.da2, uwb_data.da3, uwb_data.da4, uwb_data.da5, uwb_data.da6, uwb_data.da7)
         
         # ===== PROCESSAMENTO AUTOMÁTICO COM TRILATERAÇÃO =====
         try:
@@ -621,26 +1258,31 @@ def process_single_uwb_data_item(data):
 
             # CÓDIGO NOVO PARA SUBSTITUIR (linhas ~450-480):
 
-            # 1. CALCULAR A NOVA POSIÇÃO
-            x_atual, y_atual = trilateracao.processar_distancias(
-                da0=uwb_data.da0,
-                da1=uwb_data.da1,
-                da2=uwb_data.da2,
-                da3=uwb_data.da3,
-                da4=uwb_data.da4,
-                da5=uwb_data.da5,
-                da6=uwb_data.da6,
-                da7=uwb_data.da7,
-                kx=kx_relatorio,
-                ky=ky_relatorio
-            )
+            # 1. CALCULAR A NOVA POSIÇÃO (ou usar a já calculada em lote)
+            if posicao is not None:
+                x_atual, y_atual = posicao
+            else:
+                with medir('trilateracao'):
+                    x_atual, y_atual = trilateracao.processar_distancias(
+                        da0=uwb_data.da0,
+                        da1=uwb_data.da1,
+                        da2=uwb_data.da2,
+                        da3=uwb_data.da3,
+                        da4=uwb_data.da4,
+                        da5=uwb_data.da5,
+                        da6=uwb_data.da6,
+                        da7=uwb_data.da7,
+                        kx=kx_relatorio,
+                        ky=ky_relatorio
+                    )
 
             # =================================================================
             # VALIDAÇÃO DE MOVIMENTO MÍNIMO
             # =================================================================
             
-            # 2. BUSCAR A ÚLTIMA POSIÇÃO REGISTRADA PARA ESTA TAG
-            ultima_posicao = UWBDataProcessada.query.filter_by(tag_number=tag_id).order_by(UWBDataProcessada.criado_em.desc()).first()
+            # 2. BUSCAR A ÚLTIMA POSIÇÃO REGISTRADA PARA ESTA TAG (lote atual ou cache em memória)
+            with medir('ultima_posicao'):
+                ultima_posicao = lote.ultima_posicao(tag_id)
             
             gravar_nova_posicao = True  # Assume que vamos gravar por padrão
 
@@ -649,8 +1291,8 @@ def process_single_uwb_data_item(data):
                 variacao_x = abs(x_atual - ultima_posicao.x)
                 variacao_y = abs(y_atual - ultima_posicao.y)
                 
-                logging.info(f"[DEBUG] TAG {tag_id}: Posição Atual(x={x_atual}, y={y_atual}), Anterior(x={ultima_posicao.x}, y={ultima_posicao.y})")
-                logging.info(f"[DEBUG] TAG {tag_id}: Variação(Δx={variacao_x:.2f}, Δy={variacao_y:.2f}), Limite={MOVIMENTO_MINIMO_CM}")
+                trace(rastrear, tag_id, "TAG %s: Posição Atual(x=%s, y=%s), Anterior(x=%s, y=%s)", tag_id, x_atual, y_atual, ultima_posicao.x, ultima_posicao.y)
+                trace(rastrear, tag_id, "TAG %s: Variação(Δx=%.2f, Δy=%.2f), Limite=%s", tag_id, variacao_x, variacao_y, MOVIMENTO_MINIMO_CM)
 
                 # 3. APLICAR A CONDIÇÃO
                 # Se a variação em AMBOS os eixos for menor ou igual ao limite, não grava.
@@ -668,7 +1310,7 @@ def process_single_uwb_data_item(data):
             # =================================================================
 
             if gravar_nova_posicao:
-                logging.info(f"[DEBUG] TAG {tag_id}: Movimento detectado. Gravando nova posição.")
+                trace(rastrear, tag_id, "TAG %s: Movimento detectado. Gravando nova posição.", tag_id)
 
                 # Calcular distância percorrida e tempo decorrido (se houver posição anterior)
                 distancia_percorrida = None
@@ -679,32 +1321,29 @@ def process_single_uwb_data_item(data):
                     dy = y_atual - ultima_posicao.y
                     distancia_percorrida = (dx**2 + dy**2)**0.5
 
-                    delta_tempo = datetime.utcnow() - ultima_posicao.criado_em
+                    delta_tempo = agora - ultima_posicao.criado_em
                     tempo_em_segundos = delta_tempo.total_seconds()
 
-                    logging.info(f"[DEBUG] TAG {tag_id}: Distância percorrida = {distancia_percorrida:.3f} cm")
-                    logging.info(f"[DEBUG] TAG {tag_id}: Tempo decorrido = {tempo_em_segundos:.3f} s")
+                    trace(rastrear, tag_id, "TAG %s: Distância percorrida = %.3f cm", tag_id, distancia_percorrida)
+                    trace(rastrear, tag_id, "TAG %s: Tempo decorrido = %.3f s", tag_id, tempo_em_segundos)
 
                 # Criar e salvar o novo registro processado
                 uwb_data_processada = UWBDataProcessada(
                     tag_number=tag_id,
                     x=x_atual,
                     y=y_atual,
-                    criado_em=datetime.utcnow(),
+                    criado_em=agora,
+                    relatorio_number=relatorio_ativo.relatorio_number,
                     distancia_percorrida=distancia_percorrida,
                     tempo_em_segundos=tempo_em_segundos
                 )
 
-                db.session.add(uwb_data_processada)
-                db.session.commit()
-
-                logging.info(f"[DEBUG] Dados do item salvos com sucesso - Original ID: {uwb_data.id}, Processado ID: {uwb_data_processada.id}")
-
-                return {
+                # data_original/data_processada são preenchidos após o flush (ids)
+                resultado = {
                     'success': True,
                     'message': 'Dados UWB processados e salvos com sucesso.',
-                    'data_original': uwb_data.to_dict(),
-                    'data_processada': uwb_data_processada.to_dict(),
+                    'data_original': None,
+                    'data_processada': None,
                     'posicao': {
                         'x': x_atual,
                         'y': y_atual,
@@ -733,14 +1372,14 @@ def process_single_uwb_data_item(data):
                         'tempo_em_segundos': tempo_em_segundos
                     }
                 }
+                lote.adicionar(resultado, uwb_data, uwb_data_processada)
+                return resultado
             else:
                 # Se a posição não mudou o suficiente, não grave e informe o motivo.
-                logging.info(f"[DEBUG] TAG {tag_id}: Movimento insignificante. Descartando gravação de dados processados.")
+                trace(rastrear, tag_id, "TAG %s: Movimento insignificante. Descartando gravação de dados processados.", tag_id)
                 
-                # Importante: Faça o commit dos dados originais (UWBData) mesmo assim.
-                db.session.commit()
-
-                return {
+                # Importante: Os dados originais (UWBData) são gravados mesmo assim.
+                resultado = {
                     'success': True,
                     'message': 'Dados UWB recebidos, mas a posição da tag não mudou significativamente.',
                     'status': 'dados_descartados_sem_movimento',
@@ -759,15 +1398,17 @@ def process_single_uwb_data_item(data):
                         'limite_movimento': MOVIMENTO_MINIMO_CM,
                         'movimento_detectado': False
                     }
-                }                     
+                }
+                lote.adicionar(resultado, uwb_data)
+                return resultado
         except Exception as processing_error:
-            logging.error(f"[DEBUG] Erro na trilateração do item: {processing_error}")
-            db.session.commit()  # Commit apenas dos dados originais
+            log_ingestao.error("Erro na trilateração do item: %s", processing_error)
             
-            return {
+            # Grava apenas os dados originais
+            resultado = {
                 'success': True,
                 'message': 'Dados UWB salvos (trilateração falhou)',
-                'data_original': uwb_data.to_dict(),
+                'data_original': None,
                 'processing_error': str(processing_error),
                 'relatorio_id': relatorio_ativo.relatorio_number,
                 'relatorio_ativo': True,
@@ -778,47 +1419,214 @@ def process_single_uwb_data_item(data):
                     'erro_trilateracao': str(processing_error)
                 }
             }
+            lote.adicionar(resultado, uwb_data)
+            return resultado
         
     except Exception as e:
-        logging.error(f"[DEBUG] Erro inesperado ao processar item: {e}")
+        log_ingestao.error("Erro inesperado ao processar item: %s", e)
         return {'error': f'Erro inesperado ao processar item: {str(e)}'}
 
 @uwb_bp.route('/uwb/data', methods=['GET'])
 def get_uwb_data():
     """Recuperar dados UWB originais"""
     try:
-        logging.info("[DEBUG] Requisição GET para recuperar dados UWB")
+        log_ingestao.debug("Requisição GET para recuperar dados UWB")
         uwb_records = UWBData.query.order_by(UWBData.criado_em.desc()).limit(50).all()
-        logging.info(f"[DEBUG] {len(uwb_records)} registros UWB encontrados")
+        log_ingestao.debug("%s registros UWB encontrados", len(uwb_records))
         return jsonify([record.to_dict() for record in uwb_records])
     except Exception as e:
-        logging.error(f"[DEBUG] Erro ao recuperar dados UWB: {e}")
+        log_ingestao.error("Erro ao recuperar dados UWB: %s", e)
         return jsonify({'error': f'Erro ao recuperar dados: {str(e)}'}), 500
 
 @uwb_bp.route('/uwb/data/processed', methods=['GET'])
 def get_processed_uwb_data():
     """Recuperar dados UWB processados (com coordenadas X,Y)"""
     try:
-        logging.info("[DEBUG] Requisição GET para recuperar dados UWB processados")
+        log_ingestao.debug("Requisição GET para recuperar dados UWB processados")
         processed_records = UWBDataProcessada.query.order_by(UWBDataProcessada.criado_em.desc()).limit(50).all()
-        logging.info(f"[DEBUG] {len(processed_records)} registros UWB processados encontrados")
+        log_ingestao.debug("%s registros UWB processados encontrados", len(processed_records))
         return jsonify([record.to_dict() for record in processed_records])
     except Exception as e:
-        logging.error(f"[DEBUG] Erro ao recuperar dados processados: {e}")
+        log_ingestao.error("Erro ao recuperar dados processados: %s", e)
         return jsonify({'error': f'Erro ao recuperar dados processados: {str(e)}'}), 500
 
+@uwb_bp.route('/uwb/consulta/<tipo>', methods=['GET'])
+def consultar_dados(tipo):
+    """
+    Consulta paginada (keyset em criado_em/id) de leituras originais, processadas ou com RSSI
+    - filtros: tag, since, until (ISO 8601), relatorio (coluna relatorio_number)
+    - limit (padrão 50, máximo 1000), ordem=desc|asc
+    - cursor: valor de proximo_cursor da página anterior
+    """
+    modelo = MODELOS_CONSULTA.get(tipo)
+    if modelo is None:
+        return jsonify({'error': f'Tipo inválido: {tipo}. Use raw, processed ou rssi'}), 404
+    
+    try:
+        registros, proximo_cursor = consultar_pagina(
+            modelo,
+            tag=request.args.get('tag'),
+            desde=interpretar_data(request.args.get('since'), 'since'),
+            ate=interpretar_data(request.args.get('until'), 'until'),
+            relatorio=request.args.get('relatorio', type=int),
+            limite=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            ordem=request.args.get('ordem', 'desc')
+        )
+        return jsonify({
+            'dados': [registro.to_dict() for registro in registros],
+            'quantidade': len(registros),
+            'proximo_cursor': proximo_cursor
+        })
+    except ErroConsulta as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log_ingestao.error("Erro na consulta de %s: %s", tipo, e)
+        return jsonify({'error': f'Erro ao consultar dados: {str(e)}'}), 500
+
+# Stream SSE de posições: com workers gthread do gunicorn cada conexão ocupa uma thread enquanto aberta.
+# UWB_STREAM_MAX_LEITORES limita as conexões por worker, deixando threads livres para a ingestão.
+STREAM_HEARTBEAT = float(os.environ.get('UWB_STREAM_HEARTBEAT', '10'))
+STREAM_MAX_LEITORES = int(os.environ.get('UWB_STREAM_MAX_LEITORES', '4'))
+STREAM_RECUPERAR = int(os.environ.get('UWB_STREAM_RECUPERAR', '1000'))
+_leitores_stream = threading.BoundedSemaphore(STREAM_MAX_LEITORES)
+
+def _evento_sse(nome, dados, id=None):
+    return (f"id: {id}\n" if id is not None else '') + f"event: {nome}\ndata: {json.dumps(dados)}\n\n"
+
+@uwb_bp.route('/uwb/stream', methods=['GET'])
+def stream_posicoes():
+    """
+    Server-Sent Events com as posições (UWBDataProcessada) à medida que são gravadas pela ingestão
+    - ?tag=3,4: apenas essas tags; ?relatorio=N: apenas posições desse relatório
+    - header Last-Event-ID (ou ?ultimo_id=): envia antes as posições gravadas após a última recebida
+      (as UWB_STREAM_RECUPERAR mais recentes, precedidas de `event: reset` se houver mais)
+    - `event: reset` também quando o leitor atrasa além do buffer do worker (posições perdidas)
+    - ?duracao=: encerra a conexão após esses segundos (padrão: sem limite)
+    - comentários de heartbeat a cada UWB_STREAM_HEARTBEAT segundos sem posições
+    - 503 com Retry-After quando o worker já atende UWB_STREAM_MAX_LEITORES conexões
+    """
+    try:
+        tags = {t.strip() for t in request.args.get('tag', '').split(',') if t.strip()}
+        relatorio = request.args.get('relatorio', type=int)
+        ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+        ultimo_id = int(ultimo_id) if ultimo_id and ultimo_id.isdigit() else None
+        duracao = request.args.get('duracao', type=float)
+    except Exception as e:
+        return jsonify({'error': f'Parâmetros inválidos: {str(e)}'}), 400
+    
+    if not _leitores_stream.acquire(blocking=False):
+        resposta = jsonify({'error': 'Limite de conexões do stream atingido neste worker, tente novamente em instantes'})
+        resposta.headers['Retry-After'] = '5'
+        return resposta, 503
+    
+    try:
+        publicador_posicoes.iniciar_ouvinte(db.engine)
+        # A sequência é lida antes da consulta: o que for gravado durante ela chega pelo buffer
+        inicio = publicador_posicoes.sequencia()
+        recuperados, completo = [], True
+        if ultimo_id is not None:
+            recuperados, completo = publicador_posicoes.recuperar(ultimo_id, tags, relatorio, STREAM_RECUPERAR)
+    except Exception as e:
+        _leitores_stream.release()
+        log_uwb.error("Erro ao iniciar o stream de posições: %s", e)
+        return jsonify({'error': f'Erro ao iniciar o stream: {str(e)}'}), 500
+    
+    def gerar():
+        seq = inicio
+        fim = time.monotonic() + duracao if duracao else None
+        enviados = {evento['id'] for evento in recuperados}
+        yield "retry: 1000\n\n"
+        if not completo:
+            yield _evento_sse('reset', {'motivo': 'lacuna', 'ultimo_id': ultimo_id, 'limite': STREAM_RECUPERAR})
+        for evento in recuperados:
+            yield _evento_sse('posicao', evento, evento['id'])
+        ultimo_envio = time.monotonic()
+        while True:
+            agora = time.monotonic()
+            if fim is not None and agora >= fim:
+                return
+            espera = STREAM_HEARTBEAT if fim is None else min(STREAM_HEARTBEAT, fim - agora)
+            seq, eventos, perdidos = publicador_posicoes.aguardar(seq, espera)
+            if perdidos:
+                yield _evento_sse('reset', {'motivo': 'atraso'})
+            for evento in eventos:
+                # Os workers gravam fora da ordem dos ids: filtra por id em vez de cortar na primeira ocorrência
+                if evento['id'] in enviados or (ultimo_id is not None and evento['id'] <= ultimo_id):
+                    continue
+                if tags and evento['tag_number'] not in tags:
+                    continue
+                if relatorio is not None and evento.get('relatorio_number') != relatorio:
+                    continue
+                yield _evento_sse('posicao', evento, evento['id'])
+                ultimo_envio = time.monotonic()
+            if time.monotonic() - ultimo_envio >= STREAM_HEARTBEAT:
+                yield ": heartbeat\n\n"
+                ultimo_envio = time.monotonic()
+    
+    resposta = Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    resposta.call_on_close(_leitores_stream.release)
+    return resposta
+
+@uwb_bp.route('/uwb/traces', methods=['GET'])
+def get_traces():
+    """
+    Registros recentes do buffer em memória deste worker (traces amostrados e logs da hierarquia uwb)
+    Filtros: ?limite= (padrão 200), ?tag=, ?logger= (ex.: uwb.trace), ?apos= (seq do último registro lido)
+    """
+    try:
+        registros = buffer_traces.obter(
+            limite=request.args.get('limite', 200, type=int),
+            tag=request.args.get('tag'),
+            logger=request.args.get('logger'),
+            apos=request.args.get('apos', type=int)
+        )
+        return jsonify({
+            'amostragem': amostrador.n,
+            'nivel': logging.getLevelName(log_ingestao.getEffectiveLevel()),
+            'total': len(registros),
+            'registros': registros
+        }), 200
+    except Exception as e:
+        log_ingestao.error("Erro ao recuperar traces: %s", e)
+        return jsonify({'error': f'Erro ao recuperar traces: {str(e)}'}), 500
+
+@uwb_bp.route('/uwb/traces/config', methods=['POST'])
+def configurar_traces():
+    """
+    Ajusta o rastreamento deste worker em tempo de execução
+    Body: {"amostragem": N (1 a cada N leituras por tag, 0 desliga), "nivel": "DEBUG" | "INFO" | ...}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if 'amostragem' in data:
+            amostrador.n = int(data['amostragem'])
+        if 'nivel' in data:
+            logging.getLogger('uwb').setLevel(str(data['nivel']).upper())
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Configuração inválida: {str(e)}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'amostragem': amostrador.n,
+        'nivel': logging.getLevelName(log_ingestao.getEffectiveLevel())
+    }), 200
+
 @uwb_bp.route('/uwb/test', methods=['POST'])
 def test_uwb_endpoint():
     """Endpoint de teste para validar diferentes formatos de array"""
     try:
-        logging.info("[DEBUG] Endpoint de teste chamado")
+        log_ingestao.debug("Endpoint de teste chamado")
         data = request.json
         
         if not data or 'range' not in data:
             return jsonify({'error': 'Campo range é obrigatório para teste'}), 400
         
         range_data = data['range']
-        logging.info(f"[DEBUG] Testando conversão de array: {range_data} (tipo: {type(range_data)})")
+        log_ingestao.debug("Testando conversão de array: %s (tipo: %s)", range_data, type(range_data))
         
         # Testar conversão
         range_values = validar_e_converter_array(range_data, "range")
@@ -842,7 +1650,7 @@ def test_uwb_endpoint():
         }), 200
         
     except Exception as e:
-        logging.error(f"[DEBUG] Erro no endpoint de teste: {e}")
+        log_ingestao.error("Erro no endpoint de teste: %s", e)
         return jsonify({
             'error': f'Erro no teste: {str(e)}',
             'input': str(request.get_data())
@@ -0,0 +1,181 @@
+from src.models.user import db
+from src.models.uwb_data import UWBDataProcessada
+from src.models.agregado_posicao import AgregadoPosicao
+from sqlalchemy import select, delete, func
+from datetime import datetime, timedelta
+import logging
+import os
+
+# Resoluções mantidas (segundos), da mais fina para a mais grossa
+RESOLUCOES = (1, 60)
+NOMES_RESOLUCAO = {'1s': 1, '1min': 60}
+
+# Manutenção incremental durante a ingestão (UWB_AGREGADOS=0 desliga; a reconstrução continua disponível)
+AGREGADOS_ATIVOS = os.environ.get('UWB_AGREGADOS', '1') != '0'
+
+# Linhas por comando na reconstrução (limite de parâmetros por comando do SQLite)
+TAMANHO_LOTE_UPSERT = 1000
+
+EPOCA = datetime(1970, 1, 1)
+_CAMPOS = ('amostras', 'soma_x', 'soma_y', 'x_min', 'x_max', 'y_min', 'y_max', 'distancia')
+
+
+def inicio_intervalo(criado_em, resolucao):
+    """criado_em truncado para o início do intervalo de `resolucao` segundos"""
+    passo = timedelta(seconds=resolucao)
+    return EPOCA + ((criado_em - EPOCA) // passo) * passo
+
+
+def agregar(posicoes):
+    """
+    Agrega (tag_number, x, y, criado_em, distancia_percorrida) em todas as RESOLUCOES.
+    Retorna {(resolucao, tag_number, inicio): [amostras, soma_x, soma_y, x_min, x_max, y_min, y_max, distancia]}
+    """
+    agregados = {}
+    for tag_number, x, y, criado_em, distancia in posicoes:
+        if x is None or y is None:
+            continue
+        for resolucao in RESOLUCOES:
+            chave = (resolucao, tag_number, inicio_intervalo(criado_em, resolucao))
+            atual = agregados.get(chave)
+            if atual is None:
+                agregados[chave] = [1, x, y, x, x, y, y, distancia or 0.0]
+            else:
+                atual[0] += 1
+                atual[1] += x
+                atual[2] += y
+                atual[3] = min(atual[3], x)
+                atual[4] = max(atual[4], x)
+                atual[5] = min(atual[5], y)
+                atual[6] = max(atual[6], y)
+                atual[7] += distancia or 0.0
+    return agregados
+
+
+def _linhas(agregados):
+    # Ordenadas pela chave primária: transações concorrentes bloqueiam as linhas na mesma ordem
+    return [
+        dict(zip(('resolucao', 'tag_number', 'inicio') + _CAMPOS, chave + tuple(valores)))
+        for chave, valores in sorted(agregados.items())
+    ]
+
+
+def _upsert(sessao, linhas, somar):
+    """
+    INSERT ... ON CONFLICT DO UPDATE num único comando (PostgreSQL e SQLite).
+    somar=True acumula no intervalo existente (ingestão); somar=False substitui (reconstrução).
+    """
+    dialeto = sessao.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        menor, maior = func.least, func.greatest
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        menor, maior = func.min, func.max
+    else:
+        for linha in linhas:
+            sessao.merge(AgregadoPosicao(**linha))
+        return
+
+    tabela = AgregadoPosicao.__table__
+    comando = insert_dialeto(tabela).values(linhas)
+    novo = comando.excluded
+    if somar:
+        valores = {
+            'amostras': tabela.c.amostras + novo.amostras,
+            'soma_x': tabela.c.soma_x + novo.soma_x,
+            'soma_y': tabela.c.soma_y + novo.soma_y,
+            'x_min': menor(tabela.c.x_min, novo.x_min),
+            'x_max': maior(tabela.c.x_max, novo.x_max),
+            'y_min': menor(tabela.c.y_min, novo.y_min),
+            'y_max': maior(tabela.c.y_max, novo.y_max),
+            'distancia': tabela.c.distancia + novo.distancia
+        }
+    else:
+        valores = {campo: getattr(novo, campo) for campo in _CAMPOS}
+    sessao.execute(comando.on_conflict_do_update(
+        index_elements=[tabela.c.resolucao, tabela.c.tag_number, tabela.c.inicio],
+        set_=valores
+    ))
+
+
+def atualizar_agregados(sessao, posicoes):
+    """
+    Soma as posições gravadas (UWBDataProcessada) aos agregados, na transação da ingestão:
+    o agregado só muda se as posições forem gravadas.
+    """
+    if not AGREGADOS_ATIVOS or not posicoes:
+        return
+    agregados = agregar(
+        (p.tag_number, p.x, p.y, p.criado_em, p.distancia_percorrida) for p in posicoes
+    )
+    if agregados:
+        _upsert(sessao, _linhas(agregados), somar=True)
+
+
+def reconstruir_agregados(desde, ate, tag=None, janela=timedelta(hours=1), progresso=None):
+    """
+    Recalcula os agregados de [desde, ate) a partir de distancias_processadas, janela a janela
+    (uma transação por janela). O intervalo é alinhado à resolução mais grossa para que nenhum
+    agregado seja recalculado pela metade. Intervalos sem posições são removidos.
+    Pensado para períodos históricos: num intervalo que ainda recebe leituras, um lote gravado
+    durante a reconstrução da sua janela pode não ser contado.
+    """
+    maior_resolucao = timedelta(seconds=RESOLUCOES[-1])
+    atual = inicio_intervalo(desde, RESOLUCOES[-1])
+    fim = inicio_intervalo(ate, RESOLUCOES[-1])
+    if fim < ate:
+        fim += maior_resolucao
+    janela = max(janela, maior_resolucao)
+    progresso = progresso if progresso is not None else {}
+    progresso.update({'janelas': 0, 'posicoes': 0, 'intervalos': 0})
+
+    while atual < fim:
+        proximo = min(atual + janela, fim)
+        remocao = delete(AgregadoPosicao).where(AgregadoPosicao.inicio >= atual, AgregadoPosicao.inicio < proximo)
+        consulta = select(
+            UWBDataProcessada.tag_number, UWBDataProcessada.x, UWBDataProcessada.y,
+            UWBDataProcessada.criado_em, UWBDataProcessada.distancia_percorrida
+        ).where(UWBDataProcessada.criado_em >= atual, UWBDataProcessada.criado_em < proximo)
+        if tag:
+            remocao = remocao.where(AgregadoPosicao.tag_number == tag)
+            consulta = consulta.where(UWBDataProcessada.tag_number == tag)
+
+        posicoes = db.session.execute(consulta).all()
+        linhas = _linhas(agregar(posicoes))
+        db.session.execute(remocao)
+        for i in range(0, len(linhas), TAMANHO_LOTE_UPSERT):
+            _upsert(db.session, linhas[i:i + TAMANHO_LOTE_UPSERT], somar=False)
+        db.session.commit()
+
+        progresso['janelas'] += 1
+        progresso['posicoes'] += len(posicoes)
+        progresso['intervalos'] += len(linhas)
+        atual = proximo
+
+    logging.info(f"Agregados reconstruídos de {desde} a {ate}: {progresso['intervalos']} intervalos")
+    return progresso
+
+
+def escolher_resolucao(desde, ate, max_pontos):
+    """A resolução mais fina cujo número de intervalos em [desde, ate] cabe em max_pontos (senão a mais grossa)"""
+    duracao = (ate - desde).total_seconds()
+    for resolucao in RESOLUCOES:
+        if duracao / resolucao <= max_pontos:
+            return resolucao
+    return RESOLUCOES[-1]
+
+
+def consultar_agregados(resolucao, desde, ate, tag=None, limite=None):
+    """Agregados de uma resolução com início em [desde, ate], ordenados por tag e início"""
+    consulta = AgregadoPosicao.query.filter(
+        AgregadoPosicao.resolucao == resolucao,
+        AgregadoPosicao.inicio >= inicio_intervalo(desde, resolucao),
+        AgregadoPosicao.inicio <= ate
+    )
+    if tag:
+        consulta = consulta.filter(AgregadoPosicao.tag_number == tag)
+    consulta = consulta.order_by(AgregadoPosicao.tag_number, AgregadoPosicao.inicio)
+    if limite:
+        consulta = consulta.limit(limite)
+    return consulta.all()
@@ -0,0 +1,55 @@
+from src.models.uwb_data import UWBDataProcessada
+from collections import namedtuple
+import threading
+import time
+import os
+
+# Última posição aceita de uma tag (mesmos campos usados da linha de distancias_processadas)
+UltimaPosicao = namedtuple('UltimaPosicao', ['x', 'y', 'criado_em'])
+
+
+class CachePosicoes:
+    """
+    Cache em memória da última posição aceita de cada tag
+    Evita a consulta ordenada em distancias_processadas a cada leitura:
+    - aquecido sob demanda a partir do banco (uma consulta por tag)
+    - atualizado a cada posição gravada
+    - limpo quando um relatório inicia ou termina
+    As entradas expiram após `ttl` segundos para convergir com gravações feitas por outros workers
+    """
+
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self._posicoes = {}  # tag_number -> (UltimaPosicao ou None, expira_em)
+        self._lock = threading.Lock()
+
+    def obter(self, tag_number):
+        """Retorna a última posição da tag (UltimaPosicao) ou None se a tag ainda não tem posição"""
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._posicoes.get(tag_number)
+        if entrada is not None and entrada[1] > agora:
+            return entrada[0]
+
+        ultima = UWBDataProcessada.query.filter_by(tag_number=tag_number).order_by(
+            UWBDataProcessada.criado_em.desc()
+        ).first()
+        posicao = UltimaPosicao(ultima.x, ultima.y, ultima.criado_em) if ultima else None
+
+        with self._lock:
+            self._posicoes[tag_number] = (posicao, agora + self.ttl)
+        return posicao
+
+    def atualizar(self, tag_number, x, y, criado_em):
+        """Registra a posição recém-gravada como a última da tag"""
+        with self._lock:
+            self._posicoes[tag_number] = (UltimaPosicao(x, y, criado_em), time.monotonic() + self.ttl)
+
+    def limpar(self):
+        """Descarta todas as posições (início/fim de relatório ou falha ao gravar)"""
+        with self._lock:
+            self._posicoes.clear()
+
+
+# Instância global compartilhada pelas rotas
+cache_posicoes = CachePosicoes(ttl=float(os.environ.get('UWB_CACHE_POSICAO_TTL', '10')))
@@ -0,0 +1,74 @@
+from src.models.relatorio import Relatorio
+from collections import namedtuple
+import threading
+import time
+import os
+
+
+class RelatorioAtivo(namedtuple('RelatorioAtivo', ['relatorio_number', 'kx', 'ky', 'inicio_do_relatorio', 'dados'])):
+    """
+    Cópia imutável do relatório ativo, segura para ser compartilhada entre requisições
+    Expõe os mesmos campos usados pelas rotas (relatorio_number, kx, ky) e o mesmo to_dict()
+    """
+
+    @classmethod
+    def de_modelo(cls, relatorio):
+        return cls(
+            relatorio_number=relatorio.relatorio_number,
+            kx=relatorio.kx,
+            ky=relatorio.ky,
+            inicio_do_relatorio=relatorio.inicio_do_relatorio,
+            dados=relatorio.to_dict()
+        )
+
+    def to_dict(self):
+        return dict(self.dados)
+
+
+class CacheRelatorioAtivo:
+    """
+    Cache do relatório ativo (inicio_do_relatorio preenchido e fim_do_relatorio nulo)
+    - invalidar() incrementa a versão; rotas que iniciam/finalizam relatórios devem chamá-lo após o commit
+    - uma leitura do banco iniciada antes de uma invalidação não é guardada (comparação de versão)
+    - o TTL curto faz os outros workers do gunicorn convergirem sem comunicação entre processos
+    """
+
+    def __init__(self, ttl=2.0):
+        self.ttl = ttl
+        self._versao = 0
+        self._entrada = None  # (RelatorioAtivo ou None, expira_em, versao)
+        self._lock = threading.Lock()
+
+    @property
+    def versao(self):
+        return self._versao
+
+    def obter(self):
+        """Retorna o RelatorioAtivo atual ou None se não houver relatório ativo"""
+        agora = time.monotonic()
+        with self._lock:
+            versao = self._versao
+            entrada = self._entrada
+        if entrada is not None and entrada[1] > agora and entrada[2] == versao:
+            return entrada[0]
+
+        relatorio = Relatorio.query.filter(
+            Relatorio.inicio_do_relatorio.isnot(None),
+            Relatorio.fim_do_relatorio.is_(None)
+        ).first()
+        estado = RelatorioAtivo.de_modelo(relatorio) if relatorio else None
+
+        with self._lock:
+            if self._versao == versao:
+                self._entrada = (estado, agora + self.ttl, versao)
+        return estado
+
+    def invalidar(self):
+        """Descarta o estado em cache (chamar após iniciar ou finalizar um relatório)"""
+        with self._lock:
+            self._versao += 1
+            self._entrada = None
+
+
+# Instância global compartilhada pelas rotas
+cache_relatorio = CacheRelatorioAtivo(ttl=float(os.environ.get('UWB_CACHE_RELATORIO_TTL', '2')))
@@ -0,0 +1,99 @@
+from src.models.relatorio import Relatorio
+from src.models.uwb_data import UWBData, UWBDataProcessada
+from src.models.uwb_rssi import UWBDataRSSI
+from sqlalchemy import tuple_
+from datetime import datetime, timezone
+import base64
+import json
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 1000
+
+# Tabelas de leituras expostas pela API (/uwb/consulta/<tipo>, /relatorio/<n>/export?kind=)
+MODELOS_CONSULTA = {
+    'raw': UWBData,
+    'processed': UWBDataProcessada,
+    'rssi': UWBDataRSSI
+}
+
+
+class ErroConsulta(ValueError):
+    """Parâmetro de consulta inválido (responder com 400)"""
+
+
+def codificar_cursor(registro, ordem):
+    """Token opaco de continuação: posição (criado_em, id) do último registro da página"""
+    bruto = json.dumps([registro.criado_em.isoformat(), registro.id, ordem], separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Retorna (criado_em, id, ordem) de um token gerado por codificar_cursor"""
+    try:
+        bruto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        criado_em, registro_id, ordem = json.loads(bruto)
+        return datetime.fromisoformat(criado_em), int(registro_id), ordem
+    except Exception:
+        raise ErroConsulta('Cursor inválido')
+
+
+def interpretar_data(valor, campo):
+    """Data ISO 8601 (com ou sem fuso); as datas do banco são UTC sem fuso"""
+    if not valor:
+        return None
+    try:
+        data = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        raise ErroConsulta(f'{campo} deve ser uma data ISO 8601, recebido: {valor}')
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+
+def verificar_relatorio(relatorio_number):
+    if not Relatorio.query.filter_by(relatorio_number=relatorio_number).first():
+        raise ErroConsulta(f'Relatório {relatorio_number} não encontrado')
+
+
+def consultar_pagina(modelo, tag=None, desde=None, ate=None, relatorio=None,
+                     limite=LIMITE_PADRAO, cursor=None, ordem='desc'):
+    """
+    Página de registros de um modelo com criado_em/id/tag_number, paginada por keyset em (criado_em, id).
+    Cada página é uma busca no índice a partir da posição do cursor, sem OFFSET: páginas profundas
+    custam o mesmo que a primeira.
+    Retorna (registros, proximo_cursor); proximo_cursor é None na última página.
+    """
+    if ordem not in ('asc', 'desc'):
+        raise ErroConsulta("ordem deve ser 'asc' ou 'desc'")
+    limite = max(1, min(int(limite or LIMITE_PADRAO), LIMITE_MAXIMO))
+
+    consulta = modelo.query
+    if tag:
+        consulta = consulta.filter(modelo.tag_number == tag)
+    if relatorio is not None:
+        verificar_relatorio(relatorio)
+        consulta = consulta.filter(modelo.relatorio_number == relatorio)
+    if desde:
+        consulta = consulta.filter(modelo.criado_em >= desde)
+    if ate:
+        consulta = consulta.filter(modelo.criado_em <= ate)
+
+    chave = tuple_(modelo.criado_em, modelo.id)
+    if cursor:
+        criado_em, registro_id, ordem_cursor = decodificar_cursor(cursor)
+        if ordem_cursor != ordem:
+            raise ErroConsulta('Cursor gerado para outra ordem')
+        consulta = consulta.filter(chave < (criado_em, registro_id) if ordem == 'desc'
+                                   else chave > (criado_em, registro_id))
+
+    if ordem == 'desc':
+        consulta = consulta.order_by(modelo.criado_em.desc(), modelo.id.desc())
+    else:
+        consulta = consulta.order_by(modelo.criado_em.asc(), modelo.id.asc())
+
+    # Um registro a mais indica se existe próxima página
+    registros = consulta.limit(limite + 1).all()
+    if len(registros) > limite:
+        registros = registros[:limite]
+        return registros, codificar_cursor(registros[-1], ordem)
+    return registros, None
@@ -0,0 +1,98 @@
+from src.models.user import db
+from sqlalchemy import select, DateTime
+import zlib
+import json
+import csv
+import io
+
+# Linhas buscadas por vez no cursor do servidor (yield_per) e serializadas por bloco enviado
+TAMANHO_BLOCO = 2000
+
+FORMATOS_EXPORTACAO = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def _particoes(modelo, relatorio_number, offset=0, limite=None):
+    """
+    Linhas do relatório em blocos de TAMANHO_BLOCO, ordenadas por id.
+    Com yield_per o PostgreSQL usa um cursor no servidor: só um bloco fica em memória por vez.
+    """
+    tabela = modelo.__table__
+    consulta = (
+        select(*tabela.columns)
+        .where(tabela.c.relatorio_number == relatorio_number)
+        .order_by(tabela.c.id)
+        .offset(offset or None)
+        .limit(limite)
+        .execution_options(yield_per=TAMANHO_BLOCO)
+    )
+    return db.session.execute(consulta).partitions()
+
+
+def _converter_datas(particao, indices):
+    """Linhas com as colunas de data em ISO 8601; só essas colunas são visitadas"""
+    if not indices:
+        return particao
+    linhas = []
+    for linha in particao:
+        linha = list(linha)
+        for i in indices:
+            if linha[i] is not None:
+                linha[i] = linha[i].isoformat()
+        linhas.append(linha)
+    return linhas
+
+
+def _blocos_csv(colunas, datas, particoes, cabecalho):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    if cabecalho:
+        escritor.writerow(colunas)
+    for particao in particoes:
+        escritor.writerows(_converter_datas(particao, datas))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _blocos_ndjson(colunas, datas, particoes):
+    for particao in particoes:
+        yield ''.join(
+            json.dumps(dict(zip(colunas, linha)), separators=(',', ':')) + '\n'
+            for linha in _converter_datas(particao, datas)
+        )
+
+
+def _comprimir(blocos):
+    """gzip em fluxo (zlib com wbits=31); retomadas com offset geram membros gzip concatenáveis"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloco in blocos:
+        dados = compressor.compress(bloco.encode('utf-8'))
+        if dados:
+            yield dados
+    yield compressor.flush()
+
+
+def gerar_exportacao(modelo, relatorio_number, formato='csv', offset=0, limite=None, gzip=False):
+    """
+    Gerador com o conteúdo da exportação de uma tabela de leituras de um relatório.
+    Memória constante: um bloco de linhas por vez, do cursor até a resposta.
+    O cabeçalho do CSV só é enviado quando offset=0, para que retomadas possam ser anexadas ao arquivo.
+    """
+    colunas = [coluna.name for coluna in modelo.__table__.columns]
+    datas = [i for i, coluna in enumerate(modelo.__table__.columns) if isinstance(coluna.type, DateTime)]
+    particoes = _particoes(modelo, relatorio_number, offset, limite)
+    if formato == 'csv':
+        blocos = _blocos_csv(colunas, datas, particoes, cabecalho=not offset)
+    else:
+        blocos = _blocos_ndjson(colunas, datas, particoes)
+
+    if gzip:
+        yield from _comprimir(blocos)
+    else:
+        for bloco in blocos:
+            yield bloco.encode('utf-8')
@@ -0,0 +1,188 @@
+from src.models.user import db
+from src.services.exportacao import TAMANHO_BLOCO
+from sqlalchemy import select, func, DateTime, Integer, String
+import tempfile
+import zipfile
+import shutil
+import re
+import os
+import numpy as np
+
+# pyarrow é opcional: sem ele a exportação colunar é feita em .npz
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FORMATOS_COLUNARES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'npz': 'application/octet-stream'
+}
+
+# Arquivos de relatórios finalizados ficam em disco; a chave inclui contagem e maior id das linhas,
+# então um backfill ou gravação tardia gera um arquivo novo (e o anterior é removido)
+DIRETORIO_CACHE = os.environ.get('UWB_EXPORT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'uwb-export')
+
+
+def formato_colunar_padrao():
+    return 'parquet' if pa is not None else 'npz'
+
+
+def _colunas(modelo):
+    """Colunas exportadas (relatorio_number é constante no arquivo e fica de fora)"""
+    return [coluna for coluna in modelo.__table__.columns if coluna.name != 'relatorio_number']
+
+
+def _dtype(coluna):
+    if isinstance(coluna.type, DateTime):
+        return np.dtype('datetime64[us]')
+    if isinstance(coluna.type, Integer):
+        return np.dtype('int64')
+    return np.dtype('float64')
+
+
+def _particoes(modelo, relatorio_number):
+    tabela = modelo.__table__
+    consulta = (
+        select(*_colunas(modelo))
+        .where(tabela.c.relatorio_number == relatorio_number)
+        .order_by(tabela.c.id)
+        .execution_options(yield_per=TAMANHO_BLOCO)
+    )
+    return db.session.execute(consulta).partitions()
+
+
+def _vetores(colunas, particao):
+    """Converte um bloco de linhas em vetores numpy, coluna a coluna (None -> NaN/NaT)"""
+    valores = list(zip(*particao))
+    vetores = {}
+    for coluna, coluna_valores in zip(colunas, valores):
+        if isinstance(coluna.type, String):
+            vetores[coluna.name] = coluna_valores
+        else:
+            vetores[coluna.name] = np.array(coluna_valores, dtype=_dtype(coluna))
+    return vetores
+
+
+def _escrever_parquet(modelo, relatorio_number, destino):
+    """Um row group por bloco lido do cursor: só um bloco fica em memória"""
+    colunas = _colunas(modelo)
+    esquema = pa.schema([
+        (coluna.name, pa.string() if isinstance(coluna.type, String)
+         else pa.timestamp('us') if isinstance(coluna.type, DateTime)
+         else pa.int64() if isinstance(coluna.type, Integer)
+         else pa.float64())
+        for coluna in colunas
+    ])
+    with pq.ParquetWriter(destino, esquema, compression='zstd') as escritor:
+        for particao in _particoes(modelo, relatorio_number):
+            vetores = _vetores(colunas, particao)
+            escritor.write_table(pa.table({
+                coluna.name: pa.array(vetores[coluna.name], type=esquema.field(coluna.name).type,
+                                      from_pandas=True)
+                for coluna in colunas
+            }, schema=esquema))
+
+
+def _escrever_npz(modelo, relatorio_number, destino):
+    """
+    .npz com um vetor por coluna. Cada bloco do cursor é anexado ao arquivo temporário da sua coluna
+    e, no fim, cada arquivo vira um .npy do zip. A memória usada é a de um bloco, não a do relatório.
+    Textos (tag_number) são codificados como índices em <coluna>_categorias.
+    """
+    colunas = _colunas(modelo)
+    buffers = {}
+    categorias = {}
+    total = 0
+    try:
+        for coluna in colunas:
+            buffers[coluna.name] = tempfile.TemporaryFile()
+        for particao in _particoes(modelo, relatorio_number):
+            vetores = _vetores(colunas, particao)
+            for coluna in colunas:
+                vetor = vetores[coluna.name]
+                if isinstance(coluna.type, String):
+                    indices = categorias.setdefault(coluna.name, {})
+                    vetor = np.array([indices.setdefault(v, len(indices)) for v in vetor], dtype='int32')
+                buffers[coluna.name].write(vetor.tobytes())
+            total += len(particao)
+
+        with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as arquivo:
+            for coluna in colunas:
+                dtype = np.dtype('int32') if isinstance(coluna.type, String) else _dtype(coluna)
+                with arquivo.open(f'{coluna.name}.npy', 'w', force_zip64=True) as membro:
+                    np.lib.format.write_array_header_2_0(membro, {
+                        'descr': np.lib.format.dtype_to_descr(dtype),
+                        'fortran_order': False,
+                        'shape': (total,)
+                    })
+                    buffers[coluna.name].seek(0)
+                    shutil.copyfileobj(buffers[coluna.name], membro)
+            for nome, indices in categorias.items():
+                with arquivo.open(f'{nome}_categorias.npy', 'w') as membro:
+                    np.lib.format.write_array(membro, np.array(list(indices), dtype=str))
+    finally:
+        for buffer in buffers.values():
+            buffer.close()
+
+
+def _assinatura(modelo, relatorio_number):
+    """(quantidade, maior id) das linhas do relatório, pelo índice de relatorio_number"""
+    tabela = modelo.__table__
+    return db.session.execute(
+        select(func.count(), func.max(tabela.c.id)).where(tabela.c.relatorio_number == relatorio_number)
+    ).one()
+
+
+def _nome_cache(modelo, relatorio_number, formato, quantidade, maior_id):
+    return f'relatorio_{relatorio_number}_{modelo.__tablename__}_{quantidade}_{maior_id}.{formato}'
+
+
+def _remover_versoes_antigas(modelo, relatorio_number, formato, atual):
+    """Remove os arquivos em cache do mesmo relatório, tabela e formato com outra assinatura"""
+    padrao = re.compile(rf'relatorio_{relatorio_number}_{re.escape(modelo.__tablename__)}_\d+_\d+\.{re.escape(formato)}$')
+    for nome in os.listdir(DIRETORIO_CACHE):
+        if nome != atual and padrao.match(nome):
+            try:
+                os.remove(os.path.join(DIRETORIO_CACHE, nome))
+            except FileNotFoundError:
+                pass  # removido por outro worker
+
+
+def gerar_arquivo_colunar(modelo, relatorio_number, formato, finalizado):
+    """
+    Gera o arquivo colunar do relatório e retorna (caminho, temporario).
+    Relatórios finalizados são servidos do cache em disco quando o arquivo já existe;
+    para relatórios ativos o arquivo é temporário e deve ser removido após o envio.
+    """
+    if formato == 'parquet' and pa is None:
+        raise RuntimeError('pyarrow não está instalado; use format=npz')
+    escrever = _escrever_parquet if formato == 'parquet' else _escrever_npz
+
+    if finalizado:
+        quantidade, maior_id = _assinatura(modelo, relatorio_number)
+        os.makedirs(DIRETORIO_CACHE, exist_ok=True)
+        caminho = os.path.join(
+            DIRETORIO_CACHE, _nome_cache(modelo, relatorio_number, formato, quantidade, maior_id or 0)
+        )
+        if os.path.exists(caminho):
+            return caminho, False
+    else:
+        caminho = None
+
+    descritor, temporario = tempfile.mkstemp(suffix=f'.{formato}', dir=DIRETORIO_CACHE if finalizado else None)
+    os.close(descritor)
+    try:
+        escrever(modelo, relatorio_number, temporario)
+    except Exception:
+        os.remove(temporario)
+        raise
+
+    if caminho is None:
+        return temporario, True
+    # Troca atômica: outro worker pode estar gerando o mesmo arquivo
+    os.replace(temporario, caminho)
+    _remover_versoes_antigas(modelo, relatorio_number, formato, os.path.basename(caminho))
+    return caminho, False
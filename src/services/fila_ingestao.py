@@ -0,0 +1,204 @@
+from src.services.rastreamento import log_ingestao
+import queue
+import threading
+import time
+import os
+
+# Marcador colocado na fila por parar() para acordar a thread de escrita
+_FIM = object()
+
+
+class _Marcador:
+    """Colocado na fila por esvaziar(): sinaliza quando todas as leituras anteriores foram gravadas"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+
+
+class FilaIngestao:
+    """
+    Fila de ingestão com gravação em segundo plano (write-behind)
+    - enfileirar() aceita leituras já validadas ou recusa todas se não houver espaço (backpressure)
+    - uma thread por worker drena lotes de até `tamanho_lote` leituras ou a cada `intervalo` segundos
+      e os entrega ao processador (trilateração em lote + gravação numa única transação)
+    - esvaziar() espera a gravação de tudo o que já foi aceito (antes de finalizar um relatório)
+    - parar() drena o que restou na fila (desligamento do worker)
+    A thread é criada sob demanda no processo que enfileira, o que é seguro com preload_app do gunicorn.
+    """
+
+    def __init__(self, capacidade=5000, tamanho_lote=200, intervalo=0.5):
+        self.capacidade = capacidade
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self._app = None
+        self._processador = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fila = None
+        self._pendentes = 0  # leituras enfileiradas ou no lote em gravação
+        self._thread = None
+        self._parar = threading.Event()
+        self.processadas = 0
+        self.falhas = 0
+        self.recusadas = 0
+        self.ultimo_lote = None
+
+    def configurar(self, app, processador):
+        """
+        processador(itens) recebe a lista de leituras de um lote, é chamado dentro do app context
+        e retorna quantas foram gravadas (as demais contam como falhas)
+        """
+        self._app = app
+        self._processador = processador
+
+    @property
+    def profundidade(self):
+        """Leituras aceitas e ainda não gravadas (na fila ou no lote em gravação) neste worker"""
+        return self._pendentes if self._pid == os.getpid() else 0
+
+    def enfileirar(self, itens):
+        """Enfileira todas as leituras ou nenhuma. Retorna False se a fila não comporta o lote."""
+        with self._lock:
+            self._garantir_thread()
+            if self._pendentes + len(itens) > self.capacidade:
+                self.recusadas += len(itens)
+                return False
+            self._pendentes += len(itens)
+            for item in itens:
+                self._fila.put_nowait(item)
+        return True
+
+    def _garantir_thread(self):
+        # Após o fork do gunicorn a thread do processo pai não existe no worker
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            if self._pid != os.getpid():
+                self._fila = queue.Queue()
+                self._pendentes = 0
+                self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name='uwb-fila-ingestao', daemon=True)
+            self._thread.start()
+
+    def _coletar_lote(self):
+        """(lote, marcador): o lote termina antes do prazo se chegar um marcador de esvaziar()"""
+        try:
+            item = self._fila.get(timeout=self.intervalo)
+        except queue.Empty:
+            return [], None
+        if item is _FIM:
+            return [], None
+        if isinstance(item, _Marcador):
+            return [], item
+        lote = [item]
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tamanho_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = self._fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            if item is _FIM:
+                break
+            if isinstance(item, _Marcador):
+                return lote, item
+            lote.append(item)
+        return lote, None
+
+    def _executar(self):
+        while not self._parar.is_set():
+            lote, marcador = self._coletar_lote()
+            if lote:
+                self._gravar(lote)
+            if marcador is not None:
+                marcador.evento.set()
+        self.drenar()
+
+    def _gravar(self, lote):
+        inicio = time.perf_counter()
+        try:
+            with self._app.app_context():
+                gravadas = self._processador(lote)
+            gravadas = len(lote) if gravadas is None else gravadas
+            self.processadas += gravadas
+            self.falhas += len(lote) - gravadas
+        except Exception as e:
+            self.falhas += len(lote)
+            log_ingestao.exception("Falha ao gravar lote de %s leituras da fila: %s", len(lote), e)
+        with self._lock:
+            self._pendentes -= len(lote)
+        self.ultimo_lote = {
+            'leituras': len(lote),
+            'duracao_ms': round((time.perf_counter() - inicio) * 1000, 2),
+            'gravado_em': time.time()
+        }
+
+    def drenar(self):
+        """Grava imediatamente tudo o que está na fila, em lotes de tamanho_lote"""
+        if self._fila is None or self._pid != os.getpid():
+            return
+        while True:
+            lote = []
+            marcadores = []
+            while len(lote) < self.tamanho_lote:
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Marcador):
+                    marcadores.append(item)
+                elif item is not _FIM:
+                    lote.append(item)
+            if lote:
+                self._gravar(lote)
+            for marcador in marcadores:
+                marcador.evento.set()
+            if not lote and not marcadores:
+                return
+
+    def esvaziar(self, timeout=10.0):
+        """
+        Espera a gravação de todas as leituras já aceitas por este worker (fila e lote em formação).
+        Retorna False se o prazo acabou antes. Leituras de outros workers não são aguardadas.
+        """
+        if self._fila is None or self._pid != os.getpid():
+            return True
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self.drenar()
+            return True
+        marcador = _Marcador()
+        self._fila.put(marcador)
+        return marcador.evento.wait(timeout)
+
+    def parar(self, timeout=10.0):
+        """Interrompe a thread de escrita e grava o que restou (chamado no desligamento do worker)"""
+        self._parar.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._fila.put(_FIM)
+            thread.join(timeout)
+        else:
+            self.drenar()
+
+    def status(self):
+        return {
+            'profundidade': self.profundidade,
+            'capacidade': self.capacidade,
+            'tamanho_lote': self.tamanho_lote,
+            'intervalo_s': self.intervalo,
+            'processadas': self.processadas,
+            'falhas': self.falhas,
+            'recusadas': self.recusadas,
+            'ultimo_lote': self.ultimo_lote
+        }
+
+
+# Instância global; a ingestão assíncrona é habilitada com UWB_INGESTAO_ASSINCRONA=1
+INGESTAO_ASSINCRONA = os.environ.get('UWB_INGESTAO_ASSINCRONA') == '1'
+fila_ingestao = FilaIngestao(
+    capacidade=int(os.environ.get('UWB_FILA_CAPACIDADE', '5000')),
+    tamanho_lote=int(os.environ.get('UWB_FILA_TAMANHO_LOTE', '200')),
+    intervalo=float(os.environ.get('UWB_FILA_INTERVALO', '0.5'))
+)
@@ -0,0 +1,125 @@
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
+from contextlib import contextmanager
+from flask import request, g
+import time
+import os
+
+# Métricas no formato do Prometheus (GET /metrics).
+# Com o gunicorn, cada worker grava os valores em arquivos mmap em PROMETHEUS_MULTIPROC_DIR
+# (definido em gunicorn.conf.py antes da aplicação ser importada) e /metrics soma os arquivos
+# de todos os workers; sem a variável (flask run, testes) vale o registro do próprio processo.
+
+_BUCKETS_ETAPA = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+_BUCKETS_HTTP = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+duracao_requisicao = Histogram(
+    'uwb_http_request_duration_seconds', 'Duração das requisições HTTP por rota',
+    ['metodo', 'rota', 'status'], buckets=_BUCKETS_HTTP
+)
+duracao_etapa = Histogram(
+    'uwb_ingestao_etapa_duration_seconds', 'Duração de cada etapa da ingestão de leituras',
+    ['etapa'], buckets=_BUCKETS_ETAPA
+)
+leituras = Counter(
+    'uwb_leituras_total', 'Leituras recebidas por resultado', ['resultado']
+)
+caminhos_solver = Counter(
+    'uwb_solver_caminho_total', 'Posições calculadas por caminho do solver', ['caminho']
+)
+
+# Etapas da ingestão:
+#   json             -> leitura e parse do corpo da requisição
+#   relatorio_ativo  -> consulta (ou cache) do relatório ativo
+#   ultima_posicao   -> última posição da tag (lote atual, cache ou banco)
+#   trilateracao     -> processar_distancias de uma leitura
+#   trilateracao_lote-> processar_lote de um POST em array (uma observação por lote)
+#   gravacao         -> flush + commit de LoteIngestao
+ETAPAS = ('json', 'relatorio_ativo', 'ultima_posicao', 'trilateracao', 'trilateracao_lote', 'gravacao')
+RESULTADOS = ('aceita', 'descartada_sem_movimento', 'calibracao', 'sem_relatorio', 'invalida', 'falha')
+CAMINHOS_SOLVER = ('basica', 'minimos_quadrados', 'fallback')
+
+
+@contextmanager
+def medir(etapa):
+    """Observa a duração do bloco no histograma da etapa de ingestão"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao_etapa.labels(etapa).observe(time.perf_counter() - inicio)
+
+
+def contar_caminho(caminho, quantidade=1):
+    if quantidade:
+        caminhos_solver.labels(caminho).inc(quantidade)
+
+
+def classificar_resultado(resultado):
+    """Resultado de process_single_uwb_data_item -> rótulo de uwb_leituras_total (None: ainda na fila)"""
+    if resultado.get('status') == 'enfileirado':
+        return None
+    if 'error' in resultado:
+        # Mensagens de validação descrevem o campo; falhas de processamento/gravação começam com "Erro"
+        return 'falha' if str(resultado['error']).startswith('Erro') else 'invalida'
+    if resultado.get('tag_type') == 'calibracao':
+        return 'calibracao'
+    if resultado.get('relatorio_ativo') is False:
+        return 'sem_relatorio'
+    if resultado.get('status') == 'dados_descartados_sem_movimento':
+        return 'descartada_sem_movimento'
+    if 'processing_error' in resultado:
+        return 'falha'
+    return 'aceita'
+
+
+def contar_resultados(resultados):
+    """Conta os resultados finais (após a gravação) de um conjunto de leituras"""
+    contagem = {}
+    for resultado in resultados:
+        rotulo = classificar_resultado(resultado)
+        if rotulo:
+            contagem[rotulo] = contagem.get(rotulo, 0) + 1
+    for rotulo, quantidade in contagem.items():
+        leituras.labels(rotulo).inc(quantidade)
+
+
+def instrumentar_app(app):
+    """
+    Histograma de duração por rota (regra da URL, não o caminho, para limitar a cardinalidade).
+    Em respostas em fluxo (stream SSE, exportações) mede até o início do envio.
+    """
+
+    @app.before_request
+    def _iniciar_medicao():
+        g.inicio_requisicao = time.perf_counter()
+
+    @app.after_request
+    def _registrar_medicao(resposta):
+        inicio = g.pop('inicio_requisicao', None)
+        if inicio is not None:
+            rota = request.url_rule.rule if request.url_rule is not None else 'nao_encontrada'
+            duracao_requisicao.labels(request.method, rota, str(resposta.status_code)).observe(
+                time.perf_counter() - inicio
+            )
+        return resposta
+
+
+def gerar_metricas():
+    """(conteúdo, content-type) da exposição no formato texto do Prometheus"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
+
+# Séries criadas com zero: rate() e alertas funcionam desde a primeira ocorrência de cada rótulo
+for _etapa in ETAPAS:
+    duracao_etapa.labels(_etapa)
+for _resultado in RESULTADOS:
+    leituras.labels(_resultado)
+for _caminho in CAMINHOS_SOLVER:
+    caminhos_solver.labels(_caminho)
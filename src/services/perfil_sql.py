@@ -0,0 +1,124 @@
+from src.models.user import db
+from src.services.rastreamento import log_sql
+from flask import g, request, has_app_context
+from sqlalchemy import event
+import time
+import os
+
+# Perfil das consultas SQL de cada requisição, pelos eventos do engine (SQLite e PostgreSQL):
+# quantidade de comandos, tempo total, o mais lento e comandos idênticos repetidos (N+1).
+# Consultas feitas fora de requisições (fila de ingestão, backfill) não são contadas.
+PERFIL_SQL_ATIVO = os.environ.get('UWB_SQL_PERFIL', '1') != '0'
+# Requisições mais lentas que isto (ms) são registradas em uwb.sql com o detalhamento
+LIMITE_LENTA_MS = float(os.environ.get('UWB_SQL_LENTA_MS', '500'))
+# Um mesmo comando executado ao menos esta quantidade de vezes numa requisição é um suspeito de N+1
+LIMITE_REPETICOES = int(os.environ.get('UWB_SQL_REPETICOES', '5'))
+# Com UWB_SQL_DEBUG=1 toda resposta leva o resumo no cabeçalho X-UWB-SQL
+CABECALHO_DEBUG = os.environ.get('UWB_SQL_DEBUG') == '1'
+
+_INICIOS = 'perfil_sql_inicios'
+
+
+class PerfilSQL:
+    """Consultas de uma requisição, agrupadas pelo texto do comando (parâmetros ficam de fora)"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo = 0.0
+        self.mais_lenta = 0.0
+        self.sql_mais_lenta = None
+        self.comandos = {}  # sql -> [execuções, tempo]
+
+    def registrar(self, sql, duracao):
+        self.consultas += 1
+        self.tempo += duracao
+        if duracao > self.mais_lenta:
+            self.mais_lenta = duracao
+            self.sql_mais_lenta = sql
+        comando = self.comandos.get(sql)
+        if comando is None:
+            self.comandos[sql] = [1, duracao]
+        else:
+            comando[0] += 1
+            comando[1] += duracao
+
+    def repetidos(self):
+        """Comandos executados LIMITE_REPETICOES vezes ou mais, do mais repetido ao menos"""
+        return sorted(
+            ((sql, execucoes, tempo) for sql, (execucoes, tempo) in self.comandos.items()
+             if execucoes >= LIMITE_REPETICOES),
+            key=lambda item: item[1], reverse=True
+        )
+
+    def cabecalho(self):
+        return (f'consultas={self.consultas}; tempo_ms={self.tempo * 1000:.2f}; '
+                f'mais_lenta_ms={self.mais_lenta * 1000:.2f}; repetidos={len(self.repetidos())}')
+
+    def detalhamento(self, duracao):
+        linhas = [
+            f'{request.method} {request.path}: {duracao * 1000:.1f} ms, '
+            f'{self.consultas} consultas SQL em {self.tempo * 1000:.1f} ms'
+        ]
+        if self.sql_mais_lenta:
+            linhas.append(f'  mais lenta ({self.mais_lenta * 1000:.1f} ms): {_resumir(self.sql_mais_lenta)}')
+        for sql, execucoes, tempo in self.repetidos():
+            linhas.append(f'  N+1? {execucoes}x em {tempo * 1000:.1f} ms: {_resumir(sql)}')
+        return '\n'.join(linhas)
+
+
+def _resumir(sql, tamanho=200):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= tamanho else sql[:tamanho] + '...'
+
+
+def _antes_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_INICIOS, []).append(time.perf_counter())
+
+
+def _depois_da_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get(_INICIOS)
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    if has_app_context():
+        perfil = g.get('perfil_sql')
+        if perfil is not None:
+            perfil.registrar(statement, duracao)
+
+
+def _erro_na_consulta(contexto):
+    # Um comando que falha não chega em after_cursor_execute: descarta o seu início
+    conexao = contexto.connection
+    if conexao is not None and conexao.info.get(_INICIOS):
+        conexao.info[_INICIOS].pop()
+
+
+def instrumentar_sql(app):
+    """
+    Registra os eventos do engine e os hooks de requisição.
+    Em respostas em fluxo (stream SSE, exportações) conta as consultas até o início do envio.
+    """
+    if not PERFIL_SQL_ATIVO:
+        return
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _antes_da_consulta)
+        event.listen(db.engine, 'after_cursor_execute', _depois_da_consulta)
+        event.listen(db.engine, 'handle_error', _erro_na_consulta)
+
+    @app.before_request
+    def _iniciar_perfil_sql():
+        g.perfil_sql = PerfilSQL()
+
+    @app.after_request
+    def _registrar_perfil_sql(resposta):
+        perfil = g.pop('perfil_sql', None)
+        if perfil is None:
+            return resposta
+        duracao = time.perf_counter() - perfil.inicio
+        if duracao * 1000 >= LIMITE_LENTA_MS:
+            log_sql.warning("Requisição lenta %s", perfil.detalhamento(duracao))
+        if CABECALHO_DEBUG:
+            resposta.headers['X-UWB-SQL'] = perfil.cabecalho()
+        return resposta
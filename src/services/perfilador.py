@@ -0,0 +1,135 @@
+from src.services.rastreamento import log_uwb
+from flask import g, request
+import itertools
+import cProfile
+import tempfile
+import hmac
+import time
+import re
+import os
+
+# Perfilador sob demanda (cProfile) dos workers. Desligado a menos que UWB_PROFILER_SEGREDO esteja
+# definido: sem segredo nenhum hook é registrado e o custo por requisição é zero.
+# Com o segredo, uma requisição é perfilada quando:
+#   - traz o cabeçalho X-UWB-Profile com o segredo
+#   - é a N-ésima do worker (UWB_PROFILER_AMOSTRAGEM=N; 0 desliga a amostragem)
+#   - chega durante uma janela aberta por POST /perfilador/janela (apenas no worker que a recebeu)
+SEGREDO = os.environ.get('UWB_PROFILER_SEGREDO') or None
+CABECALHO = 'X-UWB-Profile'
+DIRETORIO = os.environ.get('UWB_PROFILER_DIR') or os.path.join(tempfile.gettempdir(), 'uwb-perfis')
+MAX_ARQUIVOS = int(os.environ.get('UWB_PROFILER_MAX_ARQUIVOS', '50'))
+JANELA_MAXIMA_S = 300
+
+_NOME_ARQUIVO = re.compile(r'^[\w.-]+\.pstats$')
+
+
+class Perfilador:
+
+    def __init__(self, amostragem=0):
+        self.amostragem = amostragem
+        self.janela_ate = 0.0  # time.monotonic() até quando todas as requisições são perfiladas
+        self._contador = itertools.count(1)
+        self._sequencia = itertools.count(1)  # desempata perfis do mesmo worker no mesmo segundo
+
+    def segredo_valido(self, valor):
+        return SEGREDO is not None and valor is not None and hmac.compare_digest(valor, SEGREDO)
+
+    def abrir_janela(self, segundos):
+        """Perfila todas as requisições deste worker pelos próximos `segundos` (0 fecha a janela)"""
+        segundos = max(0.0, min(float(segundos), JANELA_MAXIMA_S))
+        self.janela_ate = time.monotonic() + segundos if segundos else 0.0
+        return segundos
+
+    def janela_restante(self):
+        return max(0.0, self.janela_ate - time.monotonic())
+
+    def deve_perfilar(self):
+        if self.segredo_valido(request.headers.get(CABECALHO)):
+            return 'cabecalho'
+        if self.janela_ate and time.monotonic() < self.janela_ate:
+            return 'janela'
+        if self.amostragem > 0 and next(self._contador) % self.amostragem == 0:
+            return 'amostragem'
+        return None
+
+    def gravar(self, perfil, duracao):
+        """Grava o .pstats (escrita atômica) e mantém no diretório apenas os MAX_ARQUIVOS mais recentes"""
+        os.makedirs(DIRETORIO, exist_ok=True)
+        rota = re.sub(r'[^\w-]+', '_', request.path).strip('_') or 'raiz'
+        nome = (f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}_{os.getpid()}_{next(self._sequencia)}_"
+                f"{request.method}_{rota[:60]}_{duracao * 1000:.0f}ms.pstats")
+        descritor, temporario = tempfile.mkstemp(dir=DIRETORIO, suffix='.tmp')
+        os.close(descritor)
+        perfil.dump_stats(temporario)
+        os.replace(temporario, os.path.join(DIRETORIO, nome))
+        self._rotacionar()
+        return nome
+
+    def _rotacionar(self):
+        arquivos = listar_perfis()
+        for arquivo in arquivos[MAX_ARQUIVOS:]:
+            try:
+                os.remove(os.path.join(DIRETORIO, arquivo['nome']))
+            except FileNotFoundError:
+                pass  # removido por outro worker
+
+
+def listar_perfis():
+    """Arquivos .pstats do diretório, do mais recente ao mais antigo"""
+    if not os.path.isdir(DIRETORIO):
+        return []
+    arquivos = []
+    for entrada in os.scandir(DIRETORIO):
+        if entrada.is_file() and _NOME_ARQUIVO.match(entrada.name):
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue
+            arquivos.append({'nome': entrada.name, 'bytes': info.st_size, 'modificado_em': info.st_mtime})
+    return sorted(arquivos, key=lambda arquivo: arquivo['modificado_em'], reverse=True)
+
+
+def caminho_perfil(nome):
+    """Caminho de um arquivo listado, ou None (nomes fora do padrão não saem do diretório)"""
+    if not _NOME_ARQUIVO.match(nome):
+        return None
+    caminho = os.path.join(DIRETORIO, nome)
+    return caminho if os.path.isfile(caminho) else None
+
+
+perfilador = Perfilador(amostragem=int(os.environ.get('UWB_PROFILER_AMOSTRAGEM', '0')))
+
+
+def instrumentar_perfilador(app):
+    """Registra os hooks de requisição apenas quando o perfilador está habilitado (segredo definido)"""
+    if SEGREDO is None:
+        return
+
+    @app.before_request
+    def _iniciar_perfil():
+        if request.path.startswith('/api/perfilador'):
+            return
+        motivo = perfilador.deve_perfilar()
+        if motivo is None:
+            return
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            return  # outro perfilador ativo neste processo
+        g.perfil_cprofile = (perfil, motivo, time.perf_counter())
+
+    @app.after_request
+    def _gravar_perfil(resposta):
+        estado = g.pop('perfil_cprofile', None)
+        if estado is None:
+            return resposta
+        perfil, motivo, inicio = estado
+        perfil.disable()
+        try:
+            nome = perfilador.gravar(perfil, time.perf_counter() - inicio)
+            if motivo == 'cabecalho':
+                resposta.headers['X-UWB-Profile-Arquivo'] = nome
+        except Exception as e:
+            log_uwb.error("Erro ao gravar perfil da requisição: %s", e)
+        return resposta
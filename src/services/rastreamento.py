@@ -0,0 +1,96 @@
+from collections import deque
+import itertools
+import logging
+import threading
+import os
+
+# Hierarquia de loggers da API UWB:
+#   uwb            -> nível em UWB_LOG_LEVEL (padrão INFO), propaga para o logging do gunicorn
+#   uwb.ingestao   -> recebimento e validação das leituras
+#   uwb.solver     -> trilateração
+#   uwb.sql        -> requisições lentas com o detalhamento das consultas SQL (perfil_sql)
+#   uwb.trace      -> rastreamento amostrado por tag (1 a cada UWB_TRACE_AMOSTRAGEM leituras),
+#                     guardado apenas no buffer em memória, a menos que UWB_TRACE_STDOUT=1
+log_uwb = logging.getLogger('uwb')
+log_ingestao = logging.getLogger('uwb.ingestao')
+log_solver = logging.getLogger('uwb.solver')
+log_sql = logging.getLogger('uwb.sql')
+log_trace = logging.getLogger('uwb.trace')
+
+
+class BufferCircularHandler(logging.Handler):
+    """Handler que guarda em memória os últimos `capacidade` registros, para consulta sob demanda"""
+
+    def __init__(self, capacidade=2000):
+        super().__init__(logging.DEBUG)
+        self._registros = deque(maxlen=capacidade)
+        self._sequencia = itertools.count(1)
+
+    def emit(self, record):
+        try:
+            self._registros.append({
+                'seq': next(self._sequencia),
+                'timestamp': record.created,
+                'logger': record.name,
+                'nivel': record.levelname,
+                'tag': getattr(record, 'tag', None),
+                'mensagem': record.getMessage()
+            })
+        except Exception:
+            self.handleError(record)
+
+    def obter(self, limite=200, tag=None, logger=None, apos=None):
+        """Registros mais recentes (ordem cronológica), com filtros opcionais por tag, logger e seq"""
+        registros = list(self._registros)
+        if apos is not None:
+            registros = [r for r in registros if r['seq'] > apos]
+        if tag is not None:
+            registros = [r for r in registros if r['tag'] == tag]
+        if logger is not None:
+            registros = [r for r in registros if r['logger'] == logger or r['logger'].startswith(logger + '.')]
+        return registros[-limite:] if limite else registros
+
+
+class AmostradorTag:
+    """Decide quais leituras são rastreadas: 1 a cada `n` leituras de cada tag (n <= 0 desliga)"""
+
+    def __init__(self, n=0):
+        self.n = n
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def deve_rastrear(self, tag):
+        if self.n <= 0:
+            return False
+        with self._lock:
+            contador = self._contadores.get(tag, 0)
+            self._contadores[tag] = contador + 1
+        return contador % self.n == 0
+
+
+buffer_traces = BufferCircularHandler(capacidade=int(os.environ.get('UWB_TRACE_BUFFER', '2000')))
+amostrador = AmostradorTag(n=int(os.environ.get('UWB_TRACE_AMOSTRAGEM', '0')))
+
+
+def configurar_logging():
+    """Configura os níveis e o buffer circular da hierarquia uwb (idempotente)"""
+    if buffer_traces not in log_uwb.handlers:
+        log_uwb.addHandler(buffer_traces)
+    log_uwb.setLevel(os.environ.get('UWB_LOG_LEVEL', 'INFO').upper())
+
+    # Com propagação, o buffer de uwb já recebe os traces
+    log_trace.setLevel(logging.DEBUG)
+    log_trace.propagate = os.environ.get('UWB_TRACE_STDOUT') == '1'
+    if log_trace.propagate:
+        log_trace.removeHandler(buffer_traces)
+    elif buffer_traces not in log_trace.handlers:
+        log_trace.addHandler(buffer_traces)
+
+
+def trace(rastrear, tag, mensagem, *args):
+    """Registra uma linha de rastreamento da leitura, apenas se ela foi amostrada"""
+    if rastrear:
+        log_trace.debug(mensagem, *args, extra={'tag': tag})
+
+
+configurar_logging()
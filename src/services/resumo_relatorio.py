@@ -0,0 +1,174 @@
+from src.models.user import db
+from src.models.uwb_data import UWBData, UWBDataProcessada
+from src.models.resumo_relatorio import ResumoRelatorio
+from src.models.relatorio import Relatorio
+from src.models.arquivo_leituras import ArquivoLeituras
+from sqlalchemy import select, func
+from datetime import datetime
+import numpy as np
+import logging
+import json
+
+
+def _valor(v, casas=3):
+    """float numpy -> float Python arredondado, ou None se não for finito"""
+    v = float(v)
+    return round(v, casas) if np.isfinite(v) else None
+
+
+def calcular_resumo(relatorio_number):
+    """
+    Calcula (sem gravar) o resumo por tag de um relatório numa única passada vetorizada
+    sobre as posições do relatório, ordenadas por tag e criado_em.
+    A primeira posição de cada tag não entra em distância/velocidade: o seu deslocamento
+    é medido em relação à última posição anterior ao relatório.
+    """
+    linhas = db.session.execute(
+        select(
+            UWBDataProcessada.tag_number,
+            UWBDataProcessada.criado_em,
+            UWBDataProcessada.distancia_percorrida,
+            UWBDataProcessada.tempo_em_segundos
+        )
+        .where(UWBDataProcessada.relatorio_number == relatorio_number)
+        .order_by(UWBDataProcessada.tag_number, UWBDataProcessada.criado_em, UWBDataProcessada.id)
+    ).all()
+    leituras = dict(db.session.execute(
+        select(UWBData.tag_number, func.count())
+        .where(UWBData.relatorio_number == relatorio_number)
+        .group_by(UWBData.tag_number)
+    ).all())
+    # Leituras já movidas para o arquivo pela retenção
+    for (contagem,) in db.session.execute(
+        select(ArquivoLeituras.leituras_por_tag).where(ArquivoLeituras.relatorio_number == relatorio_number)
+    ):
+        for tag, quantidade in json.loads(contagem).items():
+            leituras[tag] = leituras.get(tag, 0) + quantidade
+
+    agora = datetime.utcnow()
+    resumos = {}
+    if linhas:
+        tags, criados, distancias, tempos = zip(*linhas)
+        tags = np.array(tags, dtype=object)
+        criados = np.array(criados, dtype='datetime64[us]')
+        distancia = np.array(distancias, dtype=float)  # None -> NaN
+        tempo = np.array(tempos, dtype=float)
+
+        # Início de cada grupo (tag) e a primeira posição de cada tag fora dos deslocamentos
+        inicios = np.flatnonzero(np.r_[True, tags[1:] != tags[:-1]])
+        fins = np.r_[inicios[1:], len(tags)]
+        distancia[inicios] = np.nan
+        tempo[inicios] = np.nan
+
+        validos = np.isfinite(distancia) & np.isfinite(tempo) & (tempo > 0)
+        distancia_total = np.add.reduceat(np.where(np.isfinite(distancia), distancia, 0.0), inicios)
+        distancia_valida = np.add.reduceat(np.where(validos, distancia, 0.0), inicios)
+        tempo_total = np.add.reduceat(np.where(validos, tempo, 0.0), inicios)
+        velocidade = np.full(len(tags), -np.inf)
+        np.divide(distancia, tempo, out=velocidade, where=validos)
+        velocidade_maxima = np.maximum.reduceat(velocidade, inicios)
+        duracao = (criados[fins - 1] - criados[inicios]) / np.timedelta64(1, 's')
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            velocidade_media = np.where(tempo_total > 0, distancia_valida / tempo_total, np.nan)
+
+        for g, (inicio, fim) in enumerate(zip(inicios.tolist(), fins.tolist())):
+            tag = tags[inicio]
+            resumos[tag] = ResumoRelatorio(
+                relatorio_number=relatorio_number,
+                tag_number=tag,
+                amostras=fim - inicio,
+                leituras=leituras.get(tag, 0),
+                distancia_total=_valor(distancia_total[g]),
+                duracao_s=_valor(duracao[g]),
+                velocidade_media=_valor(velocidade_media[g]),
+                velocidade_maxima=_valor(velocidade_maxima[g]),
+                primeira_posicao_em=criados[inicio].astype(datetime),
+                ultima_posicao_em=criados[fim - 1].astype(datetime),
+                calculado_em=agora
+            )
+
+    # Tags com leituras mas sem posições gravadas
+    for tag, quantidade in leituras.items():
+        if tag not in resumos:
+            resumos[tag] = ResumoRelatorio(
+                relatorio_number=relatorio_number, tag_number=tag,
+                amostras=0, leituras=quantidade, calculado_em=agora
+            )
+    return [resumos[tag] for tag in sorted(resumos)]
+
+
+def gravar_resumo(relatorio_number):
+    """Recalcula e substitui o resumo gravado do relatório (commit incluído)"""
+    resumos = calcular_resumo(relatorio_number)
+    ResumoRelatorio.query.filter_by(relatorio_number=relatorio_number).delete()
+    db.session.add_all(resumos)
+    db.session.commit()
+    return resumos
+
+
+def formatar_resumo(resumos, materializado=True):
+    """Resumo por tag e totais do relatório, no formato das respostas da API"""
+    tags = [resumo.to_dict() for resumo in resumos]
+    return {
+        'materializado': materializado,
+        'calculado_em': max((t['calculado_em'] for t in tags), default=None),
+        'total': {
+            'tags': len(tags),
+            'amostras': sum(t['amostras'] for t in tags),
+            'leituras': sum(t['leituras'] for t in tags),
+            'distancia_total': round(sum(t['distancia_total'] or 0.0 for t in tags), 3)
+        },
+        'tags': tags
+    }
+
+
+def obter_resumo(relatorio, recalcular=False):
+    """
+    Resumo de um relatório:
+    - finalizado: o resumo gravado; calculado e gravado se ainda não existir ou se recalcular=True
+    - ativo: calculado na hora (sem gravar) apenas com recalcular=True, senão None
+    """
+    finalizado = relatorio.fim_do_relatorio is not None
+    if not finalizado:
+        return formatar_resumo(calcular_resumo(relatorio.relatorio_number), materializado=False) if recalcular else None
+
+    resumos = [] if recalcular else ResumoRelatorio.query.filter_by(
+        relatorio_number=relatorio.relatorio_number
+    ).order_by(ResumoRelatorio.tag_number).all()
+    if not resumos:
+        resumos = gravar_resumo(relatorio.relatorio_number)
+    return formatar_resumo(resumos)
+
+
+def atualizar_resumos(relatorio_numbers):
+    """
+    Refaz os resumos dos relatórios já finalizados entre estes. Usado quando leituras aceitas antes da
+    finalização são gravadas depois dela (fila de ingestão de outro worker ou que não esvaziou a tempo).
+    """
+    if not relatorio_numbers:
+        return
+    finalizados = db.session.execute(
+        select(Relatorio.relatorio_number)
+        .where(Relatorio.relatorio_number.in_(list(relatorio_numbers)), Relatorio.fim_do_relatorio.isnot(None))
+    ).scalars().all()
+    for relatorio_number in finalizados:
+        try:
+            gravar_resumo(relatorio_number)
+            logging.info(f"Resumo do relatório {relatorio_number} refeito após leituras gravadas depois da finalização")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Erro ao refazer resumo do relatório {relatorio_number}: {e}")
+
+
+def resumir_ao_finalizar(relatorio_number):
+    """
+    Grava o resumo de um relatório recém-finalizado. Uma falha aqui não desfaz a finalização:
+    o resumo é calculado depois, na primeira consulta de /relatorio/<n>.
+    """
+    try:
+        return formatar_resumo(gravar_resumo(relatorio_number))
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Erro ao gerar resumo do relatório {relatorio_number}: {e}")
+        return None
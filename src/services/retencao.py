@@ -0,0 +1,227 @@
+from src.models.user import db
+from src.models.relatorio import Relatorio
+from src.models.uwb_data import UWBData
+from src.models.arquivo_leituras import ArquivoLeituras
+from src.models.resumo_relatorio import ResumoRelatorio
+from src.services.resumo_relatorio import gravar_resumo
+from sqlalchemy import select, delete, func, text, DateTime, Integer, String
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+import logging
+import json
+import time
+import io
+import os
+
+# Idade mínima (dias desde a finalização) para as leituras brutas de um relatório serem arquivadas
+RETENCAO_DIAS = float(os.environ.get('UWB_RETENCAO_DIAS', '90'))
+# Linhas por bloco: cada bloco é uma transação curta (SELECT + INSERT no arquivo + DELETE por faixa de id)
+TAMANHO_LOTE_RETENCAO = 5000
+CHAVE_LOCK_RETENCAO = 7240020  # pg_advisory_lock: uma execução por vez entre os workers
+
+_COLUNAS = [coluna for coluna in UWBData.__table__.columns if coluna.name != 'relatorio_number']
+_TABELAS = (UWBData.__tablename__, ArquivoLeituras.__tablename__)
+
+
+def relatorios_elegiveis(dias):
+    """(relatorio_number, linhas) dos relatórios finalizados há mais de `dias` que ainda têm leituras brutas"""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    return db.session.execute(
+        select(UWBData.relatorio_number, func.count())
+        .join(Relatorio, Relatorio.relatorio_number == UWBData.relatorio_number)
+        .where(Relatorio.fim_do_relatorio.isnot(None), Relatorio.fim_do_relatorio < limite)
+        .group_by(UWBData.relatorio_number)
+        .order_by(UWBData.relatorio_number)
+    ).all()
+
+
+def tamanho_tabelas():
+    """
+    Espaço ocupado por distancias_uwb e pelo arquivo: {tabela: {'bytes', 'linhas'}}
+    PostgreSQL: pg_total_relation_size (tabela + índices + TOAST) e reltuples (estimativa).
+    SQLite: tabela dbstat quando disponível; senão bytes=None.
+    """
+    tamanhos = {tabela: {'bytes': None, 'linhas': None} for tabela in _TABELAS}
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        linhas = db.session.execute(text("""
+            SELECT relname, pg_total_relation_size(oid), reltuples::bigint
+            FROM pg_class WHERE relname = ANY(:tabelas) AND relkind = 'r'
+        """), {'tabelas': list(_TABELAS)})
+        for tabela, tamanho, estimativa in linhas:
+            tamanhos[tabela] = {'bytes': tamanho, 'linhas': max(estimativa, 0)}
+        return tamanhos
+
+    for tabela in _TABELAS:
+        tamanhos[tabela]['linhas'] = db.session.execute(text(f"SELECT COUNT(*) FROM {tabela}")).scalar()
+    if dialeto == 'sqlite':
+        try:
+            for tabela, tamanho in db.session.execute(text(
+                "SELECT tbl_name, SUM(pgsize) FROM dbstat JOIN sqlite_master ON dbstat.name = sqlite_master.name "
+                "WHERE tbl_name IN ('distancias_uwb', 'distancias_uwb_arquivo') GROUP BY tbl_name"
+            )):
+                tamanhos[tabela]['bytes'] = tamanho
+        except Exception:
+            db.session.rollback()
+    return tamanhos
+
+
+def _bytes_por_linha(tamanhos):
+    atual = tamanhos[UWBData.__tablename__]
+    if atual['bytes'] is None or not atual['linhas']:
+        return None
+    return atual['bytes'] / atual['linhas']
+
+
+def compactar(linhas):
+    """Bloco de linhas de distancias_uwb -> (.npz comprimido, contagem por tag)"""
+    valores = list(zip(*linhas))
+    vetores = {}
+    leituras_por_tag = {}
+    for coluna, coluna_valores in zip(_COLUNAS, valores):
+        if isinstance(coluna.type, String):
+            categorias, indices = np.unique(np.array(coluna_valores, dtype=str), return_inverse=True)
+            vetores[coluna.name] = indices.astype('int32')
+            vetores[f'{coluna.name}_categorias'] = categorias
+            if coluna.name == 'tag_number':
+                leituras_por_tag = dict(Counter(coluna_valores))
+        elif isinstance(coluna.type, DateTime):
+            vetores[coluna.name] = np.array(coluna_valores, dtype='datetime64[us]')
+        elif isinstance(coluna.type, Integer):
+            vetores[coluna.name] = np.array(coluna_valores, dtype='int64')
+        else:
+            vetores[coluna.name] = np.array(coluna_valores, dtype='float64')
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **vetores)
+    return buffer.getvalue(), leituras_por_tag
+
+
+def arquivar_relatorio(relatorio_number, tamanho_lote=TAMANHO_LOTE_RETENCAO, pausa=0.0, progresso=None):
+    """
+    Move as leituras brutas de um relatório para distancias_uwb_arquivo, bloco a bloco.
+    Cada bloco é gravado e removido de distancias_uwb na mesma transação: uma interrupção
+    deixa cada leitura ou na tabela ou no arquivo, nunca nos dois nem em nenhum.
+    O resumo do relatório é gravado antes (se ainda não existir), pois conta as leituras brutas.
+    """
+    progresso = progresso if progresso is not None else {}
+    progresso.setdefault('linhas', 0)
+    progresso.setdefault('blocos', 0)
+    progresso.setdefault('bytes_arquivo', 0)
+
+    if not ResumoRelatorio.query.filter_by(relatorio_number=relatorio_number).first():
+        gravar_resumo(relatorio_number)
+
+    parte = db.session.execute(
+        select(func.max(ArquivoLeituras.parte)).where(ArquivoLeituras.relatorio_number == relatorio_number)
+    ).scalar() or 0
+
+    while True:
+        linhas = db.session.execute(
+            select(*_COLUNAS)
+            .where(UWBData.relatorio_number == relatorio_number)
+            .order_by(UWBData.id)
+            .limit(tamanho_lote)
+        ).all()
+        if not linhas:
+            break
+
+        dados, leituras_por_tag = compactar(linhas)
+        criados = [linha.criado_em for linha in linhas if linha.criado_em is not None]
+        parte += 1
+        db.session.add(ArquivoLeituras(
+            relatorio_number=relatorio_number,
+            parte=parte,
+            linhas=len(linhas),
+            primeiro_id=linhas[0].id,
+            ultimo_id=linhas[-1].id,
+            inicio=min(criados, default=None),
+            fim=max(criados, default=None),
+            leituras_por_tag=json.dumps(leituras_por_tag),
+            dados=dados,
+            tamanho_bytes=len(dados)
+        ))
+        removidas = db.session.execute(
+            delete(UWBData).where(
+                UWBData.relatorio_number == relatorio_number,
+                UWBData.id >= linhas[0].id,
+                UWBData.id <= linhas[-1].id
+            )
+        ).rowcount
+        if removidas != len(linhas):
+            db.session.rollback()
+            raise RuntimeError(
+                f'Relatório {relatorio_number}: {removidas} linhas removidas para {len(linhas)} arquivadas; bloco desfeito'
+            )
+        db.session.commit()
+
+        progresso['linhas'] += len(linhas)
+        progresso['blocos'] += 1
+        progresso['bytes_arquivo'] += len(dados)
+        if pausa:
+            time.sleep(pausa)
+    return progresso
+
+
+def planejar_retencao(dias):
+    """Simulação: relatórios e linhas que seriam arquivados e o espaço estimado a liberar"""
+    tamanhos = tamanho_tabelas()
+    bytes_por_linha = _bytes_por_linha(tamanhos)
+    relatorios = [{'relatorio_number': n, 'linhas': linhas} for n, linhas in relatorios_elegiveis(dias)]
+    total = sum(item['linhas'] for item in relatorios)
+    return {
+        'dias': dias,
+        'relatorios': relatorios,
+        'linhas': total,
+        'bytes_estimados': round(total * bytes_por_linha) if bytes_por_linha else None,
+        'tabelas': tamanhos
+    }
+
+
+def executar_retencao(dias, tamanho_lote=TAMANHO_LOTE_RETENCAO, pausa=0.0, vacuum=True, estado=None):
+    """
+    Arquiva as leituras brutas dos relatórios finalizados há mais de `dias`.
+    Posições processadas, resumos e agregados não são alterados.
+    No PostgreSQL o espaço das linhas removidas é reaproveitado após o VACUUM (executado ao final
+    com vacuum=True); o arquivo da tabela não diminui sem VACUUM FULL, que bloqueia a tabela e não é usado.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return _executar_retencao(dias, tamanho_lote, pausa, vacuum, estado)
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+        if not conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {'chave': CHAVE_LOCK_RETENCAO}).scalar():
+            raise RuntimeError('Outra execução da retenção está em andamento em outro worker')
+        try:
+            return _executar_retencao(dias, tamanho_lote, pausa, vacuum, estado)
+        finally:
+            conexao.execute(text("SELECT pg_advisory_unlock(:chave)"), {'chave': CHAVE_LOCK_RETENCAO})
+
+
+def _executar_retencao(dias, tamanho_lote, pausa, vacuum, estado):
+    estado = estado if estado is not None else {}
+    antes = tamanho_tabelas()
+    bytes_por_linha = _bytes_por_linha(antes)
+    estado.update({'tabelas_antes': antes, 'relatorios': {}})
+
+    for relatorio_number, linhas in relatorios_elegiveis(dias):
+        progresso = {'linhas_previstas': linhas}
+        estado['relatorios'][relatorio_number] = progresso
+        arquivar_relatorio(relatorio_number, tamanho_lote, pausa, progresso)
+        logging.info(f"Retenção: relatório {relatorio_number}, {progresso['linhas']} leituras arquivadas")
+
+    if vacuum and db.session.get_bind().dialect.name == 'postgresql':
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+            conexao.execute(text(f"VACUUM (ANALYZE) {UWBData.__tablename__}"))
+
+    depois = tamanho_tabelas()
+    linhas = sum(p['linhas'] for p in estado['relatorios'].values())
+    bytes_arquivo = sum(p['bytes_arquivo'] for p in estado['relatorios'].values())
+    estado.update({
+        'tabelas_depois': depois,
+        'linhas_arquivadas': linhas,
+        'bytes_arquivo': bytes_arquivo,
+        # Espaço liberado em distancias_uwb pelas linhas removidas, menos o que o arquivo passou a ocupar
+        'bytes_liberados_estimados': round(linhas * bytes_por_linha - bytes_arquivo) if bytes_por_linha else None
+    })
+    return estado
+
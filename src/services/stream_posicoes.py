@@ -0,0 +1,164 @@
+from src.services.rastreamento import log_uwb
+from src.models.uwb_data import UWBDataProcessada
+from collections import deque
+from sqlalchemy import text
+import itertools
+import threading
+import select
+import json
+import time
+import os
+
+# Canal do LISTEN/NOTIFY usado para distribuir as posições entre os workers (PostgreSQL)
+CANAL_NOTIFY = 'uwb_posicoes'
+# O payload de um NOTIFY é limitado a 8000 bytes
+TAMANHO_MAXIMO_NOTIFY = 7000
+
+
+class PublicadorPosicoes:
+    """
+    Publicador em memória das posições gravadas pela ingestão, consumido pelo stream SSE.
+    - buffer circular com os últimos `capacidade` eventos, cada um com uma sequência local
+    - leitores esperam numa Condition: cada lote gravado custa uma publicação, não N consultas
+    - com PostgreSQL a publicação vai por NOTIFY dentro da transação da ingestão (entregue só se o
+      commit acontecer) e um único LISTEN por worker alimenta o buffer local; assim um leitor
+      conectado a qualquer worker recebe as posições gravadas por todos
+    - nos outros bancos (SQLite em desenvolvimento, um processo) a publicação é local, após o commit
+    - a retomada após uma reconexão (Last-Event-ID) lê o intervalo perdido do banco (recuperar()),
+      não do buffer, que só cobre o que este worker recebeu
+    """
+
+    def __init__(self, capacidade=2000):
+        self._eventos = deque(maxlen=capacidade)  # (seq, evento)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._pid = None
+        self._ouvinte = None
+
+    # ---- lado da escrita (ingestão) ----
+
+    @staticmethod
+    def _usa_notify(sessao):
+        return sessao.get_bind().dialect.name == 'postgresql'
+
+    def enviar(self, sessao, eventos):
+        """Antes do commit: com PostgreSQL, agenda os NOTIFY na transação da ingestão"""
+        if not eventos or not self._usa_notify(sessao):
+            return
+        for parte in self._dividir(eventos):
+            sessao.execute(text("SELECT pg_notify(:canal, :payload)"), {'canal': CANAL_NOTIFY, 'payload': parte})
+
+    def confirmar(self, sessao, eventos):
+        """Após o commit: sem NOTIFY, publica direto no buffer deste processo"""
+        if eventos and not self._usa_notify(sessao):
+            self.publicar(eventos)
+
+    @staticmethod
+    def _dividir(eventos):
+        partes, atual, tamanho = [], [], 2
+        for evento in eventos:
+            serializado = json.dumps(evento, separators=(',', ':'))
+            if atual and tamanho + len(serializado) + 1 > TAMANHO_MAXIMO_NOTIFY:
+                partes.append('[' + ','.join(atual) + ']')
+                atual, tamanho = [], 2
+            atual.append(serializado)
+            tamanho += len(serializado) + 1
+        if atual:
+            partes.append('[' + ','.join(atual) + ']')
+        return partes
+
+    def publicar(self, eventos):
+        """Adiciona eventos ao buffer e acorda os leitores"""
+        if not eventos:
+            return
+        with self._cond:
+            for evento in eventos:
+                self._seq += 1
+                self._eventos.append((self._seq, evento))
+            self._cond.notify_all()
+
+    # ---- lado da leitura (stream) ----
+
+    def sequencia(self):
+        """Sequência atual: um leitor que começa agora recebe os eventos publicados depois dela"""
+        with self._cond:
+            return self._seq
+
+    @staticmethod
+    def recuperar(ultimo_id, tags=None, relatorio=None, limite=1000):
+        """
+        Posições gravadas após ultimo_id (Last-Event-ID), lidas de UWBDataProcessada numa única consulta
+        limitada: cobre o que o leitor perdeu enquanto desconectado, inclusive o que chegou antes do LISTEN
+        deste worker ou já saiu do buffer. Retorna (eventos em ordem de id, completo); com mais de `limite`
+        posições, completo=False e os eventos são as `limite` mais recentes.
+        """
+        consulta = UWBDataProcessada.query.filter(UWBDataProcessada.id > ultimo_id)
+        if tags:
+            consulta = consulta.filter(UWBDataProcessada.tag_number.in_(tags))
+        if relatorio is not None:
+            consulta = consulta.filter(UWBDataProcessada.relatorio_number == relatorio)
+        registros = consulta.order_by(UWBDataProcessada.id.desc()).limit(limite + 1).all()
+        return [registro.to_dict() for registro in reversed(registros[:limite])], len(registros) <= limite
+
+    def aguardar(self, apos, timeout):
+        """
+        Eventos com sequência maior que `apos`, esperando até `timeout` segundos se ainda não houver.
+        Retorna (nova_sequencia, eventos, perdidos); perdidos=True se parte deles já saiu do buffer
+        (leitor mais lento que a ingestão).
+        """
+        with self._cond:
+            if self._seq <= apos:
+                self._cond.wait(timeout)
+            if self._seq <= apos:
+                return apos, [], False
+            primeira = self._eventos[0][0]
+            inicio = max(0, apos - primeira + 1)
+            eventos = [evento for _, evento in itertools.islice(self._eventos, inicio, None)]
+            return self._seq, eventos, apos + 1 < primeira
+
+    def iniciar_ouvinte(self, engine):
+        """
+        Com PostgreSQL, garante a thread de LISTEN deste worker. Chamado no post_fork do gunicorn, para o
+        buffer receber as posições desde o início do worker, e de novo pelo stream caso a thread tenha parado.
+        """
+        if engine.dialect.name != 'postgresql':
+            return
+        with self._cond:
+            if self._pid == os.getpid() and self._ouvinte is not None and self._ouvinte.is_alive():
+                return
+            self._pid = os.getpid()
+            self._ouvinte = threading.Thread(target=self._ouvir, args=(engine,), name='uwb-stream-listen', daemon=True)
+            self._ouvinte.start()
+
+    def _ouvir(self, engine):
+        while True:
+            conexao = None
+            try:
+                # Conexão dedicada, fora do pool
+                conexao = engine.raw_connection()
+                conexao.detach()
+                bruta = conexao.driver_connection
+                bruta.autocommit = True
+                with bruta.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANAL_NOTIFY}")
+                log_uwb.info("Stream de posições ouvindo o canal %s", CANAL_NOTIFY)
+                while True:
+                    if not select.select([bruta], [], [], 30)[0]:
+                        continue
+                    bruta.poll()
+                    eventos = []
+                    while bruta.notifies:
+                        eventos.extend(json.loads(bruta.notifies.pop(0).payload))
+                    self.publicar(eventos)
+            except Exception as e:
+                log_uwb.warning("Conexão LISTEN do stream de posições perdida: %s", e)
+                if conexao is not None:
+                    try:
+                        conexao.close()
+                    except Exception:
+                        pass
+                time.sleep(2)
+
+
+# Instância global; o buffer define quanto um leitor pode atrasar antes de receber um evento de reset
+publicador_posicoes = PublicadorPosicoes(capacidade=int(os.environ.get('UWB_STREAM_BUFFER', '2000')))
@@ -0,0 +1,187 @@
+from src.models.user import db
+from src.models.uwb_data import UWBDataProcessada
+from collections import namedtuple, OrderedDict
+from sqlalchemy import select, func
+import numpy as np
+import threading
+import os
+
+# Níveis de detalhe pré-definidos (máximo de pontos por tag), do mais afastado ao mais próximo
+NIVEIS_LOD = (100, 300, 1000, 3000)
+MAX_PONTOS_PADRAO = 500
+
+# Trajetória de uma tag pronta para simplificação: pontos na ordem do tempo e a ordem de importância
+# (índices do mais para o menos importante). Qualquer nível de detalhe é um prefixo de `ordem`.
+Trajetoria = namedtuple('Trajetoria', ['x', 'y', 'criado_em', 'importancia', 'ordem'])
+
+
+def importancia_rdp(x, y):
+    """
+    Importância de cada ponto segundo Ramer–Douglas–Peucker, calculada uma única vez para todas
+    as tolerâncias: o RDP com tolerância epsilon mantém exatamente os pontos com importancia > epsilon.
+    A recursão é feita por níveis: a cada iteração todos os segmentos abertos são divididos juntos
+    (operações vetorizadas sobre os pontos ainda não escolhidos), então o custo é O(n) por nível
+    da árvore do RDP, não uma chamada numpy por ponto.
+    Extremidades recebem inf. A importância de um ponto é limitada pela do segmento que o contém,
+    o que a torna monotônica na árvore e faz de cada prefixo da ordem um resultado válido do RDP.
+    """
+    n = len(x)
+    importancia = np.zeros(n)
+    if n == 0:
+        return importancia
+    importancia[[0, -1]] = np.inf
+    mantido = np.zeros(n, dtype=bool)
+    mantido[[0, -1]] = True
+
+    restantes = np.arange(1, n - 1)
+    while len(restantes):
+        escolhidos = np.flatnonzero(mantido)
+        # Segmento (a, b) de cada ponto restante, entre os dois pontos escolhidos vizinhos
+        segmento = np.searchsorted(escolhidos, restantes) - 1
+        a = escolhidos[segmento]
+        b = escolhidos[segmento + 1]
+
+        # Distância do ponto ao segmento a-b (ao ponto a quando a e b coincidem)
+        dx = x[b] - x[a]
+        dy = y[b] - y[a]
+        px = x[restantes] - x[a]
+        py = y[restantes] - y[a]
+        comprimento2 = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(comprimento2 > 0, (px * dx + py * dy) / comprimento2, 0.0), 0.0, 1.0)
+        distancia = np.hypot(px - t * dx, py - t * dy)
+
+        # Ponto mais distante de cada segmento (o primeiro, em caso de empate)
+        inicios = np.flatnonzero(np.r_[True, segmento[1:] != segmento[:-1]])
+        grupo = np.repeat(np.arange(len(inicios)), np.diff(np.r_[inicios, len(segmento)]))
+        maximo = np.maximum.reduceat(distancia, inicios)
+        candidatos = np.flatnonzero(distancia == maximo[grupo])
+        _, primeiro = np.unique(grupo[candidatos], return_index=True)
+        novos = candidatos[primeiro]
+
+        pontos = restantes[novos]
+        limite = np.minimum(importancia[a[novos]], importancia[b[novos]])
+        importancia[pontos] = np.minimum(maximo, limite)
+        mantido[pontos] = True
+        restantes = np.delete(restantes, novos)
+    return importancia
+
+
+def preparar_trajetoria(x, y, criado_em):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    importancia = importancia_rdp(x, y)
+    ordem = np.argsort(-importancia, kind='stable')
+    return Trajetoria(x, y, np.asarray(criado_em, dtype='datetime64[ms]'), importancia, ordem)
+
+
+def simplificar(trajetoria, epsilon=None, max_pontos=None):
+    """
+    Índices (em ordem de tempo) dos pontos mantidos:
+    - epsilon: tolerância do RDP em cm
+    - max_pontos: os max_pontos pontos mais importantes (RDP por prioridade)
+    Com os dois, vale o mais restritivo.
+    """
+    quantidade = len(trajetoria.x)
+    if epsilon is not None:
+        quantidade = min(quantidade, int(np.count_nonzero(trajetoria.importancia > epsilon)))
+    if max_pontos is not None:
+        quantidade = min(quantidade, max(2, max_pontos))
+    return np.sort(trajetoria.ordem[:quantidade])
+
+
+def carregar_trajetorias(relatorio_number, tag=None):
+    """Trajetórias (tag -> Trajetoria) das posições gravadas de um relatório"""
+    consulta = (
+        select(UWBDataProcessada.tag_number, UWBDataProcessada.x, UWBDataProcessada.y, UWBDataProcessada.criado_em)
+        .where(UWBDataProcessada.relatorio_number == relatorio_number)
+        .order_by(UWBDataProcessada.tag_number, UWBDataProcessada.criado_em, UWBDataProcessada.id)
+    )
+    if tag:
+        consulta = consulta.where(UWBDataProcessada.tag_number == tag)
+    linhas = db.session.execute(consulta).all()
+    if not linhas:
+        return {}
+
+    tags, xs, ys, criados = zip(*linhas)
+    tags = np.array(tags, dtype=object)
+    inicios = np.flatnonzero(np.r_[True, tags[1:] != tags[:-1]])
+    fins = np.r_[inicios[1:], len(tags)]
+    return {
+        tags[inicio]: preparar_trajetoria(xs[inicio:fim], ys[inicio:fim], criados[inicio:fim])
+        for inicio, fim in zip(inicios.tolist(), fins.tolist())
+    }
+
+
+def _assinatura(relatorio_number):
+    """(quantidade, maior id) das posições do relatório: muda se houver backfill após a finalização"""
+    return tuple(db.session.execute(
+        select(func.count(), func.max(UWBDataProcessada.id))
+        .where(UWBDataProcessada.relatorio_number == relatorio_number)
+    ).one())
+
+
+class CacheTrajetorias:
+    """
+    Cache em memória (por worker) das trajetórias preparadas de relatórios finalizados
+    - guarda a ordem de importância de todos os pontos, então todos os níveis de detalhe
+      (NIVEIS_LOD, max_pontos ou epsilon) saem do mesmo cálculo
+    - LRU limitado a `capacidade` relatórios
+    - a entrada é validada pela assinatura das posições (quantidade, maior id)
+    """
+
+    def __init__(self, capacidade=8):
+        self.capacidade = capacidade
+        self._entradas = OrderedDict()  # relatorio_number -> (assinatura, {tag: Trajetoria})
+        self._lock = threading.Lock()
+
+    def obter(self, relatorio_number):
+        assinatura = _assinatura(relatorio_number)
+        with self._lock:
+            entrada = self._entradas.get(relatorio_number)
+            if entrada is not None and entrada[0] == assinatura:
+                self._entradas.move_to_end(relatorio_number)
+                return entrada[1]
+
+        trajetorias = carregar_trajetorias(relatorio_number)
+        with self._lock:
+            self._entradas[relatorio_number] = (assinatura, trajetorias)
+            self._entradas.move_to_end(relatorio_number)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+        return trajetorias
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+# Instância global compartilhada pelas rotas
+cache_trajetorias = CacheTrajetorias(capacidade=int(os.environ.get('UWB_CACHE_TRAJETORIAS', '8')))
+
+
+def obter_trajetorias(relatorio, tag=None, epsilon=None, max_pontos=None):
+    """
+    Trajetórias simplificadas por tag, em colunas (x, y, criado_em) prontas para plotar.
+    Relatórios finalizados usam o cache; relatórios ativos são calculados a cada chamada.
+    """
+    if relatorio.fim_do_relatorio is not None:
+        trajetorias = cache_trajetorias.obter(relatorio.relatorio_number)
+        if tag:
+            trajetorias = {tag: trajetorias[tag]} if tag in trajetorias else {}
+    else:
+        trajetorias = carregar_trajetorias(relatorio.relatorio_number, tag)
+
+    resultado = []
+    for tag_number in sorted(trajetorias):
+        trajetoria = trajetorias[tag_number]
+        indices = simplificar(trajetoria, epsilon=epsilon, max_pontos=max_pontos)
+        resultado.append({
+            'tag_number': tag_number,
+            'total_pontos': len(trajetoria.x),
+            'pontos': len(indices),
+            'x': trajetoria.x[indices].tolist(),
+            'y': trajetoria.y[indices].tolist(),
+            'criado_em': np.datetime_as_string(trajetoria.criado_em[indices], unit='ms').tolist()
+        })
+    return resultado
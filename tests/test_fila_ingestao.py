@@ -0,0 +1,97 @@
+import os
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='uwb-testes-'), 'testes.db')
+
+import pytest  # noqa: E402
+from datetime import datetime  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.user import db  # noqa: E402
+from src.models.relatorio import Relatorio  # noqa: E402
+from src.models.uwb_data import UWBData  # noqa: E402
+from src.services.cache_relatorio import cache_relatorio  # noqa: E402
+from src.services.fila_ingestao import fila_ingestao, FilaIngestao  # noqa: E402
+from src.services.resumo_relatorio import gravar_resumo  # noqa: E402
+from src.models.resumo_relatorio import ResumoRelatorio  # noqa: E402
+
+
+@pytest.fixture
+def cliente():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    cache_relatorio.invalidar()
+    # Intervalo longo: sem esvaziar() as leituras ficariam no lote em formação durante o teste
+    intervalo = fila_ingestao.intervalo
+    fila_ingestao.intervalo = 5.0
+    yield app.test_client()
+    fila_ingestao.intervalo = intervalo
+    fila_ingestao.esvaziar()
+
+
+def _enfileirar(cliente, quantidade):
+    for i in range(quantidade):
+        resposta = cliente.post('/api/uwb/data?assincrono=1', json={'id': '5', 'range': [60 + 10 * i, 150, 120, 200, 0, 0, 0, 0]})
+        assert resposta.status_code == 202
+
+
+def test_finalizar_grava_leituras_enfileiradas(cliente):
+    assert cliente.post('/api/relatorio/iniciar', json={'kx': 300, 'ky': 300}).status_code == 201
+    processadas = fila_ingestao.processadas
+    _enfileirar(cliente, 40)
+
+    resposta = cliente.post('/api/relatorio/finalizar')
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['resumo']['total']['leituras'] == 40
+    with app.app_context():
+        relatorio_number = Relatorio.query.one().relatorio_number
+        assert UWBData.query.filter_by(relatorio_number=relatorio_number).count() == 40
+    assert fila_ingestao.processadas - processadas == 40
+
+
+def test_leituras_enfileiradas_ficam_no_relatorio_em_que_foram_aceitas(cliente):
+    assert cliente.post('/api/relatorio/iniciar', json={'kx': 300, 'ky': 300}).status_code == 201
+    _enfileirar(cliente, 10)
+
+    # Troca de relatório sem passar pelas rotas (como num outro worker), antes da gravação da fila
+    with app.app_context():
+        primeiro = Relatorio.query.one()
+        primeiro.fim_do_relatorio = datetime.utcnow()
+        db.session.add(Relatorio(inicio_do_relatorio=datetime.utcnow(), kx='500', ky='500'))
+        db.session.commit()
+        numero = primeiro.relatorio_number
+    cache_relatorio.invalidar()
+
+    assert fila_ingestao.esvaziar()
+    with app.app_context():
+        assert UWBData.query.count() == 10
+        assert UWBData.query.filter_by(relatorio_number=numero).count() == 10
+
+
+def test_resumo_refeito_com_leituras_gravadas_apos_finalizacao(cliente):
+    assert cliente.post('/api/relatorio/iniciar', json={'kx': 300, 'ky': 300}).status_code == 201
+    _enfileirar(cliente, 10)
+
+    # Finalização sem esvaziar a fila deste processo (como a de outro worker): resumo sem as leituras
+    with app.app_context():
+        relatorio = Relatorio.query.one()
+        relatorio.fim_do_relatorio = datetime.utcnow()
+        db.session.commit()
+        numero = relatorio.relatorio_number
+        gravar_resumo(numero)
+    cache_relatorio.invalidar()
+
+    assert fila_ingestao.esvaziar()
+    with app.app_context():
+        assert sum(r.leituras for r in ResumoRelatorio.query.filter_by(relatorio_number=numero)) == 10
+
+
+def test_leituras_nao_gravadas_contam_como_falhas():
+    fila = FilaIngestao(intervalo=0.05)
+    fila.configurar(app, lambda itens: len(itens) - 1)
+    assert fila.enfileirar(['a', 'b', 'c'])
+
+    assert fila.esvaziar()
+    assert (fila.processadas, fila.falhas) == (2, 1)
+    fila.parar()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='uwb-testes-'), 'testes.db'))
+
+import json  # noqa: E402
+import pytest  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.user import db  # noqa: E402
+from src.models.uwb_data import UWBDataProcessada  # noqa: E402
+from src.routes import uwb  # noqa: E402
+from src.services.cache_relatorio import cache_relatorio  # noqa: E402
+from src.services.stream_posicoes import publicador_posicoes  # noqa: E402
+
+
+@pytest.fixture
+def cliente():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    cache_relatorio.invalidar()
+    yield app.test_client()
+
+
+def _gravar(cliente, quantidade):
+    assert cliente.post('/api/relatorio/iniciar', json={'kx': 300, 'ky': 300}).status_code == 201
+    # Uma tag por leitura: a primeira posição de cada tag é sempre gravada
+    for i in range(quantidade):
+        resposta = cliente.post('/api/uwb/data', json={'id': str(3 + i), 'range': [60, 150, 120, 200, 0, 0, 0, 0]})
+        assert resposta.status_code == 201
+    with app.app_context():
+        return [p.id for p in UWBDataProcessada.query.order_by(UWBDataProcessada.id)]
+
+
+def _eventos(resposta):
+    """(evento, dados) do corpo SSE, sem retry e heartbeats"""
+    eventos = []
+    for bloco in b''.join(resposta.response).decode().split('\n\n'):
+        campos = dict(linha.split(': ', 1) for linha in bloco.split('\n') if linha and not linha.startswith(':'))
+        if 'event' in campos:
+            eventos.append((campos['event'], json.loads(campos['data'])))
+    resposta.close()
+    return eventos
+
+
+def test_retomada_recupera_posicoes_fora_do_buffer(cliente):
+    ids = _gravar(cliente, 3)
+    assert len(ids) == 3
+    # Worker que não recebeu essas posições (LISTEN iniciado depois ou buffer transbordado)
+    publicador_posicoes._eventos.clear()
+
+    resposta = cliente.get('/api/uwb/stream?duracao=0.1', headers={'Last-Event-ID': str(ids[0])})
+
+    assert [dados['id'] for evento, dados in _eventos(resposta)] == ids[1:]
+
+
+def test_retomada_com_lacuna_maior_que_o_limite_envia_reset(cliente, monkeypatch):
+    ids = _gravar(cliente, 3)
+    monkeypatch.setattr(uwb, 'STREAM_RECUPERAR', 1)
+
+    resposta = cliente.get(f'/api/uwb/stream?duracao=0.1&ultimo_id={ids[0]}')
+
+    eventos = _eventos(resposta)
+    assert eventos[0][0] == 'reset' and eventos[0][1]['motivo'] == 'lacuna'
+    assert [dados['id'] for evento, dados in eventos[1:]] == ids[-1:]
+
+
+def test_eventos_fora_da_ordem_dos_ids_nao_sao_perdidos_nem_repetidos(cliente):
+    resposta = cliente.get('/api/uwb/stream?duracao=0.1&ultimo_id=10')
+    # Dois workers gravando fora de ordem: 9 e 10 já tinham sido enviados ao leitor, 11 não
+    publicador_posicoes.publicar([{'id': i, 'tag_number': '5', 'relatorio_number': None} for i in (12, 9, 11, 10)])
+
+    assert [dados['id'] for evento, dados in _eventos(resposta)] == [12, 11]
+
+
+def test_conexoes_do_stream_limitadas_por_worker(cliente):
+    abertas = [cliente.get('/api/uwb/stream') for _ in range(uwb.STREAM_MAX_LEITORES)]
+    assert all(resposta.status_code == 200 for resposta in abertas)
+
+    recusada = cliente.get('/api/uwb/stream')
+    assert recusada.status_code == 503
+    assert recusada.headers['Retry-After']
+
+    abertas.pop().close()
+    resposta = cliente.get('/api/uwb/stream')
+    assert resposta.status_code == 200
+    for resposta in abertas + [resposta]:
+        resposta.close()